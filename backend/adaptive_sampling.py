@@ -0,0 +1,149 @@
+# Copyright (c) 2025 ot6_j. All Rights Reserved.
+
+"""
+Adaptive Sampling - Chooses which decoded frames are worth a YOLO pass.
+Frames are probed at the target rate, so adaptive sampling never decodes
+more than fixed-rate sampling outside bursts. Every probe frame is reduced
+to a 64x36 thumbnail and scored against the last analyzed frame: mean
+grayscale difference, plus the change in blood-red share (same HSV ranges
+as detect_hemorrhage).
+
+- nearly identical frames are skipped (a static camera during a pause),
+  down to one analysis every ADAPTIVE_MAX_GAP_S seconds;
+- a frame that changed enough since the last analysis is analyzed;
+- a motion spike or sudden colour change (e.g. bleeding) between two probe
+  frames starts a burst: the sampler densifies to ADAPTIVE_MAX_FPS for
+  ADAPTIVE_BURST_S seconds and every frame probed then is analyzed, as is
+  the probe frame just before the spike.
+
+Seconds left without an analysis are filled in by interpolating the
+timeline (see video_processor.fill_timeline_gaps).
+
+Configuration (environment):
+    VIDEO_ADAPTIVE=0                   # 1 = adaptive sampling by default
+    ADAPTIVE_MAX_FPS=30                # sample rate inside bursts (capped at the video's rate)
+    ADAPTIVE_MAX_GAP_S=2.0
+    ADAPTIVE_CHANGE_THRESHOLD=6.0      # mean abs gray difference (0-255) vs last analyzed frame
+    ADAPTIVE_SPIKE_THRESHOLD=12.0      # difference between consecutive probe frames
+    ADAPTIVE_COLOR_THRESHOLD=2.0       # change of blood-red share, in percent points
+    ADAPTIVE_BURST_S=1.0
+"""
+
+import logging
+import os
+from typing import Any, Dict, Iterable, Iterator, Optional, Tuple
+
+import cv2
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+VIDEO_ADAPTIVE = os.environ.get("VIDEO_ADAPTIVE", "0") == "1"
+ADAPTIVE_MAX_FPS = float(os.environ.get("ADAPTIVE_MAX_FPS", "30"))
+ADAPTIVE_MAX_GAP_S = float(os.environ.get("ADAPTIVE_MAX_GAP_S", "2.0"))
+ADAPTIVE_CHANGE_THRESHOLD = float(os.environ.get("ADAPTIVE_CHANGE_THRESHOLD", "6.0"))
+ADAPTIVE_SPIKE_THRESHOLD = float(os.environ.get("ADAPTIVE_SPIKE_THRESHOLD", "12.0"))
+ADAPTIVE_COLOR_THRESHOLD = float(os.environ.get("ADAPTIVE_COLOR_THRESHOLD", "2.0"))
+ADAPTIVE_BURST_S = float(os.environ.get("ADAPTIVE_BURST_S", "1.0"))
+
+THUMB_SIZE = (64, 36)
+
+
+class Thumbnail:
+    """Downscaled grayscale frame and its blood-red share (percent)."""
+
+    def __init__(self, frame: np.ndarray):
+        small = cv2.resize(frame, THUMB_SIZE, interpolation=cv2.INTER_AREA)
+        self.gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY).astype(np.float32)
+        hsv = cv2.cvtColor(small, cv2.COLOR_BGR2HSV)
+        red = cv2.inRange(hsv, np.array([0, 120, 70]), np.array([10, 255, 255])) | \
+            cv2.inRange(hsv, np.array([170, 120, 70]), np.array([180, 255, 255]))
+        self.red_pct = cv2.countNonZero(red) / red.size * 100
+
+    def difference(self, other: "Thumbnail") -> Tuple[float, float]:
+        """(mean abs gray difference, abs change of red share)."""
+        return float(np.mean(np.abs(self.gray - other.gray))), abs(self.red_pct - other.red_pct)
+
+
+class AdaptiveSampler:
+    """
+    Filters (frame index, frame) probe samples down to the ones to analyze.
+    `fps` is the source frame rate (to convert indices to seconds) and
+    `target_fps` the fixed rate the savings are reported against. Bursts
+    densify `samples` when it supports it (video_sampling.FrameSampler).
+    """
+
+    def __init__(self, samples: Iterable[Tuple[int, np.ndarray]], fps: float, target_fps: float,
+                 max_gap_s: float = ADAPTIVE_MAX_GAP_S, change_threshold: float = ADAPTIVE_CHANGE_THRESHOLD,
+                 spike_threshold: float = ADAPTIVE_SPIKE_THRESHOLD, color_threshold: float = ADAPTIVE_COLOR_THRESHOLD,
+                 burst_s: float = ADAPTIVE_BURST_S, burst_fps: float = ADAPTIVE_MAX_FPS):
+        self.samples = samples
+        self.fps = fps
+        self.target_fps = target_fps
+        self.max_gap_s = max_gap_s
+        self.change_threshold = change_threshold
+        self.spike_threshold = spike_threshold
+        self.color_threshold = color_threshold
+        self.burst_s = burst_s
+        self.burst_fps = burst_fps
+
+        self.first_index: Optional[int] = None
+        self.last_index: Optional[int] = None
+        self.stats = {"probed": 0, "analyzed": 0, "bursts": 0}
+
+    def __iter__(self) -> Iterator[Tuple[int, np.ndarray]]:
+        last_analyzed: Optional[Thumbnail] = None
+        last_analyzed_t = float("-inf")
+        previous: Optional[Tuple[int, np.ndarray, Thumbnail]] = None
+        previous_analyzed = False
+        burst_until = float("-inf")
+
+        for index, frame in self.samples:
+            self.stats["probed"] += 1
+            if self.first_index is None:
+                self.first_index = index
+            self.last_index = index
+            t = index / self.fps
+            thumb = Thumbnail(frame)
+
+            analyze = last_analyzed is None or t < burst_until or t - last_analyzed_t >= self.max_gap_s
+
+            if not analyze and previous is not None:
+                motion, color = thumb.difference(previous[2])
+                if motion >= self.spike_threshold or color >= self.color_threshold:
+                    # Densify around the spike, starting with the frame just before it
+                    burst_until = t + self.burst_s
+                    if hasattr(self.samples, "densify"):
+                        self.samples.densify(int(round(burst_until * self.fps)), self.burst_fps)
+                    self.stats["bursts"] += 1
+                    analyze = True
+                    if not previous_analyzed:
+                        self.stats["analyzed"] += 1
+                        yield previous[0], previous[1]
+
+            if not analyze:
+                motion, color = thumb.difference(last_analyzed)
+                analyze = motion >= self.change_threshold or color >= self.color_threshold
+
+            if analyze:
+                self.stats["analyzed"] += 1
+                last_analyzed, last_analyzed_t = thumb, t
+                yield index, frame
+
+            previous = (index, frame, thumb)
+            previous_analyzed = analyze
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Analyses and decodes done vs what fixed-rate sampling at target_fps would have run."""
+        fixed = 0
+        if self.first_index is not None:
+            fixed = int((self.last_index - self.first_index) / self.fps * self.target_fps) + 1
+        return {
+            **self.stats,
+            # Every probe is one decoded frame; fixed-rate sampling decodes one per inference
+            "decoded": self.stats["probed"],
+            "fixed_rate_decodes": fixed,
+            "fixed_rate_inferences": fixed,
+            "inferences_saved": max(0, fixed - self.stats["analyzed"]),
+            "saved_pct": round(100.0 * max(0, fixed - self.stats["analyzed"]) / fixed, 1) if fixed else 0.0
+        }
@@ -0,0 +1,294 @@
+# Copyright (c) 2025 ot6_j. All Rights Reserved.
+
+"""
+Artifact Store - Content-addressed storage for generated images and videos.
+Scan responses reference artifacts by URL (GET /api/artifacts/{id}) instead of
+embedding base64 data URIs. Artifacts live in memory, spill to disk when the
+memory budget is exceeded, and are garbage-collected after a TTL. Large
+outputs (encoded videos) are adopted as files and served from disk, so
+they are never held in memory.
+
+Configuration (environment):
+    ARTIFACTS_INLINE=0                      # 1 = legacy base64 data URIs in responses
+    ARTIFACT_BASE_URL=                      # e.g. https://api.example.org (prefix of artifact URLs)
+    ARTIFACT_DIR=<tmp>/medivision_artifacts
+    ARTIFACT_TTL_S=3600
+    ARTIFACT_MEMORY_MAX_BYTES=67108864
+    ARTIFACT_DISK_MAX_BYTES=2147483648
+"""
+
+import base64
+import hashlib
+import logging
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, Optional, Set, Tuple
+
+import cv2
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+ARTIFACTS_INLINE = os.environ.get("ARTIFACTS_INLINE", "0") == "1"
+ARTIFACT_BASE_URL = os.environ.get("ARTIFACT_BASE_URL", "").rstrip("/")
+ARTIFACT_DIR = os.environ.get("ARTIFACT_DIR", os.path.join(tempfile.gettempdir(), "medivision_artifacts"))
+ARTIFACT_TTL_S = float(os.environ.get("ARTIFACT_TTL_S", "3600"))
+ARTIFACT_MEMORY_MAX_BYTES = int(os.environ.get("ARTIFACT_MEMORY_MAX_BYTES", str(64 * 1024 * 1024)))
+ARTIFACT_DISK_MAX_BYTES = int(os.environ.get("ARTIFACT_DISK_MAX_BYTES", str(2 * 1024 * 1024 * 1024)))
+
+MEDIA_TYPES = {
+    ".png": "image/png",
+    ".jpg": "image/jpeg",
+    ".mp4": "video/mp4",
+}
+
+ARTIFACT_ID_PATTERN = re.compile(r"^[0-9a-f]{64}\.(png|jpg|mp4)$")
+
+
+class ArtifactStore:
+    """In-memory LRU of artifact bytes with disk spill and TTL-based GC."""
+
+    def __init__(self, directory: str = ARTIFACT_DIR, ttl_s: float = ARTIFACT_TTL_S,
+                 memory_max_bytes: int = ARTIFACT_MEMORY_MAX_BYTES, disk_max_bytes: int = ARTIFACT_DISK_MAX_BYTES):
+        self.directory = directory
+        self.ttl_s = ttl_s
+        self.memory_max_bytes = memory_max_bytes
+        self.disk_max_bytes = disk_max_bytes
+
+        # artifact_id -> (created_at, data)
+        self._memory: "OrderedDict[str, Tuple[float, bytes]]" = OrderedDict()
+        self._memory_bytes = 0
+        self._lock = threading.Lock()
+        self._last_disk_gc = 0.0
+
+        self.stats = {"stored": 0, "deduplicated": 0, "spilled": 0, "served": 0, "expired": 0}
+
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _path(self, artifact_id: str) -> str:
+        return os.path.join(self.directory, artifact_id)
+
+    def put(self, data: bytes, ext: str) -> str:
+        """Stores bytes and returns their content-addressed id."""
+        artifact_id = f"{hashlib.sha256(data).hexdigest()}{ext}"
+        now = time.time()
+
+        spill = []
+        with self._lock:
+            if artifact_id in self._memory:
+                self._memory[artifact_id] = (now, data)
+                self._memory.move_to_end(artifact_id)
+                self.stats["deduplicated"] += 1
+                return artifact_id
+
+            self._memory[artifact_id] = (now, data)
+            self._memory_bytes += len(data)
+            self.stats["stored"] += 1
+
+            while self._memory_bytes > self.memory_max_bytes and len(self._memory) > 1:
+                spilled_id, (created_at, spilled_data) = self._memory.popitem(last=False)
+                self._memory_bytes -= len(spilled_data)
+                spill.append((spilled_id, created_at, spilled_data))
+
+        for spilled_id, created_at, spilled_data in spill:
+            self._spill(spilled_id, created_at, spilled_data)
+
+        self.gc()
+        return artifact_id
+
+    def put_file(self, path: str, ext: str) -> str:
+        """Moves a finished file into the store (disk only) and returns its id."""
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(chunk)
+        artifact_id = f"{digest.hexdigest()}{ext}"
+
+        target = self._path(artifact_id)
+        if os.path.exists(target):
+            os.unlink(path)
+            os.utime(target)
+            self.stats["deduplicated"] += 1
+        else:
+            # Copy across filesystems under a temp name so readers never see a partial file
+            shutil.move(path, target + ".tmp")
+            os.replace(target + ".tmp", target)
+            self.stats["stored"] += 1
+
+        self.gc()
+        return artifact_id
+
+    def file_path(self, artifact_id: str) -> Optional[str]:
+        """Path of a disk-resident artifact, or None if it is in memory, unknown or expired."""
+        path = self._path(artifact_id)
+        try:
+            if os.path.getmtime(path) + self.ttl_s <= time.time():
+                os.unlink(path)
+                self.stats["expired"] += 1
+                return None
+        except OSError:
+            return None
+        self.stats["served"] += 1
+        return path
+
+    def _spill(self, artifact_id: str, created_at: float, data: bytes):
+        """Writes an evicted artifact to disk, keeping its creation time as mtime."""
+        path = self._path(artifact_id)
+        try:
+            if not os.path.exists(path):
+                tmp_path = path + ".tmp"
+                with open(tmp_path, "wb") as f:
+                    f.write(data)
+                os.replace(tmp_path, path)
+            os.utime(path, (created_at, created_at))
+            self.stats["spilled"] += 1
+        except OSError as e:
+            logger.warning(f"Artifact spill failed for {artifact_id}: {e}")
+
+    def get(self, artifact_id: str) -> Optional[bytes]:
+        """Returns the artifact bytes, or None if unknown or expired."""
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(artifact_id)
+            if entry is not None:
+                created_at, data = entry
+                if created_at + self.ttl_s > now:
+                    self._memory.move_to_end(artifact_id)
+                    self.stats["served"] += 1
+                    return data
+                del self._memory[artifact_id]
+                self._memory_bytes -= len(data)
+                self.stats["expired"] += 1
+                return None
+
+        path = self._path(artifact_id)
+        try:
+            if os.path.getmtime(path) + self.ttl_s <= now:
+                os.unlink(path)
+                self.stats["expired"] += 1
+                return None
+            with open(path, "rb") as f:
+                data = f.read()
+            self.stats["served"] += 1
+            return data
+        except OSError:
+            return None
+
+    def gc(self, force: bool = False):
+        """Expires old artifacts in memory and enforces the disk budget."""
+        now = time.time()
+
+        with self._lock:
+            expired = [aid for aid, (created_at, _) in self._memory.items() if created_at + self.ttl_s <= now]
+            for aid in expired:
+                _, data = self._memory.pop(aid)
+                self._memory_bytes -= len(data)
+            self.stats["expired"] += len(expired)
+
+        # Disk scans are comparatively expensive; run at most once a minute
+        if not force and now - self._last_disk_gc < 60:
+            return
+        self._last_disk_gc = now
+
+        files = []
+        total = 0
+        for name in os.listdir(self.directory):
+            if not ARTIFACT_ID_PATTERN.match(name):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            if stat.st_mtime + self.ttl_s <= now:
+                try:
+                    os.unlink(path)
+                    self.stats["expired"] += 1
+                except OSError:
+                    pass
+                continue
+            files.append((stat.st_mtime, stat.st_size, path))
+            total += stat.st_size
+
+        for _, size, path in sorted(files):
+            if total <= self.disk_max_bytes:
+                break
+            try:
+                os.unlink(path)
+                total -= size
+            except OSError:
+                pass
+
+    def get_stats(self) -> Dict[str, object]:
+        """Returns store counters and memory occupancy."""
+        return {
+            **self.stats,
+            "memory_entries": len(self._memory),
+            "memory_bytes": self._memory_bytes,
+            "memory_max_bytes": self.memory_max_bytes,
+            "ttl_s": self.ttl_s,
+            "directory": self.directory
+        }
+
+
+_artifact_store: Optional[ArtifactStore] = None
+
+
+def get_artifact_store() -> ArtifactStore:
+    """Gets the shared artifact store."""
+    global _artifact_store
+    if _artifact_store is None:
+        _artifact_store = ArtifactStore()
+    return _artifact_store
+
+
+def is_valid_artifact_id(artifact_id: str) -> bool:
+    """Guards the artifact endpoint against path traversal and junk ids."""
+    return bool(ARTIFACT_ID_PATTERN.match(artifact_id))
+
+
+def media_type_for(artifact_id: str) -> str:
+    """Returns the media type of an artifact from its extension."""
+    return MEDIA_TYPES.get(os.path.splitext(artifact_id)[1], "application/octet-stream")
+
+
+def artifact_reference(data: bytes, ext: str) -> str:
+    """Returns a URL for stored bytes, or a data URI in legacy inline mode."""
+    if ARTIFACTS_INLINE:
+        return f"data:{MEDIA_TYPES[ext]};base64,{base64.b64encode(data).decode('utf-8')}"
+    artifact_id = get_artifact_store().put(data, ext)
+    return f"{ARTIFACT_BASE_URL}/api/artifacts/{artifact_id}"
+
+
+def file_artifact_reference(path: str, ext: str) -> str:
+    """Like artifact_reference, for output already written to a file (the file is consumed)."""
+    if ARTIFACTS_INLINE:
+        with open(path, "rb") as f:
+            data = f.read()
+        os.unlink(path)
+        return artifact_reference(data, ext)
+    artifact_id = get_artifact_store().put_file(path, ext)
+    return f"{ARTIFACT_BASE_URL}/api/artifacts/{artifact_id}"
+
+
+def encode_image_artifact(img: np.ndarray, ext: str = '.png') -> str:
+    """Encodes an image and returns its artifact URL (or data URI in inline mode)."""
+    _, buffer = cv2.imencode(ext, img)
+    return artifact_reference(buffer.tobytes(), ext)
+
+
+def parse_include(include: Optional[str]) -> Optional[Set[str]]:
+    """Parses an `include=heatmap,mask` query value; None means every artifact."""
+    if include is None or include.strip() in ("", "all"):
+        return None
+    return {name.strip() for name in include.split(",") if name.strip()}
+
+
+def wants(include: Optional[Iterable[str]], name: str) -> bool:
+    """True if the caller asked for the named artifact."""
+    return include is None or name in include
@@ -0,0 +1,134 @@
+# Copyright (c) 2025 ot6_j. All Rights Reserved.
+
+"""
+Batch Scan Helpers - Expands multi-file and archive (zip/tar) uploads into
+individual images and splits them into sub-batches for stacked inference.
+
+Archive members are checked against the limits from their headers before
+they are decompressed, so a small zip/tar bomb is rejected without being
+expanded.
+
+Configuration (environment):
+    BATCH_MAX_ITEMS=256
+    BATCH_MAX_ITEM_BYTES=52428800      # per image (IMAGE_MAX_BYTES)
+    BATCH_MAX_TOTAL_BYTES=536870912    # all images of one request, once expanded
+    BATCH_SUB_BATCH_SIZE=16
+"""
+
+import io
+import json
+import os
+import tarfile
+import zipfile
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from image_decode import IMAGE_MAX_BYTES
+
+BATCH_MAX_ITEMS = int(os.environ.get("BATCH_MAX_ITEMS", "256"))
+BATCH_MAX_ITEM_BYTES = int(os.environ.get("BATCH_MAX_ITEM_BYTES", str(IMAGE_MAX_BYTES)))
+BATCH_MAX_TOTAL_BYTES = int(os.environ.get("BATCH_MAX_TOTAL_BYTES", str(512 * 1024 * 1024)))
+BATCH_SUB_BATCH_SIZE = int(os.environ.get("BATCH_SUB_BATCH_SIZE", "16"))
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".tif", ".tiff", ".webp")
+
+
+class BatchTooLargeError(ValueError):
+    """Raised when an upload expands to too many images, or too many bytes."""
+
+
+class ExpansionLimits:
+    """Running image count and expanded size of one request, checked before each read."""
+
+    def __init__(self, max_items: int = BATCH_MAX_ITEMS, max_item_bytes: int = BATCH_MAX_ITEM_BYTES,
+                 max_total_bytes: int = BATCH_MAX_TOTAL_BYTES):
+        self.max_items = max_items
+        self.max_item_bytes = max_item_bytes
+        self.max_total_bytes = max_total_bytes
+        self.items = 0
+        self.total_bytes = 0
+
+    def admit(self, name: str, size: int):
+        """Accounts for one more image of `size` bytes; raises BatchTooLargeError past a limit."""
+        if size > self.max_item_bytes:
+            raise BatchTooLargeError(f"{name} exceeds {self.max_item_bytes // (1024 * 1024)} MB")
+        self.items += 1
+        self.total_bytes += size
+        if self.items > self.max_items:
+            raise BatchTooLargeError(f"Batch exceeds {self.max_items} images")
+        if self.total_bytes > self.max_total_bytes:
+            raise BatchTooLargeError(f"Batch exceeds {self.max_total_bytes // (1024 * 1024)} MB once expanded")
+
+
+def _is_image_name(name: str) -> bool:
+    base = os.path.basename(name)
+    return not base.startswith(".") and base.lower().endswith(IMAGE_EXTENSIONS)
+
+
+def expand_archive(filename: str, data: bytes, limits: Optional[ExpansionLimits] = None) -> List[Tuple[str, bytes]]:
+    """
+    Returns the images contained in a zip/tar upload (in archive order),
+    or the upload itself when it is not an archive. Each member's declared
+    size is admitted against `limits` before it is decompressed (zip and
+    tar readers never return more than the declared size).
+    """
+    limits = limits or ExpansionLimits()
+    name = (filename or "").lower()
+
+    if name.endswith(".zip") or (not _is_image_name(name) and zipfile.is_zipfile(io.BytesIO(data))):
+        items = []
+        with zipfile.ZipFile(io.BytesIO(data)) as archive:
+            for info in archive.infolist():
+                if not info.is_dir() and _is_image_name(info.filename):
+                    limits.admit(info.filename, info.file_size)
+                    items.append((info.filename, archive.read(info)))
+        return items
+
+    if name.endswith((".tar", ".tar.gz", ".tgz")):
+        items = []
+        with tarfile.open(fileobj=io.BytesIO(data), mode="r:*") as archive:
+            for member in archive:
+                if member.isfile() and _is_image_name(member.name):
+                    limits.admit(member.name, member.size)
+                    items.append((member.name, archive.extractfile(member).read()))
+        return items
+
+    limits.admit(filename, len(data))
+    return [(filename, data)]
+
+
+def expand_uploads(uploads: Sequence[Tuple[str, bytes]], max_items: int = BATCH_MAX_ITEMS) -> List[Tuple[str, bytes]]:
+    """Flattens uploaded files and archives into (filename, bytes) items in input order."""
+    limits = ExpansionLimits(max_items=max_items)
+    items: List[Tuple[str, bytes]] = []
+    for filename, data in uploads:
+        items.extend(expand_archive(filename, data, limits))
+    return items
+
+
+def sub_batches(items: Sequence[Any], size: int = BATCH_SUB_BATCH_SIZE) -> Iterator[List[Tuple[int, Any]]]:
+    """Yields consecutive [(index, item), ...] chunks of at most `size` items."""
+    size = max(1, size)
+    for start in range(0, len(items), size):
+        yield list(enumerate(items[start:start + size], start=start))
+
+
+def item_error(index: int, filename: str, error: Exception) -> Dict[str, Any]:
+    """Per-item failure entry."""
+    return {"index": index, "filename": filename, "status": "FAILED", "error": str(error)}
+
+
+def ndjson_line(obj: Dict[str, Any]) -> bytes:
+    """Serializes one result as a newline-delimited JSON record."""
+    return (json.dumps(obj, default=str) + "\n").encode("utf-8")
+
+
+def summarize(results: Sequence[Dict[str, Any]]) -> Dict[str, Any]:
+    """Builds the non-streaming batch response."""
+    failed = sum(1 for r in results if r.get("status") == "FAILED")
+    return {
+        "status": "SUCCESS",
+        "total": len(results),
+        "succeeded": len(results) - failed,
+        "failed": failed,
+        "results": list(results)
+    }
@@ -0,0 +1,169 @@
+# Copyright (c) 2025 ot6_j. All Rights Reserved.
+
+"""
+Dynamic Micro-Batching - Groups concurrent inference requests into one forward pass.
+Callers submit a single preprocessed sample and await their own row of predictions.
+"""
+
+import asyncio
+import logging
+import os
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+
+from executors import run_in_department
+from metrics import Histogram, register
+
+logger = logging.getLogger(__name__)
+
+NEURO_BATCH_MAX_SIZE = int(os.environ.get("NEURO_BATCH_MAX_SIZE", "8"))
+NEURO_BATCH_MAX_WAIT_MS = float(os.environ.get("NEURO_BATCH_MAX_WAIT_MS", "10"))
+
+BATCH_SIZE = register(Histogram(
+    "medivision_batch_size", "Number of samples per micro-batch forward pass.",
+    ("batcher",), buckets=(1, 2, 4, 8, 16, 32, 64)
+))
+BATCH_QUEUE_DELAY = register(Histogram(
+    "medivision_batch_queue_delay_seconds", "Time a sample waited in the micro-batch queue.",
+    ("batcher",), buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25)
+))
+
+
+class MicroBatcher:
+    """
+    Collects samples submitted concurrently and runs them as one batch.
+
+    A batch is flushed as soon as it holds `max_batch_size` samples or the
+    oldest queued sample has waited `max_wait_ms` milliseconds.
+    """
+
+    def __init__(self, predict_fn: Callable[[np.ndarray], np.ndarray],
+                 max_batch_size: int = 8, max_wait_ms: float = 10.0,
+                 name: str = "batcher", department: str = "neuro"):
+        self.predict_fn = predict_fn
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait_ms = max(0.0, max_wait_ms)
+        self.name = name
+        self.department = department
+
+        self._queue: Optional[asyncio.Queue] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._worker: Optional[asyncio.Task] = None
+
+        self._batch_sizes: Dict[int, int] = {}
+        self._queue_delays_ms: List[float] = []
+        self._total_requests = 0
+        self._total_batches = 0
+
+    def _ensure_worker(self):
+        """Starts the collector task on the running event loop."""
+        loop = asyncio.get_running_loop()
+        # A restarted collector keeps the queue, so samples already waiting in it are still served
+        if self._queue is None or self._loop is not loop:
+            self._queue = asyncio.Queue()
+            self._loop = loop
+        if self._worker is None or self._worker.done():
+            self._worker = loop.create_task(self._run())
+
+    async def submit(self, sample: np.ndarray) -> np.ndarray:
+        """
+        Queues one sample (with or without its leading batch axis)
+        and returns its row of predictions.
+        """
+        self._ensure_worker()
+        if sample.ndim > 0 and sample.shape[0] == 1:
+            sample = sample[0]
+
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((sample, future, time.perf_counter()))
+        return await future
+
+    async def _run(self):
+        """Collector loop: gather, predict, scatter."""
+        while True:
+            batch = [await self._queue.get()]
+            deadline = batch[0][2] + self.max_wait_ms / 1000.0
+
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+
+            dispatched_at = time.perf_counter()
+            self._record(len(batch), [(dispatched_at - item[2]) * 1000 for item in batch])
+
+            try:
+                # Inside the try: samples of mismatched shapes fail their batch, not the collector
+                x = np.stack([item[0] for item in batch])
+                predictions = await run_in_department(self.department, self.predict_fn, x)
+            except Exception as e:
+                logger.error(f"{self.name}: batch of {len(batch)} failed: {e}")
+                for _, future, _ in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            for i, (_, future, _) in enumerate(batch):
+                if not future.done():
+                    future.set_result(predictions[i])
+
+    def _record(self, batch_size: int, delays_ms: List[float]):
+        """Records batch size and per-request queueing delay."""
+        self._batch_sizes[batch_size] = self._batch_sizes.get(batch_size, 0) + 1
+        self._queue_delays_ms.extend(delays_ms)
+        # Keep a bounded window of recent delays for percentiles
+        if len(self._queue_delays_ms) > 10000:
+            self._queue_delays_ms = self._queue_delays_ms[-10000:]
+        self._total_requests += batch_size
+        self._total_batches += 1
+
+        BATCH_SIZE.observe(batch_size, self.name)
+        for delay_ms in delays_ms:
+            BATCH_QUEUE_DELAY.observe(delay_ms / 1000.0, self.name)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Returns batch-size distribution and queueing delay statistics."""
+        delays = np.array(self._queue_delays_ms) if self._queue_delays_ms else np.zeros(1)
+        return {
+            "name": self.name,
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait_ms,
+            "total_requests": self._total_requests,
+            "total_batches": self._total_batches,
+            "mean_batch_size": round(self._total_requests / self._total_batches, 2) if self._total_batches else 0.0,
+            "batch_size_distribution": {str(k): v for k, v in sorted(self._batch_sizes.items())},
+            "queue_delay_ms": {
+                "p50": round(float(np.percentile(delays, 50)), 3),
+                "p95": round(float(np.percentile(delays, 95)), 3),
+                "p99": round(float(np.percentile(delays, 99)), 3),
+                "max": round(float(delays.max()), 3)
+            }
+        }
+
+
+_neuro_batcher: Optional[MicroBatcher] = None
+
+
+def get_neuro_batcher() -> MicroBatcher:
+    """Gets the shared micro-batcher in front of the neuro ResNet50."""
+    global _neuro_batcher
+    if _neuro_batcher is None:
+        from model_loader import get_neuro_model
+
+        def predict(x):
+            return get_neuro_model().predict(x, verbose=0)
+
+        _neuro_batcher = MicroBatcher(
+            predict,
+            max_batch_size=NEURO_BATCH_MAX_SIZE,
+            max_wait_ms=NEURO_BATCH_MAX_WAIT_MS,
+            name="neuro",
+            department="neuro"
+        )
+    return _neuro_batcher
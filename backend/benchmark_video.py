@@ -0,0 +1,347 @@
+# Copyright (c) 2025 ot6_j. All Rights Reserved.
+
+"""
+Surgery video throughput benchmark: frames/s of per-frame vs batched
+YOLO + hemorrhage/visibility analysis.
+
+Usage:
+    python benchmark_video.py [--video op.mp4] [--frames 64] [--batch-sizes 1,2,4,8,16]
+    python benchmark_video.py --memory [--seconds 30]
+    python benchmark_video.py --sampling --video op.mp4 [--sample-fps 2]
+    python benchmark_video.py --segments 1,2,4 --video op.mp4
+    python benchmark_video.py --adaptive --video op.mp4
+    python benchmark_video.py --hls --video op.mp4
+    python benchmark_video.py --analytics [--video op.mp4] [--widths 0,960,640,320]
+Without --video, synthetic 1280x720 frames are used. --memory checks that
+full-video processing has flat peak memory: a synthetic video and one 4x as
+long must peak within 1.5x of each other (exit code 1 otherwise).
+--sampling times frame sampling alone: read-every-frame vs each sampler mode.
+--segments times full-video processing with 1, 2, 4... segment processes.
+--adaptive compares fixed-rate and scene-change-adaptive sampling: YOLO
+inferences run/saved, frames decoded, wall time and how many timeline
+seconds agree.
+--hls measures when progressive HLS output becomes playable (first segment
+and its timeline sidecar on disk) compared with the full MP4 output.
+--analytics times the fused frame-analytics kernel against detect_hemorrhage
++ check_visibility per working width and reports how closely they agree;
+exit code 1 unless the full-resolution kernel is faster, has the same
+sharpness and a blood share within ANALYTICS_MAX_BLOOD_DIFF points.
+"""
+
+import argparse
+import os
+import shutil
+import tempfile
+import threading
+import time
+import tracemalloc
+
+import cv2
+import numpy as np
+
+from frame_analytics import analyze_pixels, analyze_pixels_batch, get_blood_lut
+from model_loader import get_surgery_detector
+from surgery_algo import check_visibility, check_visibility_batch, detect_hemorrhage, detect_hemorrhage_batch
+from video_processor import make_tracker, process_full_video, process_tracked_frames, process_video_frame, process_video_frames
+from video_hls import create_stream
+from video_sampling import SAMPLING_MODES, FrameSampler
+from video_upload import remove_file
+
+
+def load_frames(video_path, count):
+    """Reads `count` frames from a video, or makes synthetic ones."""
+    if video_path is None:
+        rng = np.random.default_rng(0)
+        return [rng.integers(0, 256, (720, 1280, 3), dtype=np.uint8) for _ in range(count)]
+
+    cap = cv2.VideoCapture(video_path)
+    frames = []
+    while len(frames) < count:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        frames.append(frame)
+    cap.release()
+    return frames
+
+
+def frames_per_second(fn, frames, repeats=3):
+    """Best-of-N throughput of fn(frames)."""
+    fn(frames[:2])
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn(frames)
+        best = min(best, time.perf_counter() - start)
+    return len(frames) / best
+
+
+def write_synthetic_video(seconds, fps=30, size=(1280, 720)):
+    """Writes a noise video of the given length and returns its path."""
+    fd, path = tempfile.mkstemp(suffix=".mp4")
+    os.close(fd)
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"mp4v"), fps, size)
+    rng = np.random.default_rng(0)
+    base = rng.integers(0, 256, (size[1], size[0], 3), dtype=np.uint8)
+    for i in range(int(seconds * fps)):
+        writer.write(np.roll(base, i * 8, axis=1))
+    writer.release()
+    return path
+
+
+def peak_memory_mb(video_path, model):
+    """Peak traced allocations (numpy frames included) while processing a whole video."""
+    tracemalloc.start()
+    try:
+        result = process_full_video(video_path, model, target_fps=10)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    remove_file(result["video_path"])
+    return peak / 1e6, result["processed_frames"]
+
+
+def check_memory(model, seconds):
+    """Peak memory must not grow with video length."""
+    peaks = []
+    for length in (seconds, seconds * 4):
+        path = write_synthetic_video(length)
+        try:
+            peak, frames = peak_memory_mb(path, model)
+        finally:
+            remove_file(path)
+        print(f"    {length:>5}s video  {frames:>6} frames  peak {peak:8.1f} MB")
+        peaks.append(peak)
+    ratio = peaks[1] / peaks[0]
+    print(f"    peak ratio (4x length): {ratio:.2f}")
+    return ratio <= 1.5
+
+
+def read_every_frame(video_path, sample_fps):
+    """Baseline: decode every frame, keep every Nth (the pre-sampler behaviour)."""
+    cap = cv2.VideoCapture(video_path)
+    frame_skip = max(1, int(cap.get(cv2.CAP_PROP_FPS) / sample_fps))
+    kept = 0
+    index = 0
+    while True:
+        ret, _ = cap.read()
+        if not ret:
+            break
+        kept += index % frame_skip == 0
+        index += 1
+    cap.release()
+    return kept
+
+
+def compare_sampling(video_path, sample_fps):
+    """Wall time to sample a video at sample_fps with each strategy."""
+    start = time.perf_counter()
+    kept = read_every_frame(video_path, sample_fps)
+    baseline = time.perf_counter() - start
+    print(f"    {'read all':<10}{kept:>7} frames {baseline:8.2f}s")
+    for mode in SAMPLING_MODES:
+        start = time.perf_counter()
+        try:
+            with FrameSampler(video_path, sample_fps, mode=mode) as sampler:
+                kept = sum(1 for _ in sampler)
+                stats = sampler.get_stats()
+        except ImportError as e:
+            print(f"    {mode:<10} skipped ({e})")
+            continue
+        elapsed = time.perf_counter() - start
+        print(f"    {mode:<10}{kept:>7} frames {elapsed:8.2f}s  ({baseline / elapsed:.2f}x)  "
+              f"grabbed {stats['grabbed']}, seeks {stats['seeks']}")
+
+
+def compare_segments(video_path, model, worker_counts):
+    """Full-video wall time and speedup per number of segment processes."""
+    baseline = None
+    for workers in worker_counts:
+        start = time.perf_counter()
+        result = process_full_video(video_path, model, target_fps=10, segment_workers=workers)
+        elapsed = time.perf_counter() - start
+        remove_file(result["video_path"])
+        baseline = baseline or elapsed
+        segments = len(result["pipeline"].get("segments", [])) or 1
+        print(f"    {workers:>2} workers  {segments:>2} segments  {result['processed_frames']:>6} frames "
+              f"{elapsed:8.2f}s  ({baseline / elapsed:.2f}x)")
+
+
+def compare_adaptive(video_path, model, target_fps=10):
+    """Inferences saved by adaptive sampling, and its agreement with the fixed-rate timeline."""
+    runs = {}
+    for adaptive in (False, True):
+        start = time.perf_counter()
+        result = process_full_video(video_path, model, target_fps=target_fps, adaptive=adaptive)
+        runs[adaptive] = (result, time.perf_counter() - start)
+        remove_file(result["video_path"])
+
+    (fixed, fixed_s), (adapted, adapted_s) = runs[False], runs[True]
+    stats = adapted["adaptive"]
+    print(f"    fixed {target_fps} fps   {fixed['processed_frames']:>6} inferences  "
+          f"{fixed['sampling']['decoded']:>6} decoded  {fixed_s:8.2f}s")
+    print(f"    adaptive      {adapted['processed_frames']:>6} inferences  "
+          f"{adapted['sampling']['decoded']:>6} decoded  {adapted_s:8.2f}s  "
+          f"({stats['inferences_saved']} saved, {stats['saved_pct']}%, {stats['bursts']} bursts)")
+
+    levels = {entry["time"]: entry["level"] for entry in fixed["timeline"]}
+    agree = sum(1 for entry in adapted["timeline"] if levels.get(entry["time"]) == entry["level"])
+    print(f"    timeline agreement: {agree}/{len(levels)} seconds with the same alert level")
+
+
+def time_to_playback(video_path, model, target_fps=10):
+    """Seconds until the first HLS segment and its sidecar exist, vs the whole MP4 run."""
+    start = time.perf_counter()
+    result = process_full_video(video_path, model, target_fps=target_fps)
+    mp4_s = time.perf_counter() - start
+    remove_file(result["video_path"])
+
+    _, directory = create_stream()
+    first = {}
+
+    def watch():
+        segment = os.path.join(directory, "segment_00000.m4s")
+        sidecar = os.path.join(directory, "segment_00000.json")
+        playlist = os.path.join(directory, "playlist.m3u8")
+        while not done.is_set():
+            if os.path.exists(playlist) and os.path.exists(segment) and os.path.exists(sidecar):
+                first["playable_s"] = time.perf_counter() - start
+                return
+            time.sleep(0.05)
+
+    done = threading.Event()
+    watcher = threading.Thread(target=watch, daemon=True)
+    start = time.perf_counter()
+    watcher.start()
+    try:
+        result = process_full_video(video_path, model, target_fps=target_fps, hls_dir=directory)
+        hls_s = time.perf_counter() - start
+    finally:
+        done.set()
+        watcher.join()
+        shutil.rmtree(directory, ignore_errors=True)
+
+    print(f"    mp4 output    ready after {mp4_s:8.2f}s")
+    print(f"    hls output    first segment after {first.get('playable_s', hls_s):8.2f}s, "
+          f"complete after {hls_s:8.2f}s ({result['hls']['segments']} segments of {result['hls']['segment_s']}s)")
+
+
+# Blood share deviation allowed from the quantized (BGR565) color table, in percentage points
+ANALYTICS_MAX_BLOOD_DIFF = 0.5
+
+
+def compare_analytics(frames, widths):
+    """Fused kernel vs reference checks: speed, blood/sharpness deviation, decision agreement."""
+    reference = [(detect_hemorrhage(f), check_visibility(f)) for f in frames]
+    baseline = frames_per_second(lambda fs: [(detect_hemorrhage(f), check_visibility(f)) for f in fs], frames)
+    print(f"    reference       {baseline:8.1f} frames/s")
+
+    get_blood_lut()
+    equivalent = 0 in widths
+    for width in widths:
+        fused = [analyze_pixels(f, width) for f in frames]
+        fps = frames_per_second(lambda fs: [analyze_pixels(f, width) for f in fs], frames)
+
+        blood_diff = max(abs(h[1] - fh[1]) for (h, _), (fh, _) in zip(reference, fused))
+        sharp_diff = max(abs(v[1] - fv[1]) / max(v[1], 1e-6) for (_, v), (_, fv) in zip(reference, fused))
+        agree = sum(1 for (h, v), (fh, fv) in zip(reference, fused)
+                    if bool(h[0]) == bool(fh[0]) and bool(v[0]) == bool(fv[0]))
+        label = f"width {width}" if width else "full res"
+        print(f"    fused {label:<9} {fps:8.1f} frames/s  ({fps / baseline:.2f}x)  "
+              f"blood +-{blood_diff:.2f} pts  sharpness +-{sharp_diff * 100:.1f}%  "
+              f"decisions {agree}/{len(frames)}")
+
+        if width == 0:
+            equivalent = fps > baseline and blood_diff <= ANALYTICS_MAX_BLOOD_DIFF and sharp_diff < 1e-6
+    return equivalent
+
+
+def batched(fn, batch_size):
+    def run(frames):
+        for start in range(0, len(frames), batch_size):
+            fn(frames[start:start + batch_size])
+    return run
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Batched surgery video analysis benchmark")
+    parser.add_argument("--video")
+    parser.add_argument("--frames", type=int, default=64)
+    parser.add_argument("--batch-sizes", default="1,2,4,8,16")
+    parser.add_argument("--memory", action="store_true", help="check constant-memory full-video processing")
+    parser.add_argument("--seconds", type=int, default=30)
+    parser.add_argument("--sampling", action="store_true", help="compare frame sampling strategies")
+    parser.add_argument("--sample-fps", type=float, default=2)
+    parser.add_argument("--segments", help="segment process counts to compare, e.g. 1,2,4")
+    parser.add_argument("--adaptive", action="store_true", help="report inferences saved by adaptive sampling")
+    parser.add_argument("--hls", action="store_true", help="time to first playable segment of HLS output")
+    parser.add_argument("--analytics", action="store_true", help="fused frame-analytics kernel vs reference checks")
+    parser.add_argument("--widths", default="0,960,640,320", help="working widths for --analytics (0 = full res)")
+    args = parser.parse_args()
+
+    if args.analytics:
+        frames = load_frames(args.video, args.frames)
+        print(f"Frame analytics on {len(frames)} frames of {frames[0].shape[1]}x{frames[0].shape[0]}")
+        ok = compare_analytics(frames, [int(w) for w in args.widths.split(",") if w.strip()])
+        raise SystemExit(0 if ok else 1)
+
+    if args.sampling:
+        if args.video is None:
+            raise SystemExit("--sampling needs --video")
+        print(f"Sampling {args.video} at {args.sample_fps} fps")
+        compare_sampling(args.video, args.sample_fps)
+        raise SystemExit(0)
+
+    model = get_surgery_detector()
+    if model is None:
+        raise SystemExit("YOLO detector unavailable")
+
+    if args.memory:
+        print("Full-video peak memory")
+        raise SystemExit(0 if check_memory(model, args.seconds) else 1)
+
+    if args.adaptive:
+        if args.video is None:
+            raise SystemExit("--adaptive needs --video")
+        print(f"Adaptive sampling on {args.video}")
+        compare_adaptive(args.video, model)
+        raise SystemExit(0)
+
+    if args.hls:
+        if args.video is None:
+            raise SystemExit("--hls needs --video")
+        print(f"Progressive HLS output of {args.video}")
+        time_to_playback(args.video, model)
+        raise SystemExit(0)
+
+    if args.segments:
+        if args.video is None:
+            raise SystemExit("--segments needs --video")
+        print(f"Segment-parallel processing of {args.video}")
+        compare_segments(args.video, model, [int(n) for n in args.segments.split(",") if n.strip()])
+        raise SystemExit(0)
+
+    frames = load_frames(args.video, args.frames)
+    print(f"{len(frames)} frames of {frames[0].shape[1]}x{frames[0].shape[0]}")
+
+    print("\nColor/sharpness checks")
+    single = frames_per_second(lambda fs: [(detect_hemorrhage(f), check_visibility(f)) for f in fs], frames)
+    batch = frames_per_second(lambda fs: (detect_hemorrhage_batch(fs), check_visibility_batch(fs)), frames)
+    print(f"    per-frame {single:8.1f} frames/s")
+    print(f"    batched   {batch:8.1f} frames/s  ({batch / single:.2f}x)")
+    fused = frames_per_second(analyze_pixels_batch, frames)
+    print(f"    fused     {fused:8.1f} frames/s  ({fused / single:.2f}x)")
+
+    print("\nFull frame analysis (YOLO + checks + annotation)")
+    baseline = frames_per_second(lambda fs: [process_video_frame(f, model) for f in fs], frames)
+    print(f"    per-frame      {baseline:7.1f} frames/s")
+    for size in [int(s) for s in args.batch_sizes.split(",") if s.strip()]:
+        fps = frames_per_second(batched(lambda fs: process_video_frames(fs, model), size), frames)
+        print(f"    batch size {size:<3} {fps:7.1f} frames/s  ({fps / baseline:.2f}x)")
+
+    print("\nKeyframe YOLO + optical-flow tracking")
+    tracker = make_tracker(model)
+    fps = frames_per_second(lambda fs: process_tracked_frames(fs, tracker), frames)
+    stats = tracker.get_stats()
+    print(f"    tracking       {fps:7.1f} frames/s  ({fps / baseline:.2f}x)  "
+          f"YOLO on {stats['detection_ratio'] * 100:.0f}% of frames")
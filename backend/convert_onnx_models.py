@@ -0,0 +1,87 @@
+# Copyright (c) 2025 ot6_j. All Rights Reserved.
+
+"""
+Exports the Keras neuro/derma models to ONNX (dynamic batch dimension) and
+checks that ONNX Runtime matches TensorFlow on random inputs.
+
+Usage:
+    python convert_onnx_models.py [neuro] [derma]
+Then serve with NEURO_BACKEND=onnx / DERMA_BACKEND=onnx.
+"""
+
+import sys
+import time
+
+import numpy as np
+
+from model_loader import (
+    MODEL_PATHS,
+    ONNX_MODEL_PATHS,
+    OnnxModel,
+    resnet50_preprocess,
+    mobilenet_v2_preprocess
+)
+
+PREPROCESS = {
+    "neuro": resnet50_preprocess,
+    "derma": mobilenet_v2_preprocess,
+}
+
+ATOL = 1e-4
+OPSET = 17
+
+
+def export_model(name: str) -> str:
+    """Converts one Keras .h5 model to ONNX next to it."""
+    import tensorflow as tf
+    import tf2onnx
+
+    keras_model = tf.keras.models.load_model(MODEL_PATHS[name], compile=False)
+    spec = (tf.TensorSpec((None, 224, 224, 3), tf.float32, name="input"),)
+
+    tf2onnx.convert.from_keras(keras_model, input_signature=spec, opset=OPSET,
+                               output_path=ONNX_MODEL_PATHS[name])
+    print(f"{name}: exported {ONNX_MODEL_PATHS[name]}")
+    return ONNX_MODEL_PATHS[name]
+
+
+def check_agreement(name: str, samples: int = 8, repeats: int = 20):
+    """Compares Keras and ONNX Runtime outputs and single-image latency."""
+    import tensorflow as tf
+
+    keras_model = tf.keras.models.load_model(MODEL_PATHS[name], compile=False)
+    onnx_model = OnnxModel(ONNX_MODEL_PATHS[name])
+
+    rng = np.random.default_rng(0)
+    x = PREPROCESS[name](rng.integers(0, 256, (samples, 224, 224, 3)).astype(np.float32))
+
+    expected = keras_model.predict(x, verbose=0)
+    actual = onnx_model.predict(x)
+    max_diff = float(np.max(np.abs(expected - actual)))
+    same_class = float(np.mean(expected.argmax(axis=1) == actual.argmax(axis=1)))
+
+    timings = {}
+    for label, fn in (("keras", lambda: keras_model.predict(x[:1], verbose=0)),
+                      ("onnx", lambda: onnx_model.predict(x[:1]))):
+        fn()
+        start = time.perf_counter()
+        for _ in range(repeats):
+            fn()
+        timings[label] = (time.perf_counter() - start) / repeats * 1000
+
+    print(f"{name}: max |diff| = {max_diff:.2e}, top-1 agreement = {same_class:.0%}")
+    print(f"{name}: keras {timings['keras']:.1f} ms, onnx {timings['onnx']:.1f} ms per image")
+
+    if max_diff > ATOL:
+        print(f"{name}: WARNING - outputs differ by more than {ATOL}")
+        return False
+    return True
+
+
+if __name__ == "__main__":
+    names = sys.argv[1:] or list(ONNX_MODEL_PATHS)
+    ok = True
+    for model_name in names:
+        export_model(model_name)
+        ok = check_agreement(model_name) and ok
+    sys.exit(0 if ok else 1)
@@ -5,6 +5,8 @@ from PIL import Image
 import logging
 import os
 
+from engine_workers import is_isolated, get_remote_engine
+
 # Force PyTorch only (avoid TensorFlow conflict)
 os.environ["USE_TORCH"] = "1"
 
@@ -15,6 +17,8 @@ _clip_classifier = None
 def get_clip_classifier():
     """Lazily loads the CLIP classifier using PyTorch."""
     global _clip_classifier
+    if is_isolated("clip"):
+        return get_remote_engine("clip")
     if _clip_classifier is None:
         logger.info("Loading CLIP Universal Classifier (PyTorch)...")
         try:
@@ -31,27 +35,37 @@ def get_clip_classifier():
             raise
     return _clip_classifier
 
+CANDIDATE_LABELS = [
+    "healthy skin",
+    "a deep cut or laceration",
+    "a bruise or hematoma",
+    "a first degree burn with redness",
+    "a second degree burn with blisters",
+    "a third degree burn with white or charred skin",
+    "skin cancer or melanoma",
+    "skin rash or eczema",
+    "surgical stitches",
+    "acne or pimples",
+    "insect bite",
+    "psoriasis"
+]
+
 def analyze_skin_universal(image_pil):
     """Analyzes skin condition using CLIP zero-shot classification."""
     classifier = get_clip_classifier()
-    
-    candidate_labels = [
-        "healthy skin",
-        "a deep cut or laceration",
-        "a bruise or hematoma",
-        "a first degree burn with redness",
-        "a second degree burn with blisters",
-        "a third degree burn with white or charred skin",
-        "skin cancer or melanoma",
-        "skin rash or eczema",
-        "surgical stitches",
-        "acne or pimples",
-        "insect bite",
-        "psoriasis"
-    ]
-    
-    results = classifier(image_pil, candidate_labels=candidate_labels)
-    
+    results = classifier(image_pil, candidate_labels=CANDIDATE_LABELS)
+    return interpret_clip_results(results)
+
+def analyze_skin_universal_batch(images_pil, batch_size=8):
+    """Analyzes several images in batched CLIP forward passes."""
+    if not images_pil:
+        return []
+    classifier = get_clip_classifier()
+    batch_results = classifier(images_pil, candidate_labels=CANDIDATE_LABELS, batch_size=batch_size)
+    return [interpret_clip_results(results) for results in batch_results]
+
+def interpret_clip_results(results):
+    """Maps ranked CLIP labels to a diagnosis, advice and severity."""
     top_match = results[0]
     label = top_match['label']
     score = top_match['score']
@@ -0,0 +1,371 @@
+# Copyright (c) 2025 ot6_j. All Rights Reserved.
+
+"""
+Engine Workers - Runs each inference engine (TensorFlow neuro/derma, PyTorch
+CLIP/YOLO, EasyOCR) in its own spawned process pool so frameworks do not
+share thread pools or the GIL with the API process or with each other.
+
+The model getters (get_neuro_model, get_clip_classifier, ...) return proxies
+with the same call surface as the real models, so the endpoints are routed
+to the engine processes without changes. Large arrays (decoded images,
+input tensors, masks, predictions) travel through shared-memory buffers;
+only a small handle is pickled.
+
+Configuration (environment):
+    ENGINE_ISOLATION=neuro,derma,clip,surgery,ocr   # empty (default) = in-process
+    ENGINE_WORKERS_<ENGINE>=1
+    ENGINE_THREADS=2                                # intra-op threads per engine process
+    ENGINE_SHM_MIN_BYTES=65536                      # smaller arrays are pickled
+"""
+
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import resource_tracker, shared_memory
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+ENGINES = ("neuro", "derma", "clip", "surgery", "ocr")
+
+ENGINE_ISOLATION = {
+    name.strip() for name in os.environ.get("ENGINE_ISOLATION", "").split(",") if name.strip()
+}
+ENGINE_THREADS = int(os.environ.get("ENGINE_THREADS", "2"))
+ENGINE_SHM_MIN_BYTES = int(os.environ.get("ENGINE_SHM_MIN_BYTES", "65536"))
+
+# True inside an engine process: getters must return the real models there
+_in_engine_worker = False
+
+_pools: Dict[str, ProcessPoolExecutor] = {}
+_proxies: Dict[str, Any] = {}
+_lock = threading.Lock()
+_stats: Dict[str, Dict[str, int]] = {name: {"calls": 0, "errors": 0, "shared_bytes": 0, "restarts": 0} for name in ENGINES}
+
+
+# ---------------------------------------------------------------------------
+# Shared-memory transport
+# ---------------------------------------------------------------------------
+
+class SharedArray(NamedTuple):
+    """Pickled in place of an ndarray; the receiver owns (and unlinks) the buffer."""
+    name: str
+    shape: Tuple[int, ...]
+    dtype: str
+
+
+def share_array(arr: np.ndarray) -> SharedArray:
+    """Copies an array into a new shared-memory block and returns its handle."""
+    arr = np.ascontiguousarray(arr)
+    shm = shared_memory.SharedMemory(create=True, size=max(1, arr.nbytes))
+    np.ndarray(arr.shape, dtype=arr.dtype, buffer=shm.buf)[...] = arr
+    handle = SharedArray(shm.name, arr.shape, arr.dtype.str)
+    shm.close()
+    # Ownership moves to the receiver, which unlinks after reading
+    resource_tracker.unregister(shm._name, "shared_memory")
+    return handle
+
+
+def take_array(handle: SharedArray) -> np.ndarray:
+    """Copies a shared array out and frees the block."""
+    shm = shared_memory.SharedMemory(name=handle.name)
+    try:
+        return np.ndarray(handle.shape, dtype=np.dtype(handle.dtype), buffer=shm.buf).copy()
+    finally:
+        shm.close()
+        shm.unlink()
+
+
+def release_array(handle: SharedArray):
+    """Frees a block that may or may not have been consumed already."""
+    try:
+        shm = shared_memory.SharedMemory(name=handle.name)
+    except FileNotFoundError:
+        return
+    shm.close()
+    shm.unlink()
+
+
+def _pack(value: Any, stats: Optional[Dict[str, int]] = None) -> Any:
+    """Replaces large arrays (also inside lists/tuples/dicts) with shared-memory handles."""
+    if isinstance(value, np.ndarray) and value.nbytes >= ENGINE_SHM_MIN_BYTES:
+        if stats is not None:
+            stats["shared_bytes"] += value.nbytes
+        return share_array(value)
+    if isinstance(value, (list, tuple)) and not isinstance(value, SharedArray):
+        return type(value)(_pack(v, stats) for v in value)
+    if isinstance(value, dict):
+        return {k: _pack(v, stats) for k, v in value.items()}
+    return value
+
+
+def _unpack(value: Any) -> Any:
+    """Inverse of _pack: copies arrays out of shared memory."""
+    if isinstance(value, SharedArray):
+        return take_array(value)
+    if isinstance(value, (list, tuple)):
+        return type(value)(_unpack(v) for v in value)
+    if isinstance(value, dict):
+        return {k: _unpack(v) for k, v in value.items()}
+    return value
+
+
+def _handles(value: Any) -> List[SharedArray]:
+    if isinstance(value, SharedArray):
+        return [value]
+    if isinstance(value, (list, tuple)):
+        return [h for v in value for h in _handles(v)]
+    if isinstance(value, dict):
+        return [h for v in value.values() for h in _handles(v)]
+    return []
+
+
+# ---------------------------------------------------------------------------
+# Engine process side
+# ---------------------------------------------------------------------------
+
+def use_local_engines():
+    """Makes the model getters return in-process models (inside engine and video segment processes)."""
+    global _in_engine_worker
+    _in_engine_worker = True
+
+
+def _init_engine(engine: str, threads: int):
+    """Pool initializer: caps threads before any framework import, then loads and warms the model."""
+    use_local_engines()
+
+    from thread_budget import apply_thread_budget, resolve_budget
+    apply_thread_budget(resolve_budget(threads))
+
+    logging.basicConfig(level=logging.INFO)
+    from warmup import preload_model
+    status = preload_model(engine)
+    logger.info(f"Engine '{engine}' (pid {os.getpid()}): {status['state']}")
+
+
+def _engine_model(engine: str) -> Any:
+    from warmup import MODEL_REGISTRY
+    loader, _ = MODEL_REGISTRY[engine]
+    return loader()
+
+
+def _op_available(engine: str) -> bool:
+    return _engine_model(engine) is not None
+
+
+def _op_predict(engine: str, x: np.ndarray, **kwargs) -> np.ndarray:
+    return np.asarray(_engine_model(engine).predict(x, **kwargs))
+
+
+def _op_detect(engine: str, source: Any, **kwargs) -> List[Dict[str, np.ndarray]]:
+    results = _engine_model(engine).predict(source, **kwargs)
+    return [
+        {
+            "xyxy": r.boxes.xyxy.cpu().numpy(),
+            "cls": r.boxes.cls.cpu().numpy(),
+            "conf": r.boxes.conf.cpu().numpy()
+        }
+        for r in results
+    ]
+
+
+def _op_classify(engine: str, images: Any, **kwargs) -> Any:
+    from PIL import Image
+    if isinstance(images, list):
+        return _engine_model(engine)([Image.fromarray(img) for img in images], **kwargs)
+    return _engine_model(engine)(Image.fromarray(images), **kwargs)
+
+
+def _op_readtext(engine: str, image: np.ndarray, **kwargs) -> Any:
+    return _engine_model(engine).readtext(image, **kwargs)
+
+
+OPS = {
+    "available": _op_available,
+    "predict": _op_predict,
+    "detect": _op_detect,
+    "classify": _op_classify,
+    "readtext": _op_readtext,
+}
+
+
+def _run_op(engine: str, op: str, args: Tuple, kwargs: Dict[str, Any]) -> Any:
+    """Executes one op inside the engine process."""
+    args = _unpack(args)
+    kwargs = _unpack(kwargs)
+    return _pack(OPS[op](engine, *args, **kwargs))
+
+
+# ---------------------------------------------------------------------------
+# API process side
+# ---------------------------------------------------------------------------
+
+def is_isolated(engine: str) -> bool:
+    """True if the engine runs in its own process (and we are not that process)."""
+    return engine in ENGINE_ISOLATION and not _in_engine_worker
+
+
+def get_engine_pool(engine: str) -> ProcessPoolExecutor:
+    """Gets (or spawns) the process pool of an engine."""
+    with _lock:
+        if engine not in _pools:
+            workers = max(1, int(os.environ.get(f"ENGINE_WORKERS_{engine.upper()}", "1")))
+            _pools[engine] = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_engine,
+                initargs=(engine, ENGINE_THREADS)
+            )
+            logger.info(f"Engine '{engine}': spawned pool x{workers}")
+        return _pools[engine]
+
+
+def _count(engine: str, **increments: int):
+    """Adds to an engine's counters; calls come from several department threads at once."""
+    with _lock:
+        stats = _stats[engine]
+        for key, value in increments.items():
+            stats[key] += value
+
+
+def call_engine(engine: str, op: str, *args, **kwargs) -> Any:
+    """Runs an op in the engine's process pool and waits for the result (blocking)."""
+    transport = {"shared_bytes": 0}
+    packed_args = _pack(args, transport)
+    packed_kwargs = _pack(kwargs, transport)
+    _count(engine, calls=1, shared_bytes=transport["shared_bytes"])
+
+    try:
+        return _unpack(get_engine_pool(engine).submit(_run_op, engine, op, packed_args, packed_kwargs).result())
+    except BrokenProcessPool:
+        with _lock:
+            _stats[engine]["errors"] += 1
+            _stats[engine]["restarts"] += 1
+            _pools.pop(engine, None)
+        raise RuntimeError(f"Engine '{engine}' process died; it will be restarted on the next call")
+    except Exception:
+        _count(engine, errors=1)
+        raise
+    finally:
+        # Inputs are normally freed by the engine; this covers failures before it read them
+        for handle in _handles(packed_args) + _handles(packed_kwargs):
+            release_array(handle)
+
+
+class RemoteModel:
+    """Keras-style model whose predict() runs in an engine process."""
+
+    def __init__(self, engine: str):
+        self.engine = engine
+
+    def predict(self, x: np.ndarray, **kwargs) -> np.ndarray:
+        return call_engine(self.engine, "predict", np.asarray(x), **kwargs)
+
+
+class RemoteBox:
+    """One detection with the attribute layout of an ultralytics box."""
+
+    def __init__(self, xyxy: np.ndarray, cls: float, conf: float):
+        self.xyxy = xyxy.reshape(1, 4)
+        self.cls = cls
+        self.conf = conf
+
+
+class RemoteBoxes(list):
+    """List of RemoteBox, plus the stacked xyxy/cls/conf arrays."""
+
+    def __init__(self, data: Dict[str, np.ndarray]):
+        super().__init__(RemoteBox(*row) for row in zip(data["xyxy"], data["cls"], data["conf"]))
+        self.xyxy = data["xyxy"]
+        self.cls = data["cls"]
+        self.conf = data["conf"]
+
+
+class RemoteResult:
+    def __init__(self, data: Dict[str, np.ndarray]):
+        self.boxes = RemoteBoxes(data)
+
+
+class RemoteDetector:
+    """YOLO-style detector whose predict() runs in an engine process."""
+
+    def __init__(self, engine: str):
+        self.engine = engine
+
+    def predict(self, source: Any, **kwargs) -> List[RemoteResult]:
+        return [RemoteResult(data) for data in call_engine(self.engine, "detect", source, **kwargs)]
+
+
+class RemoteClassifier:
+    """Zero-shot image classification pipeline running in an engine process."""
+
+    def __init__(self, engine: str):
+        self.engine = engine
+
+    def __call__(self, images: Any, **kwargs) -> Any:
+        if isinstance(images, list):
+            arrays = [np.asarray(img.convert("RGB")) for img in images]
+        else:
+            arrays = np.asarray(images.convert("RGB"))
+        return call_engine(self.engine, "classify", arrays, **kwargs)
+
+
+class RemoteReader:
+    """EasyOCR-style reader whose readtext() runs in an engine process."""
+
+    def __init__(self, engine: str):
+        self.engine = engine
+
+    def readtext(self, image: np.ndarray, **kwargs) -> Any:
+        return call_engine(self.engine, "readtext", np.asarray(image), **kwargs)
+
+
+PROXY_TYPES = {
+    "neuro": RemoteModel,
+    "derma": RemoteModel,
+    "clip": RemoteClassifier,
+    "surgery": RemoteDetector,
+    "ocr": RemoteReader,
+}
+
+
+def get_remote_engine(engine: str) -> Optional[Any]:
+    """Returns the proxy for an isolated engine, or None if its model is unavailable."""
+    if engine not in _proxies:
+        try:
+            available = call_engine(engine, "available")
+        except Exception as e:
+            logger.error(f"Engine '{engine}' failed to start: {e}")
+            return None
+        _proxies[engine] = PROXY_TYPES[engine](engine) if available else None
+        if not available:
+            logger.warning(f"Engine '{engine}': model unavailable")
+    return _proxies[engine]
+
+
+def get_engine_stats() -> Dict[str, Dict[str, Any]]:
+    """Isolation settings and transport counters per engine."""
+    with _lock:
+        counters = {name: dict(_stats[name]) for name in ENGINES}
+    return {
+        name: {
+            "isolated": name in ENGINE_ISOLATION,
+            "started": name in _pools,
+            "workers": int(os.environ.get(f"ENGINE_WORKERS_{name.upper()}", "1")),
+            **counters[name]
+        }
+        for name in ENGINES
+    }
+
+
+def shutdown_engines(wait: bool = True):
+    """Stops every engine process pool."""
+    with _lock:
+        for engine, pool in list(_pools.items()):
+            pool.shutdown(wait=wait, cancel_futures=True)
+            del _pools[engine]
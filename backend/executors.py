@@ -0,0 +1,129 @@
+# Copyright (c) 2025 ot6_j. All Rights Reserved.
+
+"""
+Department Executors - Runs blocking inference and image work off the event loop.
+Each department gets its own bounded thread pool so that a long surgery
+video cannot starve neuro, derma, pharma or the health check.
+
+Department jobs are handed models, bound methods and closures, so they
+always run in threads. Process isolation of the models is configured with
+ENGINE_ISOLATION (see engine_workers), not here.
+
+Configuration (environment):
+    EXECUTOR_<DEPT>=thread:4      # worker count (or just EXECUTOR_<DEPT>=4)
+    EXECUTOR_MAX_PENDING_FACTOR=4 # queued jobs allowed per worker
+"""
+
+import asyncio
+import functools
+import logging
+import os
+from concurrent.futures import Executor, ThreadPoolExecutor
+from typing import Any, Callable, Dict
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_EXECUTORS = {
+    "neuro": ("thread", 2),
+    "derma": ("thread", 2),
+    "pharma": ("thread", 2),
+    "surgery": ("thread", 2),
+    "video": ("thread", 1),
+    "io": ("thread", 8),
+}
+
+MAX_PENDING_FACTOR = int(os.environ.get("EXECUTOR_MAX_PENDING_FACTOR", "4"))
+
+_executors: Dict[str, Executor] = {}
+_semaphores: Dict[str, asyncio.Semaphore] = {}
+_pending: Dict[str, int] = {}
+_settings: Dict[str, Dict[str, Any]] = {}
+
+
+def get_executor_settings(department: str) -> Dict[str, Any]:
+    """Resolves the pool size for a department from env or defaults."""
+    if department in _settings:
+        return _settings[department]
+
+    kind, workers = DEFAULT_EXECUTORS.get(department, ("thread", 2))
+    raw = os.environ.get(f"EXECUTOR_{department.upper()}")
+    if raw:
+        try:
+            raw_kind, sep, raw_workers = raw.partition(":")
+            if not sep:
+                raw_kind, raw_workers = "thread", raw_kind
+            workers = int(raw_workers) if raw_workers.strip() else workers
+            if raw_kind.strip().lower() not in ("", "thread"):
+                logger.warning(
+                    f"EXECUTOR_{department.upper()}={raw!r}: only thread pools are supported, "
+                    f"using thread x{workers}; use ENGINE_ISOLATION for process isolation"
+                )
+        except ValueError:
+            logger.warning(f"Invalid EXECUTOR_{department.upper()}={raw!r}, using defaults")
+
+    _settings[department] = {
+        "kind": kind,
+        "workers": max(1, workers),
+        "max_pending": max(1, workers) * MAX_PENDING_FACTOR
+    }
+    return _settings[department]
+
+
+def check_executor_settings():
+    """Resolves every built-in department at startup so bad EXECUTOR_* values are logged once, early."""
+    for department in DEFAULT_EXECUTORS:
+        get_executor_settings(department)
+
+
+def get_executor(department: str) -> Executor:
+    """Gets (or creates) the pool for a department."""
+    if department not in _executors:
+        settings = get_executor_settings(department)
+        _executors[department] = ThreadPoolExecutor(
+            max_workers=settings["workers"],
+            thread_name_prefix=f"{department}-worker"
+        )
+        logger.info(f"Executor '{department}': {settings['kind']} x{settings['workers']}")
+    return _executors[department]
+
+
+async def run_in_department(department: str, fn: Callable, *args, **kwargs) -> Any:
+    """
+    Runs a blocking callable in the department's pool and awaits the result.
+    Waits (backpressure) when the department already has `max_pending` jobs.
+    """
+    if department not in _semaphores:
+        _semaphores[department] = asyncio.Semaphore(get_executor_settings(department)["max_pending"])
+
+    async with _semaphores[department]:
+        _pending[department] = _pending.get(department, 0) + 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(
+                get_executor(department),
+                functools.partial(fn, *args, **kwargs)
+            )
+        finally:
+            _pending[department] -= 1
+
+
+def get_executor_stats() -> Dict[str, Dict[str, Any]]:
+    """Returns configured pools and their current number of free slots."""
+    stats = {}
+    for department in DEFAULT_EXECUTORS:
+        settings = get_executor_settings(department)
+        stats[department] = {
+            **settings,
+            "started": department in _executors,
+            "free_slots": settings["max_pending"] - _pending.get(department, 0)
+        }
+    return stats
+
+
+def shutdown_executors(wait: bool = True):
+    """Shuts down all department pools."""
+    for department, executor in list(_executors.items()):
+        executor.shutdown(wait=wait)
+        del _executors[department]
+    _semaphores.clear()
+    _pending.clear()
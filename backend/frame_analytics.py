@@ -0,0 +1,122 @@
+# Copyright (c) 2025 ot6_j. All Rights Reserved.
+
+"""
+Frame Analytics - Hemorrhage and visibility checks of a video frame in one
+call, standing in for surgery_algo.detect_hemorrhage + check_visibility:
+
+- both checks share one (optionally downscaled) working copy of the frame;
+- blood pixels come from a 64 KB lookup table indexed by the frame's
+  BGR565 code (one SIMD conversion pass, then one table lookup per pixel
+  in a table that stays in cache) instead of an HSV conversion, two range
+  checks and an OR. Each entry is the majority vote of the 256 24-bit
+  colors sharing that code, classified with the same HSV ranges by
+  OpenCV's own conversion; 0.5% of all colors land on the other side;
+- the Laplacian is int16 (exact for 8-bit input) and its variance comes
+  from cv2.meanStdDev instead of a float64 copy and numpy.var.
+
+At full resolution (FRAME_ANALYTICS_WIDTH=0) sharpness matches the
+reference up to floating-point rounding and the blood share differs only
+by the quantized colors near the HSV range edges. A working width trades
+more accuracy for speed: the blood share is area-averaged, and sharpness
+is measured on the downscaled image while its threshold (100) was tuned
+at full resolution. `python benchmark_video.py --analytics` reports speed
+and agreement per width.
+
+Configuration (environment):
+    FRAME_ANALYTICS_FUSED=1          # 0 = reference surgery_algo functions in video analysis
+    FRAME_ANALYTICS_WIDTH=0          # working width in pixels; 0 = full resolution
+"""
+
+import logging
+import os
+from typing import List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+FRAME_ANALYTICS_FUSED = os.environ.get("FRAME_ANALYTICS_FUSED", "1") == "1"
+FRAME_ANALYTICS_WIDTH = int(os.environ.get("FRAME_ANALYTICS_WIDTH", "0"))
+
+# HSV ranges of blood red (as in surgery_algo.detect_hemorrhage)
+BLOOD_HSV_RANGES = (
+    (np.array([0, 120, 70]), np.array([10, 255, 255])),
+    (np.array([170, 120, 70]), np.array([180, 255, 255])),
+)
+
+HEMORRHAGE_THRESHOLD_PERCENT = 15.0
+SHARPNESS_THRESHOLD = 100.0
+
+_blood_lut: Optional[np.ndarray] = None
+
+
+def color_codes(frame: np.ndarray) -> np.ndarray:
+    """BGR565 code of every pixel (uint16, one per pixel)."""
+    return cv2.cvtColor(frame, cv2.COLOR_BGR2BGR565).view(np.uint16)[..., 0]
+
+
+def build_blood_lut() -> np.ndarray:
+    """0/255 blood mask value of every BGR565 code: the majority of the 24-bit colors mapping to it."""
+    levels = np.arange(256, dtype=np.uint8)
+    b, g, r = np.meshgrid(levels, levels, levels, indexing="ij")
+    # Every color once, as a 4096x4096 image
+    colors = np.stack([b, g, r], axis=-1).reshape(4096, 4096, 3)
+    hsv = cv2.cvtColor(colors, cv2.COLOR_BGR2HSV)
+    mask = np.zeros((4096, 4096), dtype=np.uint8)
+    for lower, upper in BLOOD_HSV_RANGES:
+        mask |= cv2.inRange(hsv, lower, upper)
+
+    codes = color_codes(colors).ravel()
+    blood = np.bincount(codes[mask.ravel() > 0], minlength=65536)
+    total = np.bincount(codes, minlength=65536)
+    return np.where(blood * 2 > total, 255, 0).astype(np.uint8)
+
+
+def get_blood_lut() -> np.ndarray:
+    """Gets the shared BGR565 -> blood table (64 KB, built on first use)."""
+    global _blood_lut
+    if _blood_lut is None:
+        _blood_lut = build_blood_lut()
+        logger.info("Blood color lookup table built")
+    return _blood_lut
+
+
+def working_copy(frame: np.ndarray, width: int) -> np.ndarray:
+    """The frame downscaled to `width` (area interpolation), or the frame itself."""
+    h, w = frame.shape[:2]
+    if width <= 0 or width >= w:
+        return frame
+    return cv2.resize(frame, (width, max(1, int(round(h * width / w)))), interpolation=cv2.INTER_AREA)
+
+
+def analyze_pixels(frame: np.ndarray, width: int = FRAME_ANALYTICS_WIDTH,
+                   hemorrhage_threshold: float = HEMORRHAGE_THRESHOLD_PERCENT,
+                   sharpness_threshold: float = SHARPNESS_THRESHOLD) -> Tuple[tuple, tuple]:
+    """
+    Returns ((is_hemorrhage, blood_percent, mask_blood), (is_smoke_or_blur,
+    sharpness)) like detect_hemorrhage and check_visibility. The mask has
+    the frame's size whatever the working width.
+    """
+    work = working_copy(frame, width)
+
+    mask_blood = np.take(get_blood_lut(), color_codes(work))
+    blood_percent = cv2.countNonZero(mask_blood) / mask_blood.size * 100
+
+    gray = cv2.cvtColor(work, cv2.COLOR_BGR2GRAY)
+    _, std = cv2.meanStdDev(cv2.Laplacian(gray, cv2.CV_16S))
+    sharpness = float(std[0, 0]) ** 2
+
+    if mask_blood.shape != frame.shape[:2]:
+        mask_blood = cv2.resize(mask_blood, (frame.shape[1], frame.shape[0]), interpolation=cv2.INTER_NEAREST)
+
+    return (
+        (blood_percent > hemorrhage_threshold, blood_percent, mask_blood),
+        (sharpness < sharpness_threshold, sharpness)
+    )
+
+
+def analyze_pixels_batch(frames: List[np.ndarray], width: int = FRAME_ANALYTICS_WIDTH) -> Tuple[list, list]:
+    """analyze_pixels over a batch: (hemorrhage results, visibility results), one per frame."""
+    results = [analyze_pixels(frame, width) for frame in frames]
+    return [r[0] for r in results], [r[1] for r in results]
@@ -0,0 +1,109 @@
+# Copyright (c) 2025 ot6_j. All Rights Reserved.
+
+"""
+Image Decoding - Shared upload decoder. Reads the image header first to
+enforce byte/pixel limits, then decodes straight to the smallest resolution
+the caller needs: JPEGs are downscaled during decoding (DCT scaling via
+IMREAD_REDUCED_*), so a 48 MP phone photo feeding a 224x224 model never
+exists in memory at full size. Callers that need every pixel (ORB, OCR)
+ask for full resolution.
+
+Configuration (environment):
+    IMAGE_MAX_BYTES=52428800
+    IMAGE_MAX_PIXELS=100000000
+"""
+
+import io
+import os
+import threading
+from typing import Dict, NamedTuple, Optional, Tuple
+
+import cv2
+import numpy as np
+from PIL import Image, UnidentifiedImageError
+
+from metrics import Gauge, register
+
+IMAGE_MAX_BYTES = int(os.environ.get("IMAGE_MAX_BYTES", str(50 * 1024 * 1024)))
+IMAGE_MAX_PIXELS = int(os.environ.get("IMAGE_MAX_PIXELS", str(100_000_000)))
+
+# Downscale factor -> OpenCV read flag
+REDUCED_FLAGS = {
+    8: cv2.IMREAD_REDUCED_COLOR_8,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+    1: cv2.IMREAD_COLOR,
+}
+
+_decode_counts: Dict[int, int] = {factor: 0 for factor in REDUCED_FLAGS}
+_lock = threading.Lock()
+
+
+class ImageTooLargeError(ValueError):
+    """Raised when an upload exceeds IMAGE_MAX_BYTES or IMAGE_MAX_PIXELS."""
+
+
+class ImageHeader(NamedTuple):
+    width: int
+    height: int
+    format: Optional[str]
+
+
+def read_header(data: bytes) -> ImageHeader:
+    """Reads dimensions and format without decoding pixels."""
+    try:
+        with Image.open(io.BytesIO(data)) as im:
+            return ImageHeader(im.width, im.height, im.format)
+    except Image.DecompressionBombError as e:
+        raise ImageTooLargeError(str(e))
+    except (UnidentifiedImageError, OSError):
+        raise ValueError("Failed to decode image.")
+
+
+def check_limits(data: bytes) -> ImageHeader:
+    """Rejects oversized uploads before any pixel is decoded."""
+    if len(data) > IMAGE_MAX_BYTES:
+        raise ImageTooLargeError(f"Image exceeds {IMAGE_MAX_BYTES // (1024 * 1024)} MB")
+
+    header = read_header(data)
+    if header.width * header.height > IMAGE_MAX_PIXELS:
+        raise ImageTooLargeError(
+            f"Image is {header.width}x{header.height}; limit is {IMAGE_MAX_PIXELS / 1e6:.0f} MP"
+        )
+    return header
+
+
+def reduction_factor(size: Tuple[int, int], min_side: Optional[int]) -> int:
+    """Largest decode downscale (1/2/4/8) that keeps the short side >= min_side."""
+    if not min_side:
+        return 1
+    short_side = min(size)
+    for factor in sorted(REDUCED_FLAGS, reverse=True):
+        if short_side // factor >= min_side:
+            return factor
+    return 1
+
+
+def decode_image(data: bytes, min_side: Optional[int] = None) -> np.ndarray:
+    """
+    Decodes uploaded bytes into a BGR image.
+    min_side=None decodes at full resolution; otherwise the image may come
+    back downscaled by 2/4/8 as long as its short side stays >= min_side.
+    """
+    header = check_limits(data)
+    factor = reduction_factor((header.width, header.height), min_side)
+
+    img = cv2.imdecode(np.frombuffer(data, np.uint8), REDUCED_FLAGS[factor])
+    if img is None:
+        raise ValueError("Failed to decode image.")
+
+    with _lock:
+        _decode_counts[factor] += 1
+    return img
+
+
+register(Gauge(
+    "medivision_image_decodes_total", "Image decodes by downscale factor (1 = full resolution).",
+    ("factor",), metric_type="counter",
+    callback=lambda: {(str(factor),): count for factor, count in _decode_counts.items()}
+))
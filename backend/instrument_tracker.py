@@ -0,0 +1,208 @@
+# Copyright (c) 2025 ot6_j. All Rights Reserved.
+
+"""
+Instrument Tracker - Runs YOLO only on keyframes and carries the boxes
+across the frames in between with sparse optical flow (pyramidal
+Lucas-Kanade on corner features inside each box, forward-backward
+checked). Detection reruns every TRACK_DETECT_EVERY frames, or as soon as
+any track's flow confidence (share of features that track reliably) drops
+below TRACK_MIN_CONFIDENCE. Detections are matched to existing tracks by
+IoU, so an instrument keeps its id across the timeline.
+
+Results mimic ultralytics results (result.boxes -> box.xyxy/cls/conf/id),
+so analyze_frame consumes them unchanged.
+
+Configuration (environment):
+    VIDEO_TRACKING=0               # 1 = track between keyframes by default
+    TRACK_DETECT_EVERY=5           # frames per YOLO run
+    TRACK_MIN_CONFIDENCE=0.5
+    TRACK_IOU_MATCH=0.3
+    TRACK_MAX_MISSED=1             # keyframes a track may go undetected before it is dropped
+"""
+
+import logging
+import os
+from typing import Any, Callable, Dict, List, Optional
+
+import cv2
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+VIDEO_TRACKING = os.environ.get("VIDEO_TRACKING", "0") == "1"
+TRACK_DETECT_EVERY = int(os.environ.get("TRACK_DETECT_EVERY", "5"))
+TRACK_MIN_CONFIDENCE = float(os.environ.get("TRACK_MIN_CONFIDENCE", "0.5"))
+TRACK_IOU_MATCH = float(os.environ.get("TRACK_IOU_MATCH", "0.3"))
+TRACK_MAX_MISSED = int(os.environ.get("TRACK_MAX_MISSED", "1"))
+
+# Optical flow settings
+FEATURES_PER_BOX = 20
+MIN_TRACKED_FEATURES = 3
+MAX_FB_ERROR_PX = 1.0
+LK_PARAMS = dict(winSize=(21, 21), maxLevel=3,
+                 criteria=(cv2.TERM_CRITERIA_EPS | cv2.TERM_CRITERIA_COUNT, 20, 0.03))
+
+
+class Track:
+    """One instrument/hand followed across frames."""
+
+    def __init__(self, track_id: int, xyxy: np.ndarray, cls: int, conf: float):
+        self.id = track_id
+        self.xyxy = xyxy.astype(np.float32)
+        self.cls = cls
+        self.conf = conf
+        # Share of features that tracked reliably on the last flow step (1.0 right after detection)
+        self.confidence = 1.0
+        self.missed = 0
+
+
+class TrackedBox:
+    """One box with the attribute layout of an ultralytics box (plus a track id)."""
+
+    def __init__(self, track: Track):
+        self.xyxy = track.xyxy.reshape(1, 4).copy()
+        self.cls = track.cls
+        self.conf = track.conf
+        self.id = track.id
+
+
+class TrackedResult:
+    def __init__(self, tracks: List[Track]):
+        self.boxes = [TrackedBox(t) for t in tracks]
+
+
+def box_iou(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """IoU matrix between (N, 4) and (M, 4) xyxy boxes."""
+    if len(a) == 0 or len(b) == 0:
+        return np.zeros((len(a), len(b)), dtype=np.float32)
+    x1 = np.maximum(a[:, None, 0], b[None, :, 0])
+    y1 = np.maximum(a[:, None, 1], b[None, :, 1])
+    x2 = np.minimum(a[:, None, 2], b[None, :, 2])
+    y2 = np.minimum(a[:, None, 3], b[None, :, 3])
+    inter = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    return inter / np.maximum(area_a[:, None] + area_b[None, :] - inter, 1e-6)
+
+
+class InstrumentTracker:
+    """
+    Feed frames in order with update(frame). detect(frame) must return one
+    YOLO-style result (with .boxes); it is called only on keyframes.
+    """
+
+    def __init__(self, detect: Callable[[np.ndarray], Any], detect_every: int = TRACK_DETECT_EVERY,
+                 min_confidence: float = TRACK_MIN_CONFIDENCE, iou_match: float = TRACK_IOU_MATCH,
+                 max_missed: int = TRACK_MAX_MISSED, first_id: int = 1):
+        self.detect = detect
+        self.detect_every = max(1, detect_every)
+        self.min_confidence = min_confidence
+        self.iou_match = iou_match
+        self.max_missed = max_missed
+
+        self.tracks: List[Track] = []
+        self.next_id = first_id
+        self._prev_gray: Optional[np.ndarray] = None
+        self._since_detect = 0
+
+        self.stats = {"frames": 0, "detections": 0, "redetections": 0, "tracks": 0}
+
+    def _propagate(self, gray: np.ndarray):
+        """Moves every track by the median flow of its features; updates track confidence."""
+        points, owners = [], []
+        for i, track in enumerate(self.tracks):
+            x1, y1, x2, y2 = track.xyxy.astype(int)
+            mask = np.zeros_like(self._prev_gray)
+            mask[max(y1, 0):max(y2, 0), max(x1, 0):max(x2, 0)] = 255
+            features = cv2.goodFeaturesToTrack(self._prev_gray, FEATURES_PER_BOX, 0.01, 5, mask=mask)
+            track.confidence = 0.0
+            if features is not None:
+                points.append(features.reshape(-1, 2))
+                owners.extend([i] * len(features))
+
+        if not points:
+            return
+
+        prev_pts = np.concatenate(points).astype(np.float32).reshape(-1, 1, 2)
+        next_pts, status, _ = cv2.calcOpticalFlowPyrLK(self._prev_gray, gray, prev_pts, None, **LK_PARAMS)
+        back_pts, back_status, _ = cv2.calcOpticalFlowPyrLK(gray, self._prev_gray, next_pts, None, **LK_PARAMS)
+
+        fb_error = np.linalg.norm((prev_pts - back_pts).reshape(-1, 2), axis=1)
+        good = (status.ravel() == 1) & (back_status.ravel() == 1) & (fb_error < MAX_FB_ERROR_PX)
+        motion = (next_pts - prev_pts).reshape(-1, 2)
+        owners = np.asarray(owners)
+
+        for i, track in enumerate(self.tracks):
+            mine = owners == i
+            tracked = mine & good
+            if mine.any():
+                track.confidence = float(tracked.sum() / mine.sum())
+            if tracked.sum() >= MIN_TRACKED_FEATURES:
+                dx, dy = np.median(motion[tracked], axis=0)
+                track.xyxy += np.array([dx, dy, dx, dy], dtype=np.float32)
+
+    def _associate(self, result: Any):
+        """Matches fresh detections to tracks by IoU (same class); new ids for the rest."""
+        detections = [
+            (np.asarray(box.xyxy[0].tolist(), dtype=np.float32), int(box.cls), float(box.conf))
+            for box in result.boxes
+        ]
+        det_boxes = np.array([d[0] for d in detections], dtype=np.float32).reshape(-1, 4)
+        track_boxes = np.array([t.xyxy for t in self.tracks], dtype=np.float32).reshape(-1, 4)
+        iou = box_iou(track_boxes, det_boxes)
+
+        matched_tracks, matched_dets = set(), set()
+        # Greedy matching, best overlaps first
+        for flat in np.argsort(-iou, axis=None):
+            t, d = divmod(int(flat), len(detections))
+            if iou[t, d] < self.iou_match:
+                break
+            if t in matched_tracks or d in matched_dets or self.tracks[t].cls != detections[d][1]:
+                continue
+            track = self.tracks[t]
+            track.xyxy, track.cls, track.conf = detections[d]
+            track.confidence = 1.0
+            track.missed = 0
+            matched_tracks.add(t)
+            matched_dets.add(d)
+
+        for t, track in enumerate(self.tracks):
+            if t not in matched_tracks:
+                track.missed += 1
+        self.tracks = [t for t in self.tracks if t.missed <= self.max_missed]
+
+        for d, (xyxy, cls, conf) in enumerate(detections):
+            if d not in matched_dets:
+                self.tracks.append(Track(self.next_id, xyxy, cls, conf))
+                self.next_id += 1
+                self.stats["tracks"] += 1
+
+    def update(self, frame: np.ndarray) -> TrackedResult:
+        """Tracks (or re-detects) on the next frame; returns the visible boxes."""
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        self.stats["frames"] += 1
+
+        keyframe = self._prev_gray is None or self._since_detect + 1 >= self.detect_every
+        if not keyframe and self.tracks:
+            self._propagate(gray)
+            if any(t.confidence < self.min_confidence for t in self.tracks if t.missed == 0):
+                keyframe = True
+                self.stats["redetections"] += 1
+
+        if keyframe:
+            self._associate(self.detect(frame))
+            self.stats["detections"] += 1
+            self._since_detect = 0
+        else:
+            self._since_detect += 1
+
+        self._prev_gray = gray
+        return TrackedResult([t for t in self.tracks if t.missed == 0])
+
+    def get_stats(self) -> Dict[str, Any]:
+        frames = self.stats["frames"]
+        return {
+            **self.stats,
+            "detect_every": self.detect_every,
+            "detection_ratio": round(self.stats["detections"] / frames, 3) if frames else 0.0
+        }
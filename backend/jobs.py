@@ -0,0 +1,175 @@
+# Copyright (c) 2025 ot6_j. All Rights Reserved.
+
+"""
+Job Subsystem - Runs long analyses (surgery video) in the background.
+Submitting returns a job id; clients poll status/result or follow progress
+over Server-Sent Events, and may cancel. Finished jobs are kept for a
+retention window so clients can reconnect.
+
+Configuration (environment):
+    JOB_WORKERS=1
+    JOB_MAX_QUEUE=8
+    JOB_RETENTION_S=3600
+"""
+
+import logging
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", "1"))
+JOB_MAX_QUEUE = int(os.environ.get("JOB_MAX_QUEUE", "8"))
+JOB_RETENTION_S = float(os.environ.get("JOB_RETENTION_S", "3600"))
+
+TERMINAL_STATES = ("succeeded", "failed", "cancelled")
+
+
+class JobCancelled(Exception):
+    """Raised inside a job when cancellation has been requested."""
+
+
+class QueueFullError(Exception):
+    """Raised when the job queue is at capacity."""
+
+
+class Job:
+    """State of one background job, updated from its worker thread."""
+
+    def __init__(self, kind: str, cleanup: Optional[Callable[[], None]] = None):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.state = "queued"
+        self.progress = {"done": 0, "total": 0}
+        self.result: Optional[Any] = None
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        # Bumped on every change so event streams know when to emit
+        self.version = 0
+        self._cancel = threading.Event()
+        self._cleanup = cleanup
+
+    def report_progress(self, done: int, total: int):
+        """Called by the job function; raises JobCancelled if cancellation was requested."""
+        if self._cancel.is_set():
+            raise JobCancelled()
+        self.progress = {"done": done, "total": total}
+        self.version += 1
+
+    @property
+    def cancel_requested(self) -> bool:
+        return self._cancel.is_set()
+
+    def to_dict(self) -> Dict[str, Any]:
+        total = self.progress["total"]
+        return {
+            "job_id": self.id,
+            "kind": self.kind,
+            "status": self.state,
+            "progress": {
+                **self.progress,
+                "percent": round(100.0 * self.progress["done"] / total, 1) if total else 0.0
+            },
+            "error": self.error,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at
+        }
+
+
+class JobManager:
+    """Bounded worker pool + bounded queue of background jobs."""
+
+    def __init__(self, workers: int = JOB_WORKERS, max_queue: int = JOB_MAX_QUEUE,
+                 retention_s: float = JOB_RETENTION_S):
+        self.max_queue = max_queue
+        self.retention_s = retention_s
+        self._executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="job-worker")
+        self._jobs: Dict[str, Job] = {}
+        self._lock = threading.Lock()
+
+    def submit(self, kind: str, fn: Callable[[Job], Any], cleanup: Optional[Callable[[], None]] = None) -> Job:
+        """Queues `fn(job)`; raises QueueFullError when too many jobs are waiting."""
+        self.gc()
+        with self._lock:
+            # Cancelled jobs still waiting for a worker exit as soon as one picks them up
+            queued = sum(1 for job in self._jobs.values() if job.state == "queued" and not job.cancel_requested)
+            if queued >= self.max_queue:
+                raise QueueFullError(f"Job queue full ({self.max_queue} waiting)")
+            job = Job(kind, cleanup)
+            self._jobs[job.id] = job
+
+        self._executor.submit(self._run, job, fn)
+        logger.info(f"Job {job.id} ({kind}) queued")
+        return job
+
+    def _run(self, job: Job, fn: Callable[[Job], Any]):
+        try:
+            if job.cancel_requested:
+                raise JobCancelled()
+            job.state = "running"
+            job.started_at = time.time()
+            job.version += 1
+
+            job.result = fn(job)
+            job.state = "succeeded"
+        except JobCancelled:
+            job.state = "cancelled"
+            logger.info(f"Job {job.id} cancelled")
+        except Exception as e:
+            job.state = "failed"
+            job.error = str(e)
+            logger.error(f"Job {job.id} failed: {e}")
+        finally:
+            job.finished_at = time.time()
+            job.version += 1
+            if job._cleanup is not None:
+                try:
+                    job._cleanup()
+                except Exception as e:
+                    logger.warning(f"Job {job.id} cleanup failed: {e}")
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return self._jobs.get(job_id)
+
+    def cancel(self, job_id: str) -> Optional[Job]:
+        """Requests cancellation; queued jobs never start, running jobs stop at the next progress report."""
+        job = self._jobs.get(job_id)
+        if job is not None and job.state not in TERMINAL_STATES:
+            job._cancel.set()
+            job.version += 1
+        return job
+
+    def list(self) -> List[Dict[str, Any]]:
+        return [job.to_dict() for job in self._jobs.values()]
+
+    def gc(self):
+        """Drops finished jobs older than the retention window."""
+        cutoff = time.time() - self.retention_s
+        with self._lock:
+            expired = [job_id for job_id, job in self._jobs.items()
+                       if job.finished_at is not None and job.finished_at < cutoff]
+            for job_id in expired:
+                del self._jobs[job_id]
+
+    def shutdown(self):
+        for job in list(self._jobs.values()):
+            job._cancel.set()
+        self._executor.shutdown(wait=False)
+
+
+_job_manager: Optional[JobManager] = None
+
+
+def get_job_manager() -> JobManager:
+    """Gets the shared job manager."""
+    global _job_manager
+    if _job_manager is None:
+        _job_manager = JobManager()
+    return _job_manager
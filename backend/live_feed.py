@@ -0,0 +1,194 @@
+# Copyright (c) 2025 ot6_j. All Rights Reserved.
+
+"""
+Live Feed - Analyzes a live operating-room feed received over a WebSocket.
+The client sends each frame as one binary message (an encoded image, e.g.
+JPEG); the server answers with one JSON message per analyzed frame on the
+same connection. Frames are numbered from 1 in the order they are received.
+
+Latency is bounded by never queueing frames: the connection holds only the
+newest frame not yet analyzed. A frame that arrives while another is still
+waiting replaces it ("superseded"), and a frame older than
+LIVE_MAX_FRAME_AGE_MS when the analyzer gets to it is skipped ("stale").
+Each result reports the session's achieved FPS and drop rate.
+
+Messages sent to the client:
+    {"type": "result", "frame_id", "latency_ms", "result": {...}, "stats": {...}}
+    {"type": "error", "frame_id", "detail", "stats": {...}}
+
+Configuration (environment):
+    LIVE_MAX_FRAME_AGE_MS=500
+    LIVE_MAX_FRAME_BYTES=8388608     # larger messages close the connection (1009)
+    LIVE_FPS_WINDOW_S=5              # window of the reported FPS
+"""
+
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Dict, Optional, Set
+
+from fastapi import WebSocket, WebSocketDisconnect
+
+logger = logging.getLogger(__name__)
+
+LIVE_MAX_FRAME_AGE_MS = float(os.environ.get("LIVE_MAX_FRAME_AGE_MS", "500"))
+LIVE_MAX_FRAME_BYTES = int(os.environ.get("LIVE_MAX_FRAME_BYTES", str(8 * 1024 * 1024)))
+LIVE_FPS_WINDOW_S = float(os.environ.get("LIVE_FPS_WINDOW_S", "5"))
+
+# Recent latencies kept for the reported percentiles
+LATENCY_HISTORY = 200
+
+_sessions: Set["LiveSession"] = set()
+_totals = {"sessions": 0, "received": 0, "analyzed": 0, "dropped": 0, "errors": 0}
+
+
+class LiveFrame:
+    """One received frame waiting for analysis."""
+
+    def __init__(self, frame_id: int, data: bytes):
+        self.frame_id = frame_id
+        self.data = data
+        self.received_at = time.perf_counter()
+
+
+def percentile(values, q: float) -> float:
+    """Nearest-rank percentile of a non-empty sequence."""
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q / 100 * len(ordered)))]
+
+
+class LiveSession:
+    """
+    One client connection. analyze(data) runs the scan pipeline on the
+    encoded frame and returns the result to send back.
+    """
+
+    def __init__(self, websocket: WebSocket, analyze: Callable[[bytes], Awaitable[Dict[str, Any]]],
+                 max_frame_age_ms: Optional[float] = None, max_frame_bytes: int = LIVE_MAX_FRAME_BYTES,
+                 fps_window_s: float = LIVE_FPS_WINDOW_S):
+        self.websocket = websocket
+        self.analyze = analyze
+        # None = server default (LIVE_MAX_FRAME_AGE_MS)
+        self.max_frame_age_s = (max_frame_age_ms if max_frame_age_ms is not None else LIVE_MAX_FRAME_AGE_MS) / 1000
+        self.max_frame_bytes = max_frame_bytes
+        self.fps_window_s = fps_window_s
+
+        self._pending: Optional[LiveFrame] = None
+        self._frame_ready = asyncio.Event()
+        self._analyzed_at: deque = deque()
+        self._latencies: deque = deque(maxlen=LATENCY_HISTORY)
+        self.started = time.perf_counter()
+
+        self.stats = {"received": 0, "analyzed": 0, "superseded": 0, "stale": 0, "errors": 0}
+
+    async def run(self):
+        """Serves the connection until the client disconnects."""
+        _sessions.add(self)
+        analyzer = asyncio.create_task(self._analyze_loop())
+        try:
+            await self._receive_loop()
+        finally:
+            analyzer.cancel()
+            await asyncio.gather(analyzer, return_exceptions=True)
+            _sessions.discard(self)
+            _totals["sessions"] += 1
+            stats = self.get_stats()
+            for key in ("received", "analyzed", "dropped", "errors"):
+                _totals[key] += stats[key]
+            logger.info(f"Live session closed: {stats}")
+
+    async def _receive_loop(self):
+        while True:
+            message = await self.websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                return
+            data = message.get("bytes")
+            if data is None:
+                # Text messages are not frames
+                continue
+            if len(data) > self.max_frame_bytes:
+                await self.websocket.close(code=1009, reason="Frame too large")
+                return
+
+            self.stats["received"] += 1
+            if self._pending is not None:
+                self.stats["superseded"] += 1
+            self._pending = LiveFrame(self.stats["received"], data)
+            self._frame_ready.set()
+
+    async def _analyze_loop(self):
+        while True:
+            await self._frame_ready.wait()
+            self._frame_ready.clear()
+            frame, self._pending = self._pending, None
+            if frame is None:
+                continue
+            if time.perf_counter() - frame.received_at > self.max_frame_age_s:
+                self.stats["stale"] += 1
+                continue
+
+            try:
+                result = await self.analyze(frame.data)
+            except Exception as e:
+                self.stats["errors"] += 1
+                await self._send({
+                    "type": "error",
+                    "frame_id": frame.frame_id,
+                    "detail": getattr(e, "detail", None) or str(e),
+                    "stats": self.get_stats()
+                })
+                continue
+
+            now = time.perf_counter()
+            latency = now - frame.received_at
+            self.stats["analyzed"] += 1
+            self._analyzed_at.append(now)
+            self._latencies.append(latency)
+            await self._send({
+                "type": "result",
+                "frame_id": frame.frame_id,
+                "latency_ms": round(latency * 1000, 1),
+                "result": result,
+                "stats": self.get_stats()
+            })
+
+    async def _send(self, message: Dict[str, Any]):
+        try:
+            await self.websocket.send_json(message)
+        except (WebSocketDisconnect, RuntimeError):
+            # The client is gone; the receive loop ends the session
+            pass
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Achieved FPS (over the last fps_window_s), drop rate and latency of the session."""
+        now = time.perf_counter()
+        while self._analyzed_at and self._analyzed_at[0] < now - self.fps_window_s:
+            self._analyzed_at.popleft()
+        elapsed = now - self.started
+        received = self.stats["received"]
+        dropped = self.stats["superseded"] + self.stats["stale"]
+        latencies = list(self._latencies)
+        return {
+            **self.stats,
+            "dropped": dropped,
+            "drop_rate": round(dropped / received, 3) if received else 0.0,
+            "fps": round(len(self._analyzed_at) / min(self.fps_window_s, max(elapsed, 1e-3)), 1),
+            "input_fps": round(received / max(elapsed, 1e-3), 1),
+            "latency_ms": {
+                "p50": round(percentile(latencies, 50) * 1000, 1),
+                "p95": round(percentile(latencies, 95) * 1000, 1),
+                "max": round(max(latencies) * 1000, 1)
+            } if latencies else None,
+            "max_frame_age_ms": round(self.max_frame_age_s * 1000, 1)
+        }
+
+
+def get_live_stats() -> Dict[str, Any]:
+    """Open sessions and totals of the closed ones."""
+    return {
+        "active_sessions": len(_sessions),
+        "sessions": [session.get_stats() for session in list(_sessions)],
+        "closed": dict(_totals)
+    }
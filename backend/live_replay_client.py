@@ -0,0 +1,135 @@
+# Copyright (c) 2025 ot6_j. All Rights Reserved.
+
+"""
+Live feed replay client: streams a video file to the live surgery WebSocket
+at the video's own frame rate, as an operating-room client would, and prints
+the results coming back with their end-to-end latency (send to result,
+measured on this side).
+
+Usage:
+    python live_replay_client.py --video op.mp4 [--url ws://localhost:8000/api/live/surgery]
+    python live_replay_client.py --video op.mp4 --speed 2 --width 960 --quality 80
+    python live_replay_client.py --video op.mp4 --max-age-ms 300 --max-latency-ms 600
+At the end, prints frames sent, analyzed and dropped, the achieved FPS and
+latency percentiles. With --max-latency-ms, exits with code 1 if the p95
+end-to-end latency is above it.
+"""
+
+import argparse
+import asyncio
+import json
+import sys
+import time
+
+import cv2
+import websockets
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q / 100 * len(ordered)))]
+
+
+async def send_frames(ws, args, sent_at):
+    """Sends JPEG-encoded frames paced at the video's frame rate (x speed)."""
+    cap = cv2.VideoCapture(args.video)
+    if not cap.isOpened():
+        raise SystemExit(f"Could not open {args.video}")
+    fps = cap.get(cv2.CAP_PROP_FPS) or 25.0
+    interval = 1.0 / (fps * args.speed)
+    print(f"Streaming {args.video} at {fps * args.speed:.1f} FPS")
+
+    started = time.perf_counter()
+    frame_id = 0
+    while args.frames is None or frame_id < args.frames:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        if args.width and frame.shape[1] > args.width:
+            height = int(frame.shape[0] * args.width / frame.shape[1])
+            frame = cv2.resize(frame, (args.width, height), interpolation=cv2.INTER_AREA)
+        _, buffer = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, args.quality])
+
+        # Frame ids are assigned by the server in receive order, starting at 1
+        frame_id += 1
+        sent_at[frame_id] = time.perf_counter()
+        await ws.send(buffer.tobytes())
+
+        delay = started + frame_id * interval - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+    cap.release()
+    return frame_id
+
+
+async def receive_results(ws, args, sent_at, latencies, last_stats):
+    async for message in ws:
+        msg = json.loads(message)
+        last_stats.update(msg["stats"])
+        frame_id = msg["frame_id"]
+        if msg["type"] == "error":
+            print(f"#{frame_id:5d} ERROR {msg['detail']}")
+            continue
+
+        latency_ms = (time.perf_counter() - sent_at[frame_id]) * 1000
+        latencies.append(latency_ms)
+        result = msg["result"]
+        stats = msg["stats"]
+        if not args.quiet:
+            print(f"#{frame_id:5d} {result.get('level', '?'):6s} {result.get('status', ''):10s} "
+                  f"e2e={latency_ms:6.1f}ms server={msg['latency_ms']:6.1f}ms "
+                  f"fps={stats['fps']:5.1f} drop={stats['drop_rate'] * 100:4.1f}%  {result.get('message', '')}")
+
+
+async def replay(args):
+    url = args.url
+    if args.max_age_ms is not None:
+        url += f"?max_age_ms={args.max_age_ms}"
+
+    sent_at, latencies, last_stats = {}, [], {}
+    async with websockets.connect(url, max_size=None) as ws:
+        receiver = asyncio.create_task(receive_results(ws, args, sent_at, latencies, last_stats))
+        sent = await send_frames(ws, args, sent_at)
+        # Let the last analyses come back
+        await asyncio.sleep(args.drain_s)
+        await ws.close()
+        await asyncio.gather(receiver, return_exceptions=True)
+
+    print()
+    print(f"Frames sent:     {sent}")
+    print(f"Analyzed:        {len(latencies)}")
+    if last_stats:
+        print(f"Dropped:         {last_stats['dropped']} ({last_stats['drop_rate'] * 100:.1f}%: "
+              f"{last_stats['superseded']} superseded, {last_stats['stale']} stale)")
+        print(f"Achieved FPS:    {last_stats['fps']} (input {last_stats['input_fps']})")
+    if not latencies:
+        print("No results received")
+        return 1
+
+    p95 = percentile(latencies, 95)
+    print(f"End-to-end ms:   p50 {percentile(latencies, 50):.1f}  p95 {p95:.1f}  max {max(latencies):.1f}")
+    if args.max_latency_ms is not None and p95 > args.max_latency_ms:
+        print(f"FAIL: p95 latency {p95:.1f} ms > {args.max_latency_ms} ms")
+        return 1
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--video", required=True)
+    parser.add_argument("--url", default="ws://localhost:8000/api/live/surgery")
+    parser.add_argument("--speed", type=float, default=1.0, help="playback speed (2 = twice the video's FPS)")
+    parser.add_argument("--frames", type=int, default=None, help="stop after this many frames")
+    parser.add_argument("--width", type=int, default=1280, help="downscale wider frames (0 = keep)")
+    parser.add_argument("--quality", type=int, default=85, help="JPEG quality")
+    parser.add_argument("--max-age-ms", type=float, default=None, help="server-side stale frame limit")
+    parser.add_argument("--max-latency-ms", type=float, default=None, help="fail if p95 latency exceeds this")
+    parser.add_argument("--drain-s", type=float, default=2.0, help="wait for late results before closing")
+    parser.add_argument("--quiet", action="store_true", help="print the summary only")
+    args = parser.parse_args()
+
+    sys.exit(asyncio.run(replay(args)))
+
+
+if __name__ == "__main__":
+    main()
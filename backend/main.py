@@ -1,25 +1,98 @@
 # Copyright (c) 2025 ot6_j. All Rights Reserved.
 
+from thread_budget import apply_thread_budget, get_thread_budget
+
+# Size every engine's thread pool before numpy/TF/torch start them
+apply_thread_budget()
+
 import io
+import os
+import json
+import shutil
+import asyncio
+import tarfile
+import zipfile
 import logging
 import numpy as np
-from typing import Dict, Any
+from typing import Dict, Any, List, Optional, Set, Tuple
 from PIL import Image
-from fastapi import FastAPI, File, UploadFile, HTTPException, Form
+from fastapi import FastAPI, File, UploadFile, HTTPException, Form, Request, WebSocket
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse, Response, StreamingResponse
 import cv2
 
 from model_loader import (
     get_neuro_model,
     get_derma_model,
     get_surgery_model,
-    get_tesseract_config
+    get_surgery_detector,
+    get_tesseract_config,
+    resnet50_preprocess,
+    mobilenet_v2_preprocess
+)
+from batching import get_neuro_batcher
+from image_decode import decode_image, ImageTooLargeError
+from live_feed import LiveSession, get_live_stats
+from video_hls import HLS_TTL_S, OUTPUT_FORMATS, create_stream, stream_file_path, stream_media_type, stream_url
+from video_sampling import SAMPLING_MODES
+from video_segments import shutdown_segment_pool
+from video_upload import (
+    iter_upload,
+    read_head,
+    save_video,
+    remove_file,
+    is_streamable,
+    PipeIngest,
+    PIPE_INGEST_SUPPORTED,
+    PipeOpenTimeoutError,
+    VideoTooLargeError,
+    UnsupportedVideoError
+)
+from executors import run_in_department, get_executor_stats, shutdown_executors, check_executor_settings
+from engine_workers import get_engine_stats, shutdown_engines
+from warmup import preload_models, get_readiness
+from result_cache import cached_scan, get_result_cache
+from artifact_store import (
+    encode_image_artifact,
+    file_artifact_reference,
+    get_artifact_store,
+    is_valid_artifact_id,
+    media_type_for,
+    parse_include,
+    wants,
+    ARTIFACT_TTL_S
+)
+from batch_scan import (
+    BatchTooLargeError,
+    expand_uploads,
+    item_error,
+    ndjson_line,
+    sub_batches,
+    summarize
+)
+from jobs import get_job_manager, QueueFullError, TERMINAL_STATES
+from metrics import (
+    StageTimer,
+    SERVER_TIMING_ENABLED,
+    start_request_spans,
+    end_request_spans,
+    format_server_timing,
+    render_metrics
 )
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+JOB_EVENT_POLL_S = 0.5
+
+NEURO_MODES = ("fast", "precision")
+
+# Upper bound of the target_fps parameter of the video endpoints
+MAX_TARGET_FPS = 60
+
+# Input size of the ResNet50 / MobileNetV2 / CLIP models: smallest decode that keeps full detail
+MODEL_INPUT_SIDE = 224
+
 app = FastAPI(
     title="MediVision 360 API",
     description="Simple AI Medical Imaging Analysis",
@@ -34,23 +107,6 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-try:
-    import torch
-    from ultralytics import YOLO
-    from ultralytics.nn.tasks import DetectionModel
-    import base64
-    
-    # Allow ultralytics classes for torch.load (PyTorch 2.6+ security)
-    torch.serialization.add_safe_globals([DetectionModel])
-    
-    # Using YOLOv8s (small) for better accuracy than nano
-    model_surgery = YOLO('yolov8s.pt')
-    logger.info("YOLOv8s (small) loaded - more accurate than nano")
-except Exception as e:
-    logger.warning(f"YOLOv8 not available: {e}")
-    model_surgery = None
-
-
 def preprocess_image_for_model(image: Image.Image, target_size: tuple) -> np.ndarray:
     """Preprocess image for model input."""
     if image.mode != 'RGB':
@@ -63,6 +119,179 @@ def preprocess_image_for_model(image: Image.Image, target_size: tuple) -> np.nda
     return img_array
 
 
+def decode_upload(contents: bytes, min_side: Optional[int] = None) -> np.ndarray:
+    """Decodes uploaded bytes into a BGR image (reduced resolution when min_side allows it)."""
+    return decode_image(contents, min_side)
+
+
+def with_filename(result: Dict[str, Any], filename: str) -> Dict[str, Any]:
+    """Returns a (possibly cached) response labelled with the current upload's filename."""
+    if "filename" in result and result["filename"] != filename:
+        return {**result, "filename": filename}
+    return result
+
+
+def preprocess_neuro(img: np.ndarray):
+    """Resizes to 224x224 and applies ResNet50 preprocessing."""
+    img_resized = cv2.resize(img, (224, 224))
+    img_array = np.expand_dims(img_resized, axis=0)
+    x = resnet50_preprocess(img_array)
+    
+    return img_resized, x
+
+
+def to_pil_rgb(img: np.ndarray) -> Image.Image:
+    """Converts a BGR image to an RGB PIL image (CLIP input)."""
+    return Image.fromarray(cv2.cvtColor(img, cv2.COLOR_BGR2RGB))
+
+
+def preprocess_derma(img: np.ndarray) -> np.ndarray:
+    """Resizes to 224x224 and applies MobileNetV2 preprocessing."""
+    img_resized = cv2.resize(img, (224, 224))
+    x = np.expand_dims(img_resized, axis=0)
+    return mobilenet_v2_preprocess(x)
+
+
+def cache_include_key(include: Optional[Set[str]]) -> str:
+    """Stable cache-key component for the requested artifact set."""
+    return "all" if include is None else ",".join(sorted(include))
+
+
+def build_derma_response(filename: str, clip_result: Dict[str, Any]) -> Dict[str, Any]:
+    """Builds the derma response from a CLIP classification."""
+    return {
+        "filename": filename,
+        "diagnostic": clip_result["diagnostic_fr"],
+        "confiance": f"{clip_result['confiance']*100:.1f}%",
+        "confidence": round(clip_result['confiance'] * 100, 1),
+        "conseil": clip_result["conseil_ia"],
+        "gravite": clip_result["gravite"],
+        "couleur_alerte": clip_result["couleur"],
+        "method": "CLIP Universal Classifier",
+        "threshold_met": clip_result["gravite"] in ["URGENCE", "Moyenne à Forte", "Moyenne"]
+    }
+
+
+def needs_cancer_check(clip_result: Dict[str, Any]) -> bool:
+    """True when CLIP is unsure about a non-traumatic lesion (MobileNetV2 second opinion)."""
+    traumatic_keywords = ["burn", "cut", "laceration", "bruise", "hematoma", "stitches", "insect"]
+    is_traumatic = any(keyword in clip_result["diagnostic_original"].lower() for keyword in traumatic_keywords)
+    return not is_traumatic and clip_result['confiance'] < 0.80
+
+
+def apply_cancer_check(response: Dict[str, Any], pred_row: np.ndarray):
+    """Overrides the derma response when MobileNetV2 flags a suspicious lesion."""
+    cancer_prob = float(pred_row[1]) if len(pred_row) > 1 else float(pred_row[0])
+    
+    if cancer_prob > 0.65:
+        response.update({
+            "diagnostic": "⚠️ Suspicious Lesion",
+            "confiance": f"{cancer_prob*100:.1f}%",
+            "confidence": round(cancer_prob * 100, 1),
+            "conseil": "Consult dermatologist immediately.",
+            "gravite": "URGENT",
+            "couleur_alerte": "red",
+            "method": "MobileNetV2 Cancer Detector",
+            "threshold_met": True
+        })
+
+
+def build_neuro_screening(filename: str, pred_row: np.ndarray, elapsed: float) -> Dict[str, Any]:
+    """Builds the fast-mode (ResNet50 screening) neuro response."""
+    score_tumeur = float(pred_row[1])
+    threshold_met = score_tumeur >= 0.70
+    
+    if threshold_met:
+        diagnostic = "Tumor Detected"
+        action = "Switch to Precision mode for detailed measurements."
+    else:
+        diagnostic = "Healthy"
+        action = "No further action required. Continue routine monitoring."
+    
+    return {
+        "mode": "RAPID SCREENING (ResNet50)",
+        "filename": filename,
+        "diagnostic": diagnostic,
+        "confiance": f"{score_tumeur * 100:.1f}%",
+        "confidence": round(score_tumeur * 100, 1),
+        "temps_calcul": f"{elapsed:.2f}s",
+        "action": action,
+        "threshold_met": threshold_met,
+        "probabilities": {
+            "healthy": float(pred_row[0]),
+            "tumor": float(pred_row[1])
+        }
+    }
+
+
+def build_video_playback_response(result: Dict[str, Any]) -> Dict[str, Any]:
+    """Builds the synchronized-playback response from process_full_video output (stores the video)."""
+    hls = result.get("hls")
+    return {
+        "status": "SUCCESS",
+        "video": hls["playlist_url"] if hls else file_artifact_reference(result["video_path"], ".mp4"),
+        "duration": result["duration"],
+        "fps": result["fps"],
+        "total_seconds": result["total_seconds"],
+        "timeline": result["timeline"],
+        "summary": result["summary"],
+        "pipeline": result.get("pipeline"),
+        "tracking": result.get("tracking"),
+        "adaptive": result.get("adaptive"),
+        "hls": hls
+    }
+
+
+def check_neuro_mode(mode: str):
+    """Rejects unknown neuro modes with 400, before the mode becomes a metrics label."""
+    if mode not in NEURO_MODES:
+        raise HTTPException(status_code=400, detail=f"Invalid mode '{mode}'. Use 'fast' or 'precision'.")
+
+
+def check_sampling_mode(sampling: Optional[str]):
+    """Rejects unknown video sampling modes with 400 (None = server default)."""
+    if sampling is not None and sampling not in SAMPLING_MODES:
+        raise HTTPException(status_code=400, detail=f"sampling must be one of: {', '.join(SAMPLING_MODES)}")
+
+
+def check_target_fps(target_fps: int):
+    """Rejects video sampling rates outside 1..MAX_TARGET_FPS with 400."""
+    if not 1 <= target_fps <= MAX_TARGET_FPS:
+        raise HTTPException(status_code=400, detail=f"target_fps must be between 1 and {MAX_TARGET_FPS}")
+
+
+def check_output_format(output: str):
+    """Rejects unknown video output formats with 400."""
+    if output not in OUTPUT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"output must be one of: {', '.join(OUTPUT_FORMATS)}")
+
+
+def serialize_response(result: Dict[str, Any], timer: StageTimer) -> JSONResponse:
+    """Serializes a scan response inside a timed span and closes the request timer."""
+    with timer.stage("serialize"):
+        response = JSONResponse(content=result)
+    timer.finish()
+    return response
+
+
+def build_neuro_heatmap(img_resized: np.ndarray):
+    """Builds the CLAHE segmentation heatmap and its overlay on the scan."""
+    gray = cv2.cvtColor(img_resized, cv2.COLOR_BGR2GRAY) if len(img_resized.shape) == 3 else img_resized.copy()
+    clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8))
+    enhanced = clahe.apply(gray)
+    _, max_val, _, _ = cv2.minMaxLoc(enhanced)
+    _, mask = cv2.threshold(enhanced, max_val * 0.70, 255, cv2.THRESH_BINARY)
+    kernel = np.ones((5, 5), np.uint8)
+    mask = cv2.morphologyEx(mask, cv2.MORPH_OPEN, kernel, iterations=2)
+    heatmap_blur = cv2.GaussianBlur(mask, (41, 41), 0)
+    heatmap_colored = cv2.applyColorMap(heatmap_blur, cv2.COLORMAP_JET)
+    
+    img_rgb = img_resized.copy() if len(img_resized.shape) == 3 else cv2.cvtColor(img_resized, cv2.COLOR_GRAY2RGB)
+    superimposed = cv2.addWeighted(img_rgb, 0.6, heatmap_colored, 0.4, 0)
+    
+    return heatmap_colored, superimposed
+
+
 def create_mock_response(department: str, confidence: float, prediction: str) -> Dict[str, Any]:
     """Creates a mock response for testing."""
     logger.info(f"Using mock response for {department}")
@@ -107,48 +336,179 @@ def create_mock_response(department: str, confidence: float, prediction: str) ->
     return responses.get(department, {})
 
 
+@app.middleware("http")
+async def server_timing(request, call_next):
+    """Adds a Server-Timing header with the stage spans recorded for the request."""
+    token = start_request_spans()
+    try:
+        response = await call_next(request)
+    finally:
+        spans = end_request_spans(token)
+    
+    if SERVER_TIMING_ENABLED and spans:
+        response.headers["Server-Timing"] = format_server_timing(spans)
+        response.headers["Timing-Allow-Origin"] = "*"
+    
+    return response
+
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus metrics (text exposition format)."""
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+
 @app.get("/")
 async def root():
-    """Health check."""
+    """Health check (liveness)."""
     return {
         "status": "online",
         "service": "MediVision 360 API"
     }
 
 
-@app.post("/api/scan/neuro")
-async def scan_neuro(file: UploadFile = File(...), mode: str = "fast"):
+@app.on_event("startup")
+async def startup():
+    """Preloads and warms up models in the background; /ready flips once done."""
+    check_executor_settings()
+    asyncio.get_running_loop().run_in_executor(None, preload_models)
+
+
+@app.get("/ready")
+async def ready():
+    """Readiness probe: 503 until models are loaded and warmed up."""
+    readiness = get_readiness()
+    return JSONResponse(status_code=200 if readiness["ready"] else 503, content=readiness)
+
+
+@app.on_event("shutdown")
+def shutdown():
+    """Stops the department executor pools, engine and video segment processes, and background jobs."""
+    get_job_manager().shutdown()
+    shutdown_executors(wait=False)
+    shutdown_engines(wait=False)
+    shutdown_segment_pool(wait=False)
+
+
+@app.get("/api/artifacts/{artifact_id}")
+async def get_artifact(artifact_id: str, request: Request):
+    """Serves a generated image/video by its content-addressed id."""
+    if not is_valid_artifact_id(artifact_id):
+        raise HTTPException(status_code=404, detail="Artifact not found")
+    
+    headers = {
+        "Cache-Control": f"public, max-age={int(ARTIFACT_TTL_S)}, immutable",
+        "ETag": f'"{artifact_id}"'
+    }
+    
+    if request.headers.get("if-none-match") == headers["ETag"]:
+        return Response(status_code=304, headers=headers)
+    
+    # Videos are served straight from disk in chunks
+    path = await run_in_department("io", get_artifact_store().file_path, artifact_id)
+    if path is not None:
+        return FileResponse(path, media_type=media_type_for(artifact_id), headers=headers)
+    
+    data = await run_in_department("io", get_artifact_store().get, artifact_id)
+    if data is None:
+        raise HTTPException(status_code=404, detail="Artifact not found or expired")
+    
+    return Response(content=data, media_type=media_type_for(artifact_id), headers=headers)
+
+
+@app.get("/api/hls/{stream_id}/{name}")
+async def get_hls_file(stream_id: str, name: str):
+    """Serves a progressive HLS stream: playlist, fMP4 segments and their timeline sidecars."""
+    path = await run_in_department("io", stream_file_path, stream_id, name)
+    if path is None:
+        # Also returned for segments not written yet; players retry
+        raise HTTPException(status_code=404, detail="Stream file not found")
+    
+    # The playlist grows while the video is processed; segments never change once written
+    cache = "no-cache" if name.endswith(".m3u8") else f"public, max-age={int(HLS_TTL_S)}"
+    return FileResponse(path, media_type=stream_media_type(name), headers={"Cache-Control": cache})
+
+
+@app.get("/api/stats/artifacts")
+async def artifact_stats():
+    """Artifact store counters and memory occupancy."""
+    return get_artifact_store().get_stats()
+
+
+@app.get("/api/stats/executors")
+async def executor_stats():
+    """Department executor pools (kind, workers, free queue slots)."""
+    return get_executor_stats()
+
+
+@app.get("/api/stats/threads")
+async def thread_stats():
+    """Active thread budget per engine and the values the frameworks report."""
+    return get_thread_budget()
+
+
+@app.get("/api/stats/engines")
+async def engine_stats():
+    """Engine process isolation (pools, calls, shared-memory bytes, restarts)."""
+    return get_engine_stats()
+
+
+@app.get("/api/stats/cache")
+async def cache_stats():
+    """Scan result cache hit/miss counters and occupancy."""
+    return get_result_cache().get_stats()
+
+
+@app.get("/api/stats/memory")
+async def memory_stats():
+    """Shared (copy-on-write) vs private resident memory of this worker process."""
+    from prefork import process_memory
+    try:
+        return process_memory(os.getpid())
+    except OSError:
+        raise HTTPException(status_code=501, detail="Memory stats require /proc (Linux)")
+
+
+@app.get("/api/stats/batching")
+async def batching_stats():
+    """Micro-batching statistics (batch sizes, queueing delay)."""
+    return {"neuro": get_neuro_batcher().get_stats()}
+
+
+@app.get("/api/stats/live")
+async def live_stats():
+    """Live surgical feed sessions (achieved FPS, drop rate, latency)."""
+    return get_live_stats()
+
+
+async def run_neuro_scan(contents: bytes, filename: str, mode: str = "fast",
+                         include: Optional[Set[str]] = None, timer: Optional[StageTimer] = None):
     """
-    Brain Tumor Detection Endpoint.
+    Brain Tumor Detection (uncached compute path).
     
     mode="fast" -> Quick ResNet screening (Yes/No + Confidence)
     mode="precision" -> Full morphometric analysis (Measurements, Mask, Risk)
     """
     import time
     start_time = time.time()
+    check_neuro_mode(mode)
+    timer = timer or StageTimer("neuro", mode)
     
     try:
-        contents = await file.read()
-        model = get_neuro_model()
+        with timer.stage("model_load"):
+            model = await run_in_department("neuro", get_neuro_model)
         
         if model is None:
             return create_mock_response("neuro", 0.98, "Tumor Detected")
         
-        import tensorflow as tf
-        import base64
-        
-        nparr = np.frombuffer(contents, np.uint8)
-        img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-        
-        if img is None:
-            raise ValueError("Failed to decode image.")
-        
-        img_resized = cv2.resize(img, (224, 224))
-        img_array = np.expand_dims(img_resized, axis=0)
-        x = tf.keras.applications.resnet50.preprocess_input(img_array)
+        with timer.stage("decode"):
+            img = await run_in_department("neuro", decode_upload, contents, MODEL_INPUT_SIDE)
+        with timer.stage("preprocess"):
+            img_resized, x = await run_in_department("neuro", preprocess_neuro, img)
         
-        # ResNet prediction (used by both modes)
-        predictions = model.predict(x, verbose=0)
+        # ResNet prediction (used by both modes), micro-batched with concurrent requests
+        with timer.stage("inference"):
+            predictions = np.expand_dims(await get_neuro_batcher().submit(x), axis=0)
         score_tumeur = float(predictions[0][1])
         
         logger.info(f"Mode: {mode} | Tumor confidence: {score_tumeur * 100:.2f}%")
@@ -159,51 +519,21 @@ async def scan_neuro(file: UploadFile = File(...), mode: str = "fast"):
         if mode == "fast":
             elapsed = time.time() - start_time
             
-            threshold_met = score_tumeur >= 0.70
+            # Generate simple heatmap for visualization (only if requested)
+            heatmap_url = None
+            if wants(include, "heatmap"):
+                try:
+                    with timer.stage("heatmap"):
+                        _, superimposed = await run_in_department("neuro", build_neuro_heatmap, img_resized)
+                    with timer.stage("encode"):
+                        heatmap_url = await run_in_department("neuro", encode_image_artifact, superimposed, '.png')
+                except Exception as e:
+                    logger.warning(f"Fast mode heatmap generation failed: {e}")
             
-            if threshold_met:
-                diagnostic = "Tumor Detected"
-                action = "Switch to Precision mode for detailed measurements."
-            else:
-                diagnostic = "Healthy"
-                action = "No further action required. Continue routine monitoring."
+            response = build_neuro_screening(filename, predictions[0], elapsed)
             
-            # Generate simple heatmap for visualization
-            heatmap_base64 = None
-            try:
-                gray = cv2.cvtColor(img_resized, cv2.COLOR_BGR2GRAY) if len(img_resized.shape) == 3 else img_resized.copy()
-                clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8))
-                enhanced = clahe.apply(gray)
-                _, max_val, _, _ = cv2.minMaxLoc(enhanced)
-                _, mask = cv2.threshold(enhanced, max_val * 0.70, 255, cv2.THRESH_BINARY)
-                kernel = np.ones((5, 5), np.uint8)
-                mask = cv2.morphologyEx(mask, cv2.MORPH_OPEN, kernel, iterations=2)
-                heatmap_blur = cv2.GaussianBlur(mask, (41, 41), 0)
-                heatmap_colored = cv2.applyColorMap(heatmap_blur, cv2.COLORMAP_JET)
-                img_rgb = img_resized.copy() if len(img_resized.shape) == 3 else cv2.cvtColor(img_resized, cv2.COLOR_GRAY2RGB)
-                superimposed = cv2.addWeighted(img_rgb, 0.6, heatmap_colored, 0.4, 0)
-                _, buffer = cv2.imencode('.png', superimposed)
-                heatmap_base64 = base64.b64encode(buffer).decode('utf-8')
-            except Exception as e:
-                logger.warning(f"Fast mode heatmap generation failed: {e}")
-            
-            response = {
-                "mode": "RAPID SCREENING (ResNet50)",
-                "filename": file.filename,
-                "diagnostic": diagnostic,
-                "confiance": f"{score_tumeur * 100:.1f}%",
-                "confidence": round(score_tumeur * 100, 1),
-                "temps_calcul": f"{elapsed:.2f}s",
-                "action": action,
-                "threshold_met": threshold_met,
-                "probabilities": {
-                    "healthy": float(predictions[0][0]),
-                    "tumor": float(predictions[0][1])
-                }
-            }
-            
-            if heatmap_base64:
-                response["heatmap"] = f"data:image/png;base64,{heatmap_base64}"
+            if heatmap_url:
+                response["heatmap"] = heatmap_url
             
             return response
         
@@ -213,44 +543,44 @@ async def scan_neuro(file: UploadFile = File(...), mode: str = "fast"):
         elif mode == "precision":
             from neuro_advanced import analyze_heatmap_for_measurements
             
-            # Generate segmentation heatmap
-            gray = cv2.cvtColor(img_resized, cv2.COLOR_BGR2GRAY) if len(img_resized.shape) == 3 else img_resized.copy()
-            clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8))
-            enhanced = clahe.apply(gray)
-            _, max_val, _, _ = cv2.minMaxLoc(enhanced)
-            _, mask = cv2.threshold(enhanced, max_val * 0.70, 255, cv2.THRESH_BINARY)
-            kernel = np.ones((5, 5), np.uint8)
-            mask = cv2.morphologyEx(mask, cv2.MORPH_OPEN, kernel, iterations=2)
-            heatmap_blur = cv2.GaussianBlur(mask, (41, 41), 0)
-            heatmap_colored = cv2.applyColorMap(heatmap_blur, cv2.COLORMAP_JET)
-            
-            # Generate basic heatmap overlay
-            img_rgb = img_resized.copy() if len(img_resized.shape) == 3 else cv2.cvtColor(img_resized, cv2.COLOR_GRAY2RGB)
-            superimposed = cv2.addWeighted(img_rgb, 0.6, heatmap_colored, 0.4, 0)
-            _, buffer = cv2.imencode('.png', superimposed)
-            heatmap_base64 = base64.b64encode(buffer).decode('utf-8')
+            # Generate segmentation heatmap and basic overlay
+            with timer.stage("heatmap"):
+                heatmap_colored, superimposed = await run_in_department("neuro", build_neuro_heatmap, img_resized)
+            heatmap_url = None
+            if wants(include, "heatmap"):
+                with timer.stage("encode"):
+                    heatmap_url = await run_in_department("neuro", encode_image_artifact, superimposed, '.png')
             
             # Run advanced morphometric analysis
-            advanced_data = analyze_heatmap_for_measurements(
-                heatmap_colored, 
-                img_resized,
-                round(score_tumeur * 100, 1)
-            )
+            with timer.stage("morphometrics"):
+                advanced_data = await run_in_department(
+                    "neuro",
+                    analyze_heatmap_for_measurements,
+                    heatmap_colored, 
+                    img_resized,
+                    round(score_tumeur * 100, 1)
+                )
             
             elapsed = time.time() - start_time
             
             if advanced_data:
-                # Encode binary mask (B&W)
-                _, mask_buffer = cv2.imencode('.png', advanced_data["mask"])
-                mask_b64 = base64.b64encode(mask_buffer).decode('utf-8')
-                
-                # Encode annotated image
-                _, annotated_buffer = cv2.imencode('.png', advanced_data["annotated_image"])
-                annotated_b64 = base64.b64encode(annotated_buffer).decode('utf-8')
+                artifacts = {}
+                with timer.stage("encode"):
+                    # Encode binary mask (B&W)
+                    if wants(include, "mask"):
+                        artifacts["image_masque"] = await run_in_department(
+                            "neuro", encode_image_artifact, advanced_data["mask"], '.png'
+                        )
+                    
+                    # Encode annotated image
+                    if wants(include, "annotated"):
+                        artifacts["annotated_image"] = await run_in_department(
+                            "neuro", encode_image_artifact, advanced_data["annotated_image"], '.png'
+                        )
                 
                 response = {
                     "mode": "SURGICAL PLANNING (Segmentation)",
-                    "filename": file.filename,
+                    "filename": filename,
                     "diagnostic": "Complete Morphometric Analysis",
                     "confiance": f"{score_tumeur * 100:.1f}%",
                     "confidence": round(score_tumeur * 100, 1),
@@ -259,9 +589,7 @@ async def scan_neuro(file: UploadFile = File(...), mode: str = "fast"):
                     "data": advanced_data["measurements"],
                     "risk": advanced_data["risk"],
                     "recommendations": advanced_data["recommendations"],
-                    "image_masque": f"data:image/png;base64,{mask_b64}",
-                    "annotated_image": f"data:image/png;base64,{annotated_b64}",
-                    "heatmap": f"data:image/png;base64,{heatmap_base64}",
+                    **artifacts,
                     "probabilities": {
                         "healthy": float(predictions[0][0]),
                         "tumor": float(predictions[0][1])
@@ -271,7 +599,7 @@ async def scan_neuro(file: UploadFile = File(...), mode: str = "fast"):
                 # Fallback if advanced analysis fails
                 response = {
                     "mode": "SURGICAL PLANNING (Segmentation)",
-                    "filename": file.filename,
+                    "filename": filename,
                     "diagnostic": "No significant lesion detected for measurement",
                     "confiance": f"{score_tumeur * 100:.1f}%",
                     "confidence": round(score_tumeur * 100, 1),
@@ -280,13 +608,15 @@ async def scan_neuro(file: UploadFile = File(...), mode: str = "fast"):
                     "data": None,
                     "risk": {"level": "LOW", "score": 0, "factors": []},
                     "recommendations": [{"action": "Continue monitoring", "delai": "6 months", "raison": "No abnormality detected"}],
-                    "heatmap": f"data:image/png;base64,{heatmap_base64}",
                     "probabilities": {
                         "healthy": float(predictions[0][0]),
                         "tumor": float(predictions[0][1])
                     }
                 }
             
+            if heatmap_url:
+                response["heatmap"] = heatmap_url
+            
             return response
         
         # ================================================================
@@ -297,95 +627,285 @@ async def scan_neuro(file: UploadFile = File(...), mode: str = "fast"):
     
     except HTTPException:
         raise
+    except ImageTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
     except Exception as e:
         logger.error(f"Error in neuro scan: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@app.post("/api/scan/derma")
-async def scan_derma(file: UploadFile = File(...)):
+@app.post("/api/scan/neuro")
+async def scan_neuro(file: UploadFile = File(...), mode: str = "fast", include: Optional[str] = None):
+    """Brain Tumor Detection Endpoint (cached by image content and mode)."""
+    check_neuro_mode(mode)
+    timer = StageTimer("neuro", mode)
+    with timer.stage("upload_read"):
+        contents = await file.read()
+    artifacts = parse_include(include)
+    result = await cached_scan(
+        "neuro", contents,
+        lambda: run_neuro_scan(contents, file.filename, mode, artifacts, timer),
+        mode=mode, include=cache_include_key(artifacts)
+    )
+    return serialize_response(with_filename(result, file.filename), timer)
+
+
+async def run_derma_scan(contents: bytes, filename: str, timer: Optional[StageTimer] = None):
     """Dermatology: Lesion Analysis."""
+    timer = timer or StageTimer("derma")
+    
     try:
         from derma_universal import analyze_skin_universal
-        from PIL import Image
-        from tensorflow.keras.applications.mobilenet_v2 import preprocess_input
         
-        contents = await file.read()
-        nparr = np.frombuffer(contents, np.uint8)
-        img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-        
-        if img is None:
-            raise ValueError("Failed to decode image")
-        
-        img_rgb = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-        pil_img = Image.fromarray(img_rgb)
-        
-        clip_result = analyze_skin_universal(pil_img)
-        
-        traumatic_keywords = ["burn", "cut", "laceration", "bruise", "hematoma", "stitches", "insect"]
-        is_traumatic = any(keyword in clip_result["diagnostic_original"].lower() for keyword in traumatic_keywords)
-        
-        response = {
-            "filename": file.filename,
-            "diagnostic": clip_result["diagnostic_fr"],
-            "confiance": f"{clip_result['confiance']*100:.1f}%",
-            "confidence": round(clip_result['confiance'] * 100, 1),
-            "conseil": clip_result["conseil_ia"],
-            "gravite": clip_result["gravite"],
-            "couleur_alerte": clip_result["couleur"],
-            "method": "CLIP Universal Classifier",
-            "threshold_met": clip_result["gravite"] in ["URGENCE", "Moyenne à Forte", "Moyenne"]
-        }
+        with timer.stage("decode"):
+            img = await run_in_department("derma", decode_upload, contents, MODEL_INPUT_SIDE)
+        
+        with timer.stage("preprocess"):
+            pil_img = await run_in_department("derma", to_pil_rgb, img)
+        
+        with timer.stage("inference"):
+            clip_result = await run_in_department("derma", analyze_skin_universal, pil_img)
         
-        if not is_traumatic and clip_result['confiance'] < 0.80:
-            model = get_derma_model()
+        response = build_derma_response(filename, clip_result)
+        
+        if needs_cancer_check(clip_result):
+            with timer.stage("model_load"):
+                model = await run_in_department("derma", get_derma_model)
             if model is not None:
-                img_resized = cv2.resize(img, (224, 224))
-                x = np.expand_dims(img_resized, axis=0)
-                x = preprocess_input(x.astype(np.float32))
-                
-                preds = model.predict(x, verbose=0)
-                cancer_prob = float(preds[0][1]) if len(preds[0]) > 1 else float(preds[0][0])
+                with timer.stage("preprocess"):
+                    x = await run_in_department("derma", preprocess_derma, img)
                 
-                if cancer_prob > 0.65:
-                    response.update({
-                        "diagnostic": "⚠️ Suspicious Lesion",
-                        "confiance": f"{cancer_prob*100:.1f}%",
-                        "confidence": round(cancer_prob * 100, 1),
-                        "conseil": "Consult dermatologist immediately.",
-                        "gravite": "URGENT",
-                        "couleur_alerte": "red",
-                        "method": "MobileNetV2 Cancer Detector",
-                        "threshold_met": True
-                    })
+                with timer.stage("inference"):
+                    preds = await run_in_department("derma", model.predict, x, verbose=0)
+                apply_cancer_check(response, preds[0])
         
         return response
     
+    except ImageTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
     except Exception as e:
         logger.error(f"Error in derma scan: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@app.post("/api/scan/pharma")
-async def scan_pharma(file: UploadFile = File(...)):
+@app.post("/api/scan/derma")
+async def scan_derma(file: UploadFile = File(...)):
+    """Dermatology: Lesion Analysis (cached by image content)."""
+    timer = StageTimer("derma")
+    with timer.stage("upload_read"):
+        contents = await file.read()
+    result = await cached_scan("derma", contents, lambda: run_derma_scan(contents, file.filename, timer))
+    return serialize_response(with_filename(result, file.filename), timer)
+
+
+async def read_batch_uploads(files: List[UploadFile], timer: StageTimer) -> List[Tuple[str, bytes]]:
+    """Reads a multi-file upload and expands zip/tar archives into images."""
+    with timer.stage("upload_read"):
+        uploads = [(f.filename, await f.read()) for f in files]
+    
+    try:
+        return await run_in_department("io", expand_uploads, uploads)
+    except BatchTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except (zipfile.BadZipFile, tarfile.TarError) as e:
+        raise HTTPException(status_code=400, detail=f"Invalid archive: {e}")
+
+
+async def decode_sub_batch(department: str, chunk, decode_fn, results: Dict[int, Dict[str, Any]]):
+    """Decodes a sub-batch in parallel; failures are recorded in `results`, successes returned."""
+    outcomes = await asyncio.gather(
+        *[run_in_department(department, decode_fn, data) for _, (_, data) in chunk],
+        return_exceptions=True
+    )
+    
+    decoded = []
+    for (index, (name, _)), outcome in zip(chunk, outcomes):
+        if isinstance(outcome, Exception):
+            results[index] = item_error(index, name, outcome)
+        else:
+            decoded.append((index, name, outcome))
+    return decoded
+
+
+def decode_neuro_item(contents: bytes):
+    """Decodes one batch item and applies ResNet50 preprocessing."""
+    return preprocess_neuro(decode_upload(contents, MODEL_INPUT_SIDE))
+
+
+def decode_derma_item(contents: bytes):
+    """Decodes one batch item into (BGR image, RGB PIL image)."""
+    img = decode_upload(contents, MODEL_INPUT_SIDE)
+    return img, to_pil_rgb(img)
+
+
+def neuro_heatmap_artifact(img_resized: np.ndarray) -> str:
+    """Builds and stores the screening heatmap overlay for one image."""
+    _, superimposed = build_neuro_heatmap(img_resized)
+    return encode_image_artifact(superimposed, '.png')
+
+
+async def run_neuro_sub_batch(chunk, model, include: Set[str], timer: StageTimer) -> List[Dict[str, Any]]:
+    """Screens one sub-batch with a single stacked ResNet50 forward pass."""
+    import time
+    start_time = time.time()
+    results: Dict[int, Dict[str, Any]] = {}
+    
+    with timer.stage("decode"):
+        decoded = await decode_sub_batch("neuro", chunk, decode_neuro_item, results)
+    
+    if decoded and model is None:
+        for index, name, _ in decoded:
+            results[index] = {"index": index, "filename": name, "status": "SUCCESS",
+                              **create_mock_response("neuro", 0.98, "Tumor Detected")}
+    elif decoded:
+        try:
+            with timer.stage("inference"):
+                x = np.concatenate([x_item for _, _, (_, x_item) in decoded])
+                predictions = await run_in_department("neuro", model.predict, x, verbose=0)
+        except Exception as e:
+            logger.error(f"Neuro batch inference failed: {e}")
+            for index, name, _ in decoded:
+                results[index] = item_error(index, name, e)
+            return [results[index] for index, _ in chunk]
+        
+        elapsed = time.time() - start_time
+        for row, (index, name, _) in zip(predictions, decoded):
+            results[index] = {"index": index, "status": "SUCCESS", **build_neuro_screening(name, row, elapsed)}
+        
+        if wants(include, "heatmap"):
+            with timer.stage("heatmap"):
+                heatmaps = await asyncio.gather(
+                    *[run_in_department("neuro", neuro_heatmap_artifact, img_resized)
+                      for _, _, (img_resized, _) in decoded],
+                    return_exceptions=True
+                )
+            for (index, _, _), heatmap in zip(decoded, heatmaps):
+                if not isinstance(heatmap, Exception):
+                    results[index]["heatmap"] = heatmap
+    
+    return [results[index] for index, _ in chunk]
+
+
+async def run_derma_sub_batch(chunk, model, timer: StageTimer) -> List[Dict[str, Any]]:
+    """Classifies one sub-batch with batched CLIP and stacked MobileNetV2 passes."""
+    from derma_universal import analyze_skin_universal_batch
+    results: Dict[int, Dict[str, Any]] = {}
+    
+    with timer.stage("decode"):
+        decoded = await decode_sub_batch("derma", chunk, decode_derma_item, results)
+    
+    if not decoded:
+        return [results[index] for index, _ in chunk]
+    
+    try:
+        with timer.stage("inference"):
+            clip_results = await run_in_department(
+                "derma", analyze_skin_universal_batch,
+                [pil_img for _, _, (_, pil_img) in decoded], len(decoded)
+            )
+    except Exception as e:
+        logger.error(f"Derma batch CLIP failed: {e}")
+        for index, name, _ in decoded:
+            results[index] = item_error(index, name, e)
+        return [results[index] for index, _ in chunk]
+    
+    to_check = []
+    for (index, name, (img, _)), clip_result in zip(decoded, clip_results):
+        results[index] = {"index": index, "status": "SUCCESS", **build_derma_response(name, clip_result)}
+        if needs_cancer_check(clip_result):
+            to_check.append((index, img))
+    
+    if to_check and model is not None:
+        try:
+            with timer.stage("preprocess"):
+                xs = await asyncio.gather(*[run_in_department("derma", preprocess_derma, img) for _, img in to_check])
+            with timer.stage("inference"):
+                preds = await run_in_department("derma", model.predict, np.concatenate(xs), verbose=0)
+            for (index, _), row in zip(to_check, preds):
+                apply_cancer_check(results[index], row)
+        except Exception as e:
+            logger.warning(f"Derma batch MobileNetV2 check failed: {e}")
+    
+    return [results[index] for index, _ in chunk]
+
+
+async def batch_response(sub_batch_runs, stream: bool, timer: StageTimer):
+    """Returns per-item results in input order, as one JSON document or NDJSON stream."""
+    if stream:
+        async def body():
+            for run in sub_batch_runs:
+                for item in await run:
+                    yield ndjson_line(item)
+            timer.finish()
+        
+        return StreamingResponse(body(), media_type="application/x-ndjson")
+    
+    results = []
+    for run in sub_batch_runs:
+        results.extend(await run)
+    return serialize_response(summarize(results), timer)
+
+
+@app.post("/api/scan/neuro/batch")
+async def scan_neuro_batch(files: List[UploadFile] = File(...), stream: bool = False, include: Optional[str] = None):
+    """
+    Batch brain tumor screening (ResNet50 fast mode).
+    Accepts many images or a zip/tar archive; stream=true returns NDJSON per image.
+    Heatmaps are only generated with include=heatmap.
+    """
+    timer = StageTimer("neuro", "batch")
+    items = await read_batch_uploads(files, timer)
+    
+    with timer.stage("model_load"):
+        model = await run_in_department("neuro", get_neuro_model)
+    
+    artifacts = parse_include(include) if include else set()
+    runs = (run_neuro_sub_batch(chunk, model, artifacts, timer) for chunk in sub_batches(items))
+    return await batch_response(runs, stream, timer)
+
+
+@app.post("/api/scan/derma/batch")
+async def scan_derma_batch(files: List[UploadFile] = File(...), stream: bool = False):
+    """
+    Batch skin lesion analysis (CLIP + MobileNetV2).
+    Accepts many images or a zip/tar archive; stream=true returns NDJSON per image.
+    """
+    timer = StageTimer("derma", "batch")
+    items = await read_batch_uploads(files, timer)
+    
+    with timer.stage("model_load"):
+        model = await run_in_department("derma", get_derma_model)
+    
+    runs = (run_derma_sub_batch(chunk, model, timer) for chunk in sub_batches(items))
+    return await batch_response(runs, stream, timer)
+
+
+async def run_pharma_scan(contents: bytes, include: Optional[Set[str]] = None, timer: Optional[StageTimer] = None):
     """Pharmacy: OCR Analysis + Package Authenticity Check."""
+    timer = timer or StageTimer("pharma")
+    
     try:
-        from pharma_scraper import process_pharma_image
+        from pharma_scraper import extract_medication_name, lookup_medication
         from security_check import check_authenticity
         
-        contents = await file.read()
-        nparr = np.frombuffer(contents, np.uint8)
-        img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-        
-        if img is None:
-            raise ValueError("Failed to decode image")
+        with timer.stage("decode"):
+            # Full resolution: OCR and ORB matching need every pixel
+            img = await run_in_department("pharma", decode_upload, contents)
         
-        # 1. OCR Analysis
-        result = process_pharma_image(img)
+        # 1. OCR Analysis (CPU) + online lookup (blocking I/O)
+        with timer.stage("ocr"):
+            med_name, raw_text = await run_in_department("pharma", extract_medication_name, img)
+        with timer.stage("lookup"):
+            result = await run_in_department("io", lookup_medication, med_name, raw_text)
         
         # 2. Package Authenticity Check (ORB Feature Matching)
         medicine_name = result.get('nom_detecte', '')
-        auth_result = check_authenticity(img, medicine_name)
+        with timer.stage("orb"):
+            auth_result = await run_in_department(
+                "pharma", check_authenticity, img, medicine_name,
+                with_visual_proof=wants(include, "visual_proof"),
+                proof_encoder=lambda proof: encode_image_artifact(proof, '.jpg')
+            )
         
         if "error" in result:
             return {
@@ -422,11 +942,28 @@ async def scan_pharma(file: UploadFile = File(...)):
             "threshold_met": result['niveau_risque'] == "ATTENTION"
         }
     
+    except ImageTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
     except Exception as e:
         logger.error(f"Pharma error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.post("/api/scan/pharma")
+async def scan_pharma(file: UploadFile = File(...), include: Optional[str] = None):
+    """Pharmacy: OCR Analysis + Package Authenticity Check (cached by image content)."""
+    timer = StageTimer("pharma")
+    with timer.stage("upload_read"):
+        contents = await file.read()
+    artifacts = parse_include(include)
+    result = await cached_scan(
+        "pharma", contents,
+        lambda: run_pharma_scan(contents, artifacts, timer),
+        include=cache_include_key(artifacts)
+    )
+    return serialize_response(result, timer)
+
+
 @app.post("/api/scan/pharma-manual")
 async def scan_pharma_manual(medication_name: str = Form(...)):
     """Pharmacy: Manual search."""
@@ -440,7 +977,7 @@ async def scan_pharma_manual(medication_name: str = Form(...)):
         }
         
         logger.info(f"Manual: {medication_name}")
-        result = search_drug_online(drug_info)
+        result = await run_in_department("io", search_drug_online, drug_info)
         
         if not result:
             return {
@@ -470,19 +1007,20 @@ async def scan_pharma_manual(medication_name: str = Form(...)):
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@app.post("/api/scan/surgery")
-async def scan_surgery(file: UploadFile = File(...)):
+async def run_surgery_scan(contents: bytes, filename: str,
+                           include: Optional[Set[str]] = None, timer: Optional[StageTimer] = None):
     """Surgery: Tool & Context Analysis."""
+    timer = timer or StageTimer("surgery")
+    
     try:
         from surgery_algo import detect_hemorrhage, check_visibility
         from surgery_copilot import analyze_surgical_context
         
-        contents = await file.read()
-        nparr = np.frombuffer(contents, np.uint8)
-        img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+        with timer.stage("model_load"):
+            model_surgery = await run_in_department("surgery", get_surgery_detector)
         
-        if img is None:
-            raise ValueError("Failed to decode image")
+        with timer.stage("decode"):
+            img = await run_in_department("surgery", decode_upload, contents)
         
         if model_surgery is None:
             from surgery_copilot import get_surgical_guidance
@@ -495,7 +1033,7 @@ async def scan_surgery(file: UploadFile = File(...)):
             )
             
             return {
-                "filename": file.filename,
+                "filename": filename,
                 "tool_count": 0,
                 "hands_detected": 0,
                 "hemorrhage_detected": False,
@@ -520,7 +1058,11 @@ async def scan_surgery(file: UploadFile = File(...)):
         }
         
         # YOLO detection - only surgical-relevant classes
-        results = model_surgery.predict(img, classes=SURGICAL_CLASSES, conf=0.3, verbose=False)
+        with timer.stage("inference"):
+            results = await run_in_department(
+                "surgery", model_surgery.predict,
+                img, classes=SURGICAL_CLASSES, conf=0.3, verbose=False
+            )
         
         # Parse detections
         detections = []
@@ -571,8 +1113,10 @@ async def scan_surgery(file: UploadFile = File(...)):
             cv2.putText(img_annotated, label_text, (x1 + 5, y1 - 5), 
                        cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 0, 0), 2)
         
-        is_bleeding, blood_pct, mask_blood = detect_hemorrhage(img)
-        is_smoke, sharpness = check_visibility(img)
+        with timer.stage("hemorrhage"):
+            is_bleeding, blood_pct, mask_blood = await run_in_department("surgery", detect_hemorrhage, img)
+        with timer.stage("visibility"):
+            is_smoke, sharpness = await run_in_department("surgery", check_visibility, img)
         
         copilot = analyze_surgical_context(tool_count, hand_count, blood_pct, sharpness)
         
@@ -589,8 +1133,10 @@ async def scan_surgery(file: UploadFile = File(...)):
             heatmap_blood = cv2.applyColorMap(mask_blood, cv2.COLORMAP_JET)
             img_annotated = cv2.addWeighted(img_annotated, 0.7, heatmap_blood, 0.3, 0)
         
-        _, buffer = cv2.imencode('.jpg', img_annotated)
-        img_base64 = base64.b64encode(buffer).decode('utf-8')
+        image_url = None
+        if wants(include, "image"):
+            with timer.stage("encode"):
+                image_url = await run_in_department("surgery", encode_image_artifact, img_annotated, '.jpg')
         
         return {
             "status": status,
@@ -608,112 +1154,358 @@ async def scan_surgery(file: UploadFile = File(...)):
             },
             "detections": detections,
             "total_objects": len(detections),
-            "image": f"data:image/jpeg;base64,{img_base64}",
+            "image": image_url,
             "threshold_met": alert_level in ["red", "orange"]
         }
         
+    except ImageTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
     except Exception as e:
         logger.error(f"Surgery error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.post("/api/scan/surgery")
+async def scan_surgery(file: UploadFile = File(...), include: Optional[str] = None):
+    """Surgery: Tool & Context Analysis (cached by image content)."""
+    timer = StageTimer("surgery")
+    with timer.stage("upload_read"):
+        contents = await file.read()
+    artifacts = parse_include(include)
+    result = await cached_scan(
+        "surgery", contents,
+        lambda: run_surgery_scan(contents, file.filename, artifacts, timer),
+        include=cache_include_key(artifacts)
+    )
+    return serialize_response(with_filename(result, file.filename), timer)
+
+
+async def analyze_live_frame(contents: bytes) -> Dict[str, Any]:
+    """Runs the surgery scan on one live-feed frame (no image artifact, not cached)."""
+    timer = StageTimer("surgery", "live")
+    result = await run_surgery_scan(contents, "live", include=set(), timer=timer)
+    timer.finish()
+    return result
+
+
+@app.websocket("/api/live/surgery")
+async def live_surgery(websocket: WebSocket, max_age_ms: Optional[float] = None):
+    """Surgery: live feed analysis (binary encoded frames in, one JSON result per analyzed frame out)."""
+    await websocket.accept()
+    await LiveSession(websocket, analyze_live_frame, max_frame_age_ms=max_age_ms).run()
+
+
 @app.post("/api/scan/surgery-video")
-async def scan_surgery_video(file: UploadFile = File(...)):
+async def scan_surgery_video(file: UploadFile = File(...), include: Optional[str] = None):
     """Surgery Video Analysis."""
+    include = parse_include(include)
+    timer = StageTimer("surgery", "video")
+    
     try:
-        from video_processor import extract_video_frames, process_video_frame
-        import tempfile
-        import os
-        
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.mp4') as tmp_file:
-            contents = await file.read()
-            tmp_file.write(contents)
-            video_path = tmp_file.name
+        from video_processor import extract_video_frames, iter_batches, process_video_frames, VIDEO_BATCH_SIZE
         
-        logger.info(f"Processing video: {video_path}")
+        with timer.stage("model_load"):
+            model_surgery = await run_in_department("surgery", get_surgery_detector)
         
-        frames = extract_video_frames(video_path, max_frames=30, fps=5)
+        with timer.stage("upload_read"):
+            video_path = await save_video(iter_upload(file))
         
-        if not frames:
-            os.unlink(video_path)
-            return {"status": "FAILED", "message": "No frames extracted"}
+        # Frames are decoded batch by batch and dropped once analyzed
+        def analyze_frames():
+            analyzed = []
+            frames = extract_video_frames(video_path, max_frames=30, fps=5)
+            for batch in iter_batches(frames, VIDEO_BATCH_SIZE):
+                for frame_result in process_video_frames(batch, model_surgery):
+                    image_url = encode_image_artifact(frame_result['annotated_frame'], '.jpg') if wants(include, "frames") else None
+                    
+                    analyzed.append({
+                        "frame_number": len(analyzed) + 1,
+                        "status": frame_result["status"],
+                        "message": frame_result["message"],
+                        "level": frame_result["level"],
+                        "data": frame_result["data"],
+                        "image": image_url
+                    })
+            return analyzed
         
-        results = []
-        for i, frame in enumerate(frames):
-            frame_result = process_video_frame(frame, model_surgery)
+        try:
+            logger.info(f"Processing video: {video_path}")
             
-            _, buffer = cv2.imencode('.jpg', frame_result['annotated_frame'])
-            img_base64 = base64.b64encode(buffer).decode('utf-8')
-            
-            results.append({
-                "frame_number": i + 1,
-                "status": frame_result["status"],
-                "message": frame_result["message"],
-                "level": frame_result["level"],
-                "data": frame_result["data"],
-                "image": f"data:image/jpeg;base64,{img_base64}"
-            })
+            with timer.stage("video_analysis"):
+                results = await run_in_department("video", analyze_frames)
+        finally:
+            remove_file(video_path)
         
-        os.unlink(video_path)
+        if not results:
+            return {"status": "FAILED", "message": "No frames extracted"}
         
         critical_frames = sum(1 for r in results if r['level'] == 'red')
         warning_frames = sum(1 for r in results if r['level'] == 'orange')
         
-        return {
+        return serialize_response({
             "status": "SUCCESS",
             "total_frames": len(results),
             "critical_frames": critical_frames,
             "warning_frames": warning_frames,
             "frames": results
-        }
+        }, timer)
         
+    except VideoTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except UnsupportedVideoError as e:
+        raise HTTPException(status_code=415, detail=str(e))
     except Exception as e:
         logger.error(f"Video processing error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @app.post("/api/scan/surgery-video-realtime")
-async def scan_surgery_video_realtime(file: UploadFile = File(...)):
+async def scan_surgery_video_realtime(file: UploadFile = File(...), sampling: Optional[str] = None,
+                                      tracking: Optional[bool] = None, adaptive: Optional[bool] = None):
     """
     Real-time synchronized video analysis.
     Returns annotated H.264 video + per-second timeline for synchronized playback.
+    sampling=keyframe analyzes keyframes only (quick triage of long recordings).
+    tracking=true runs YOLO on keyframes and tracks instruments in between.
+    adaptive=true analyzes only frames that changed (static stretches are interpolated).
     """
+    check_sampling_mode(sampling)
+    timer = StageTimer("surgery", "video_realtime")
+    
     try:
         from video_processor import process_full_video
-        import tempfile
-        import os
         
-        # Save uploaded video to temp file
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.mp4') as tmp_file:
-            contents = await file.read()
-            tmp_file.write(contents)
-            video_path = tmp_file.name
+        with timer.stage("model_load"):
+            model_surgery = await run_in_department("surgery", get_surgery_detector)
         
-        logger.info(f"Processing video for real-time playback: {video_path}")
+        # Stream uploaded video to a temp file (removed on success or failure)
+        with timer.stage("upload_read"):
+            video_path = await save_video(iter_upload(file))
         
-        # Process entire video with YOLO annotations at 10 FPS
-        result = process_full_video(video_path, model_surgery, target_fps=10)
-        
-        # Clean up temp file
-        os.unlink(video_path)
+        try:
+            logger.info(f"Processing video for real-time playback: {video_path}")
+            
+            # Process entire video with YOLO annotations at 10 FPS
+            with timer.stage("video_analysis"):
+                result = await run_in_department(
+                    "video", process_full_video, video_path, model_surgery, target_fps=10, sampling=sampling,
+                    tracking=tracking, adaptive=adaptive
+                )
+        finally:
+            remove_file(video_path)
         
         logger.info(f"Video processed: {result['processed_frames']} frames, {result['total_seconds']}s")
         
-        return {
-            "status": "SUCCESS",
-            "video": f"data:{result['video_mime']};base64,{result['video_base64']}",
-            "duration": result["duration"],
-            "fps": result["fps"],
-            "total_seconds": result["total_seconds"],
-            "timeline": result["timeline"],
-            "summary": result["summary"]
-        }
+        response = await run_in_department("io", build_video_playback_response, result)
+        return serialize_response(response, timer)
         
+    except VideoTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except UnsupportedVideoError as e:
+        raise HTTPException(status_code=415, detail=str(e))
     except Exception as e:
         logger.error(f"Real-time video processing error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.post("/api/scan/surgery-video-realtime/stream")
+async def scan_surgery_video_stream(request: Request, target_fps: int = 10, sampling: Optional[str] = None,
+                                    tracking: Optional[bool] = None, adaptive: Optional[bool] = None):
+    """
+    Real-time video analysis of a raw request body (Content-Type: video/*).
+    Streamable containers (MPEG-TS, WebM/MKV, fast-start MP4) are decoded from a pipe
+    while the upload is still arriving; other containers are spooled to disk first.
+    """
+    check_sampling_mode(sampling)
+    check_target_fps(target_fps)
+    timer = StageTimer("surgery", "video_stream")
+    
+    try:
+        from video_processor import process_full_video
+        
+        with timer.stage("model_load"):
+            model_surgery = await run_in_department("surgery", get_surgery_detector)
+        
+        chunks = request.stream()
+        head = await read_head(chunks)
+        
+        if PIPE_INGEST_SUPPORTED and is_streamable(head):
+            ingest = PipeIngest(head, chunks)
+            feeder = asyncio.create_task(ingest.feed())
+            try:
+                with timer.stage("video_analysis"):
+                    try:
+                        result = await run_in_department(
+                            "video", process_full_video, ingest.path, model_surgery, target_fps=target_fps,
+                            sampling=sampling, tracking=tracking, adaptive=adaptive
+                        )
+                    except Exception:
+                        # A failed feeder ends the stream early; its error is the cause
+                        if feeder.done() and not feeder.cancelled() and feeder.exception() is not None:
+                            raise feeder.exception()
+                        raise
+                # Surfaces upload errors (e.g. size cap) that ended the stream early
+                await feeder
+            finally:
+                if not feeder.done():
+                    feeder.cancel()
+                ingest.cleanup()
+        else:
+            with timer.stage("upload_read"):
+                video_path = await save_video(chunks, head)
+            try:
+                with timer.stage("video_analysis"):
+                    result = await run_in_department(
+                        "video", process_full_video, video_path, model_surgery, target_fps=target_fps,
+                        sampling=sampling, tracking=tracking, adaptive=adaptive
+                    )
+            finally:
+                remove_file(video_path)
+        
+        logger.info(f"Streamed video processed: {result['processed_frames']} frames, {result['total_seconds']}s")
+        
+        response = await run_in_department("io", build_video_playback_response, result)
+        return serialize_response(response, timer)
+        
+    except VideoTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except UnsupportedVideoError as e:
+        raise HTTPException(status_code=415, detail=str(e))
+    except PipeOpenTimeoutError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except Exception as e:
+        logger.error(f"Streamed video processing error: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+# ================================================================
+# JOBS: Asynchronous surgery video analysis
+# ================================================================
+
+@app.post("/api/jobs/surgery-video", status_code=202)
+async def submit_surgery_video_job(file: UploadFile = File(...), target_fps: int = 10,
+                                   sampling: Optional[str] = None, tracking: Optional[bool] = None,
+                                   adaptive: Optional[bool] = None, output: str = "mp4"):
+    """
+    Queues a full surgery video analysis and returns a job id immediately.
+    Follow progress at /api/jobs/{id}/events (SSE), fetch /api/jobs/{id}/result when done.
+    output=hls writes the annotated video as a growing HLS stream: playback can start
+    from playlist_url (segment timelines alongside) while the job is still running.
+    """
+    from video_processor import process_full_video
+    
+    check_sampling_mode(sampling)
+    check_target_fps(target_fps)
+    check_output_format(output)
+    
+    model_surgery = await run_in_department("surgery", get_surgery_detector)
+    
+    try:
+        video_path = await save_video(iter_upload(file))
+    except VideoTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except UnsupportedVideoError as e:
+        raise HTTPException(status_code=415, detail=str(e))
+    
+    stream_id, hls_dir = create_stream() if output == "hls" else (None, None)
+    
+    def run_job(job):
+        result = process_full_video(video_path, model_surgery, target_fps=target_fps,
+                                    progress_callback=job.report_progress, sampling=sampling,
+                                    tracking=tracking, adaptive=adaptive, hls_dir=hls_dir)
+        logger.info(f"Job {job.id}: {result['processed_frames']} frames, {result['total_seconds']}s")
+        return build_video_playback_response(result)
+    
+    def cleanup():
+        remove_file(video_path)
+    
+    try:
+        job = get_job_manager().submit("surgery-video", run_job, cleanup=cleanup)
+    except QueueFullError as e:
+        cleanup()
+        if hls_dir is not None:
+            shutil.rmtree(hls_dir, ignore_errors=True)
+        raise HTTPException(status_code=503, detail=str(e))
+    
+    response = {
+        **job.to_dict(),
+        "status_url": f"/api/jobs/{job.id}",
+        "events_url": f"/api/jobs/{job.id}/events",
+        "result_url": f"/api/jobs/{job.id}/result"
+    }
+    if stream_id is not None:
+        # 404 until the first segment is written
+        response["playlist_url"] = stream_url(stream_id)
+    return response
+
+
+def get_job_or_404(job_id: str):
+    """Looks up a job or raises 404 (unknown or past its retention window)."""
+    job = get_job_manager().get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found or expired")
+    return job
+
+
+@app.get("/api/jobs")
+async def list_jobs():
+    """Lists queued, running and retained jobs."""
+    return get_job_manager().list()
+
+
+@app.get("/api/jobs/{job_id}")
+async def get_job_status(job_id: str):
+    """Job status and progress."""
+    return get_job_or_404(job_id).to_dict()
+
+
+@app.get("/api/jobs/{job_id}/result")
+async def get_job_result(job_id: str):
+    """Job result once succeeded; 409 while pending, 410 if cancelled, 500 if failed."""
+    job = get_job_or_404(job_id)
+    
+    if job.state == "succeeded":
+        return job.result
+    if job.state == "cancelled":
+        raise HTTPException(status_code=410, detail="Job was cancelled")
+    if job.state == "failed":
+        raise HTTPException(status_code=500, detail=job.error)
+    
+    return JSONResponse(status_code=409, content=job.to_dict())
+
+
+@app.get("/api/jobs/{job_id}/events")
+async def stream_job_events(job_id: str):
+    """Server-Sent Events: `progress` while running, then `succeeded`/`failed`/`cancelled`."""
+    job = get_job_or_404(job_id)
+    
+    async def events():
+        last_version = -1
+        while True:
+            version = job.version
+            if version != last_version:
+                last_version = version
+                terminal = job.state in TERMINAL_STATES
+                event = job.state if terminal else "progress"
+                yield f"event: {event}\ndata: {json.dumps(job.to_dict())}\n\n"
+                if terminal:
+                    break
+            await asyncio.sleep(JOB_EVENT_POLL_S)
+    
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@app.delete("/api/jobs/{job_id}")
+async def cancel_job(job_id: str):
+    """Requests cancellation of a queued or running job."""
+    get_job_or_404(job_id)
+    return get_job_manager().cancel(job_id).to_dict()
+
+
 if __name__ == "__main__":
     import uvicorn
     logger.info("Starting MediVision 360 API Server...")
@@ -0,0 +1,187 @@
+# Copyright (c) 2025 ot6_j. All Rights Reserved.
+
+"""
+Metrics - Per-stage latency histograms exported in Prometheus text format.
+Each endpoint is split into named spans (upload_read, decode, preprocess,
+inference, heatmap, morphometrics, encode, serialize, ...) labelled by
+department and mode. Spans of the current request are also collected for
+an optional Server-Timing response header.
+
+Configuration (environment):
+    SERVER_TIMING_ENABLED=1
+"""
+
+import contextvars
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Tuple
+
+SERVER_TIMING_ENABLED = os.environ.get("SERVER_TIMING_ENABLED", "1") != "0"
+
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# Spans recorded during the current request, for the Server-Timing header
+_request_spans: contextvars.ContextVar[Optional[List[Tuple[str, float]]]] = contextvars.ContextVar(
+    "request_spans", default=None
+)
+
+
+def _escape_label_value(value: str) -> str:
+    """Escapes a label value as the text format requires (backslash, double quote, newline)."""
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    parts = [f'{n}="{_escape_label_value(str(v))}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class Histogram:
+    """Cumulative-bucket histogram with a fixed set of label names."""
+
+    def __init__(self, name: str, documentation: str, label_names: Tuple[str, ...],
+                 buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = label_names
+        self.buckets = buckets
+        self._series: Dict[Tuple[str, ...], List[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *label_values: str):
+        """Records one observation; series layout is [bucket counts..., +Inf, sum]."""
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [0.0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += 1
+            series[-1] += value
+
+    def collect(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for label_values, series in sorted(self._series.items()):
+                for i, bound in enumerate(self.buckets):
+                    labels = _format_labels(self.label_names, label_values, f'le="{bound}"')
+                    lines.append(f"{self.name}_bucket{labels} {series[i]:.0f}")
+                labels = _format_labels(self.label_names, label_values, 'le="+Inf"')
+                lines.append(f"{self.name}_bucket{labels} {series[-2]:.0f}")
+                labels = _format_labels(self.label_names, label_values)
+                lines.append(f"{self.name}_count{labels} {series[-2]:.0f}")
+                lines.append(f"{self.name}_sum{labels} {series[-1]:.6f}")
+        return lines
+
+
+class Gauge:
+    """Gauge whose series are set directly or produced by a callback at scrape time."""
+
+    def __init__(self, name: str, documentation: str, label_names: Tuple[str, ...] = (),
+                 callback: Optional[Callable[[], Dict[Tuple[str, ...], float]]] = None,
+                 metric_type: str = "gauge"):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = label_names
+        self.callback = callback
+        self.metric_type = metric_type
+        self._series: Dict[Tuple[str, ...], float] = {}
+
+    def set(self, value: float, *label_values: str):
+        self._series[label_values] = value
+
+    def collect(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.metric_type}"]
+        series = dict(self._series)
+        if self.callback is not None:
+            try:
+                series.update(self.callback())
+            except Exception:
+                pass
+        for label_values, value in sorted(series.items()):
+            lines.append(f"{self.name}{_format_labels(self.label_names, label_values)} {value}")
+        return lines
+
+
+_registry: List = []
+
+
+def register(metric):
+    """Adds a metric to the /metrics exposition."""
+    _registry.append(metric)
+    return metric
+
+
+STAGE_DURATION = register(Histogram(
+    "medivision_stage_duration_seconds",
+    "Duration of a named processing stage.",
+    ("department", "mode", "stage")
+))
+
+REQUEST_DURATION = register(Histogram(
+    "medivision_request_duration_seconds",
+    "End-to-end scan duration inside the handler.",
+    ("department", "mode")
+))
+
+
+class StageTimer:
+    """Times the named stages of one scan request."""
+
+    def __init__(self, department: str, mode: str = "default"):
+        self.department = department
+        self.mode = mode
+        self.started = time.perf_counter()
+
+    @contextmanager
+    def stage(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            record_span(self.department, self.mode, name, time.perf_counter() - start)
+
+    def finish(self):
+        """Records the end-to-end duration of the request."""
+        REQUEST_DURATION.observe(time.perf_counter() - self.started, self.department, self.mode)
+
+
+def record_span(department: str, mode: str, stage: str, seconds: float):
+    """Records a stage duration in the histogram and the current request's spans."""
+    STAGE_DURATION.observe(seconds, department, mode, stage)
+    spans = _request_spans.get()
+    if spans is not None:
+        spans.append((stage, seconds))
+
+
+def start_request_spans() -> contextvars.Token:
+    """Begins collecting spans for the current request."""
+    return _request_spans.set([])
+
+
+def end_request_spans(token: contextvars.Token) -> List[Tuple[str, float]]:
+    """Stops collecting spans and returns what was recorded."""
+    spans = _request_spans.get() or []
+    _request_spans.reset(token)
+    return spans
+
+
+def format_server_timing(spans: List[Tuple[str, float]]) -> str:
+    """Formats spans as a Server-Timing header value (durations in ms)."""
+    totals: Dict[str, float] = {}
+    for name, seconds in spans:
+        totals[name] = totals.get(name, 0.0) + seconds
+    return ", ".join(f"{name};dur={seconds * 1000:.1f}" for name, seconds in totals.items())
+
+
+def render_metrics() -> str:
+    """Renders every registered metric in Prometheus text exposition format."""
+    lines: List[str] = []
+    for metric in _registry:
+        lines.extend(metric.collect())
+    return "\n".join(lines) + "\n"
@@ -2,8 +2,12 @@
 
 import os
 import logging
+import numpy as np
 from typing import Optional, Dict, Any
 
+from engine_workers import is_isolated, get_remote_engine
+from thread_budget import apply_framework_threads
+
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
@@ -15,12 +19,78 @@ MODEL_PATHS = {
     "derma": os.path.join(MODELS_DIR, "dermatologie_mobilenetv2.h5"),
     "surgery": os.path.join(MODELS_DIR, "yolov8n.pt"),
 }
+SURGERY_DETECTOR_WEIGHTS = os.environ.get("SURGERY_DETECTOR_WEIGHTS", "yolov8s.pt")
+
+ONNX_MODEL_PATHS = {
+    "neuro": os.path.join(MODELS_DIR, "neuro_radiologie_resnet50.onnx"),
+    "derma": os.path.join(MODELS_DIR, "dermatologie_mobilenetv2.onnx"),
+}
+
+# Inference backend per Keras model: "keras" (TensorFlow) or "onnx" (ONNX Runtime CPU)
+MODEL_BACKENDS = {
+    "neuro": os.environ.get("NEURO_BACKEND", "keras").lower(),
+    "derma": os.environ.get("DERMA_BACKEND", "keras").lower(),
+}
+
+# Post-training INT8 variants produced by quantize_models.py
+INT8_MODEL_PATHS = {
+    "neuro": os.path.join(MODELS_DIR, "neuro_radiologie_resnet50_int8.onnx"),
+    "derma": os.path.join(MODELS_DIR, "dermatologie_mobilenetv2_int8.onnx"),
+    "surgery": os.path.join(MODELS_DIR, "yolov8s_int8.onnx"),
+}
+
+# Precision variant per department: "fp32" (default) or "int8"
+MODEL_VARIANTS = {
+    "neuro": os.environ.get("NEURO_VARIANT", "fp32").lower(),
+    "derma": os.environ.get("DERMA_VARIANT", "fp32").lower(),
+    "surgery": os.environ.get("SURGERY_VARIANT", "fp32").lower(),
+}
+
+# ImageNet channel means used by ResNet50 'caffe' preprocessing (BGR order)
+RESNET50_MEAN_BGR = np.array([103.939, 116.779, 123.68], dtype=np.float32)
+
+
+def resnet50_preprocess(x: np.ndarray) -> np.ndarray:
+    """NumPy equivalent of keras resnet50.preprocess_input (channel flip + mean subtraction)."""
+    x = np.asarray(x, dtype=np.float32)[..., ::-1]
+    return x - RESNET50_MEAN_BGR
+
+
+def mobilenet_v2_preprocess(x: np.ndarray) -> np.ndarray:
+    """NumPy equivalent of keras mobilenet_v2.preprocess_input (scale to [-1, 1])."""
+    return np.asarray(x, dtype=np.float32) / 127.5 - 1.0
+
+
+class OnnxModel:
+    """Keras-style predict() over an ONNX Runtime CPU session."""
+    
+    def __init__(self, model_path: str, intra_op_threads: int = 0):
+        import onnxruntime as ort
+        
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if intra_op_threads:
+            options.intra_op_num_threads = intra_op_threads
+        
+        self.session = ort.InferenceSession(model_path, sess_options=options, providers=["CPUExecutionProvider"])
+        self.input_name = self.session.get_inputs()[0].name
+        self.model_path = model_path
+    
+    def predict(self, x: np.ndarray, verbose: int = 0, batch_size: Optional[int] = None) -> np.ndarray:
+        x = np.asarray(x, dtype=np.float32)
+        if not batch_size or len(x) <= batch_size:
+            return self.session.run(None, {self.input_name: x})[0]
+        return np.concatenate([
+            self.session.run(None, {self.input_name: x[i:i + batch_size]})[0]
+            for i in range(0, len(x), batch_size)
+        ])
 
 
 def load_tensorflow_model(model_path: str, model_name: str) -> Optional[Any]:
     """Loads a TensorFlow model from path."""
     try:
         from tensorflow import keras
+        apply_framework_threads("tensorflow")
         
         if model_name in _model_cache:
             return _model_cache[model_name]
@@ -39,10 +109,48 @@ def load_tensorflow_model(model_path: str, model_name: str) -> Optional[Any]:
         return None
 
 
+def load_onnx_model(model_path: str, model_name: str, variant: str = "fp32") -> Optional[Any]:
+    """Loads an ONNX model into an ONNX Runtime CPU session."""
+    cache_key = f"{model_name}:onnx:{variant}"
+    if cache_key in _model_cache:
+        return _model_cache[cache_key]
+    
+    if not os.path.exists(model_path):
+        logger.warning(f"ONNX model not found: {model_path}")
+        return None
+    
+    try:
+        logger.info(f"Loading {model_name} (ONNX Runtime, {variant})...")
+        model = OnnxModel(model_path)
+        _model_cache[cache_key] = model
+        return model
+    
+    except Exception as e:
+        logger.error(f"Error loading ONNX {model_name}: {e}")
+        return None
+
+
+def load_model_for_backend(model_name: str) -> Optional[Any]:
+    """Loads a Keras model with its configured variant/backend, falling back to TensorFlow."""
+    if MODEL_VARIANTS.get(model_name) == "int8":
+        model = load_onnx_model(INT8_MODEL_PATHS[model_name], model_name, "int8")
+        if model is not None:
+            return model
+        logger.warning(f"INT8 variant unavailable for {model_name}, using fp32")
+    
+    if MODEL_BACKENDS.get(model_name) == "onnx":
+        model = load_onnx_model(ONNX_MODEL_PATHS[model_name], model_name)
+        if model is not None:
+            return model
+        logger.warning(f"Falling back to TensorFlow for {model_name}")
+    return load_tensorflow_model(MODEL_PATHS[model_name], model_name)
+
+
 def load_yolo_model(model_path: str) -> Optional[Any]:
     """Loads a YOLO model from path."""
     try:
         import torch
+        apply_framework_threads("torch")
         
         if "yolo" in _model_cache:
             return _model_cache["yolo"]
@@ -74,13 +182,17 @@ def load_yolo_model(model_path: str) -> Optional[Any]:
 
 
 def get_neuro_model() -> Optional[Any]:
-    """Gets the Neuro model."""
-    return load_tensorflow_model(MODEL_PATHS["neuro"], "neuro")
+    """Gets the Neuro model (Keras or ONNX Runtime, per NEURO_BACKEND)."""
+    if is_isolated("neuro"):
+        return get_remote_engine("neuro")
+    return load_model_for_backend("neuro")
 
 
 def get_derma_model() -> Optional[Any]:
-    """Gets the Derma model."""
-    return load_tensorflow_model(MODEL_PATHS["derma"], "derma")
+    """Gets the Derma model (Keras or ONNX Runtime, per DERMA_BACKEND)."""
+    if is_isolated("derma"):
+        return get_remote_engine("derma")
+    return load_model_for_backend("derma")
 
 
 def get_surgery_model() -> Optional[Any]:
@@ -88,6 +200,54 @@ def get_surgery_model() -> Optional[Any]:
     return load_yolo_model(MODEL_PATHS["surgery"])
 
 
+def get_surgery_detector() -> Optional[Any]:
+    """Gets the YOLOv8s detector used by the surgery endpoints."""
+    if is_isolated("surgery"):
+        return get_remote_engine("surgery")
+    
+    if "yolov8s" in _model_cache:
+        return _model_cache["yolov8s"]
+    
+    try:
+        import torch
+        from ultralytics import YOLO
+        from ultralytics.nn.tasks import DetectionModel
+        apply_framework_threads("torch")
+        
+        # Allow ultralytics classes for torch.load (PyTorch 2.6+ security)
+        torch.serialization.add_safe_globals([DetectionModel])
+        
+        int8_path = INT8_MODEL_PATHS["surgery"]
+        if MODEL_VARIANTS["surgery"] == "int8" and os.path.exists(int8_path):
+            model = YOLO(int8_path, task="detect")
+            _model_cache["yolov8s"] = model
+            logger.info(f"YOLOv8s INT8 variant loaded from {int8_path}")
+            return model
+        
+        # Using YOLOv8s (small) for better accuracy than nano
+        model = YOLO(SURGERY_DETECTOR_WEIGHTS)
+        _model_cache["yolov8s"] = model
+        logger.info("YOLOv8s (small) loaded - more accurate than nano")
+        return model
+    
+    except Exception as e:
+        # Not cached: the next call retries the load
+        logger.warning(f"YOLOv8 not available: {e}")
+        return None
+
+
+def get_model_variants() -> Dict[str, Dict[str, Any]]:
+    """Returns the configured precision variant per department and whether its file exists."""
+    return {
+        name: {
+            "variant": variant,
+            "backend": "onnx" if variant == "int8" else MODEL_BACKENDS.get(name, "torch"),
+            "int8_available": os.path.exists(INT8_MODEL_PATHS[name])
+        }
+        for name, variant in MODEL_VARIANTS.items()
+    }
+
+
 def get_tesseract_config() -> Dict[str, str]:
     """Gets Tesseract config."""
     return {
@@ -6,6 +6,8 @@ import cv2
 import numpy as np
 import logging
 
+from engine_workers import is_isolated, get_remote_engine
+
 logger = logging.getLogger(__name__)
 
 FRENCH_TO_GENERIC = {
@@ -24,6 +26,8 @@ _reader_instance = None
 def get_ocr_reader():
     """Gets the EasyOCR reader instance."""
     global _reader_instance
+    if is_isolated("ocr"):
+        return get_remote_engine("ocr")
     if _reader_instance is None:
         logger.info("Initializing EasyOCR...")
         _reader_instance = easyocr.Reader(['fr', 'en'], gpu=False)
@@ -124,8 +128,8 @@ def search_drug_online(drug_info):
         "mots_clefs_alertes": ["Consult package insert", "Follow prescribed dosage"]
     }
 
-def process_pharma_image(img_numpy):
-    """Processes image to find medication info."""
+def extract_medication_name(img_numpy):
+    """Runs OCR (CPU-bound) and returns (medication name or None, raw OCR text)."""
     logger.info("Starting OCR processing...")
     
     preprocessed = preprocess_image_for_ocr(img_numpy)
@@ -133,9 +137,14 @@ def process_pharma_image(img_numpy):
     raw_text = reader.readtext(preprocessed, detail=0)
     
     if not raw_text:
-        return {"error": "No text detected", "ocr_raw": []}
+        return None, []
     
-    med_name = clean_ocr_text(raw_text)
+    return clean_ocr_text(raw_text), raw_text
+
+def lookup_medication(med_name, raw_text):
+    """Looks up an OCR'd medication online (blocking I/O)."""
+    if not raw_text:
+        return {"error": "No text detected", "ocr_raw": []}
     
     if not med_name:
         return {"error": "Medication name not found", "ocr_raw": raw_text}
@@ -147,3 +156,8 @@ def process_pharma_image(img_numpy):
         return result
     else:
         return {"error": f"'{med_name}' not found", "nom_detecte": med_name, "ocr_raw": raw_text}
+
+def process_pharma_image(img_numpy):
+    """Processes image to find medication info."""
+    med_name, raw_text = extract_medication_name(img_numpy)
+    return lookup_medication(med_name, raw_text)
@@ -0,0 +1,193 @@
+# Copyright (c) 2025 ot6_j. All Rights Reserved.
+
+"""
+Pre-fork Launcher - Production entry point that loads model weights once in
+a gunicorn master process and then forks the uvicorn worker, so a recycled
+worker starts from the master's weights instead of loading them again.
+
+The master only *loads* PyTorch/ONNX models and never runs them, so no
+inference thread pool exists before fork; each worker sets its thread
+limits and runs its own warm-up after forking. TensorFlow does not support
+fork once its runtime has started, so the Keras models (neuro, derma) are
+never loaded in the master: each worker loads them after fork. Workers are
+recycled gracefully after a number of requests to bound memory growth from
+COW page copies.
+
+Multi-worker mode is not supported: the artifact store's memory tier and
+the job registry (with the jobs running in it) live in the worker's
+memory, so a follow-up request (GET /api/artifacts/{id}, /api/jobs/{id},
+/events, /result) served by another worker would get a 404. The launcher
+refuses WEB_WORKERS > 1 rather than serve those 404s; scale out with
+separate instances behind a load balancer with sticky sessions instead.
+
+Usage:
+    python prefork.py                      # serve
+    python prefork.py --memory-report      # shared/private RSS of a running server
+
+Configuration (environment):
+    HOST=0.0.0.0
+    PORT=8000
+    WEB_WORKERS=1                          # only 1 is supported, see above
+    WORKER_THREADS=2                       # intra-op threads per worker (TF, torch, OpenMP, BLAS)
+    WORKER_MAX_REQUESTS=1000               # 0 disables recycling
+    WORKER_MAX_REQUESTS_JITTER=100
+    WORKER_TIMEOUT=300
+    WORKER_GRACEFUL_TIMEOUT=60
+    PREFORK_PIDFILE=<tmp>/medivision_prefork.pid
+"""
+
+import gc
+import logging
+import os
+import sys
+import tempfile
+from typing import Any, Dict, List
+
+logger = logging.getLogger(__name__)
+
+HOST = os.environ.get("HOST", "0.0.0.0")
+PORT = int(os.environ.get("PORT", "8000"))
+WORKER_THREADS = int(os.environ.get("WORKER_THREADS", "2"))
+WEB_WORKERS = int(os.environ.get("WEB_WORKERS", "1"))
+WORKER_MAX_REQUESTS = int(os.environ.get("WORKER_MAX_REQUESTS", "1000"))
+WORKER_MAX_REQUESTS_JITTER = int(os.environ.get("WORKER_MAX_REQUESTS_JITTER", "100"))
+WORKER_TIMEOUT = int(os.environ.get("WORKER_TIMEOUT", "300"))
+WORKER_GRACEFUL_TIMEOUT = int(os.environ.get("WORKER_GRACEFUL_TIMEOUT", "60"))
+PREFORK_PIDFILE = os.environ.get("PREFORK_PIDFILE", os.path.join(tempfile.gettempdir(), "medivision_prefork.pid"))
+
+# Workers sharing one master; see the module docstring
+MAX_SUPPORTED_WORKERS = 1
+
+# Models that load through TensorFlow (Keras, or its fallback from ONNX): never loaded before fork
+TENSORFLOW_MODELS = ("neuro", "derma")
+
+
+def configure_worker_threads(threads: int = WORKER_THREADS):
+    """Applies a thread budget sized to one worker so N workers do not oversubscribe the cores."""
+    from thread_budget import apply_thread_budget, resolve_budget
+    apply_thread_budget(resolve_budget(threads))
+
+
+def preload_in_master():
+    """Loads fork-safe model weights before fork, then freezes the heap so GC does not dirty shared pages."""
+    from warmup import PRELOAD_MODELS, preload_models
+
+    configure_worker_threads()
+    preload_models(warm_up=False, names=[name for name in PRELOAD_MODELS if name not in TENSORFLOW_MODELS])
+    gc.collect()
+    gc.freeze()
+
+
+def _read_smaps_rollup(pid: int) -> Dict[str, int]:
+    """Returns the memory fields (kB) of /proc/<pid>/smaps_rollup."""
+    fields: Dict[str, int] = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) >= 3 and parts[2] == "kB":
+                fields[parts[0].rstrip(":")] = int(parts[1])
+    return fields
+
+
+def process_memory(pid: int) -> Dict[str, Any]:
+    """Shared vs private resident memory of one process, in MB."""
+    fields = _read_smaps_rollup(pid)
+    shared = fields.get("Shared_Clean", 0) + fields.get("Shared_Dirty", 0)
+    private = fields.get("Private_Clean", 0) + fields.get("Private_Dirty", 0)
+    return {
+        "pid": pid,
+        "rss_mb": round(fields.get("Rss", 0) / 1024, 1),
+        "pss_mb": round(fields.get("Pss", 0) / 1024, 1),
+        "shared_mb": round(shared / 1024, 1),
+        "private_mb": round(private / 1024, 1)
+    }
+
+
+def _child_pids(parent: int) -> List[int]:
+    children = []
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                # Field 4 is the parent pid; the command name may contain spaces
+                ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        if ppid == parent:
+            children.append(int(entry))
+    return sorted(children)
+
+
+def memory_report(master_pid: int) -> Dict[str, Any]:
+    """Per-process memory of the master and its workers, plus the total PSS."""
+    processes = [dict(process_memory(master_pid), role="master")]
+    for pid in _child_pids(master_pid):
+        try:
+            processes.append(dict(process_memory(pid), role="worker"))
+        except OSError:
+            continue
+    return {
+        "master_pid": master_pid,
+        "workers": len(processes) - 1,
+        "total_pss_mb": round(sum(p["pss_mb"] for p in processes), 1),
+        "processes": processes
+    }
+
+
+def print_memory_report(report: Dict[str, Any]):
+    print(f"{'role':<8}{'pid':>8}{'rss MB':>10}{'shared MB':>11}{'private MB':>12}{'pss MB':>10}")
+    for p in report["processes"]:
+        print(f"{p['role']:<8}{p['pid']:>8}{p['rss_mb']:>10.1f}{p['shared_mb']:>11.1f}"
+              f"{p['private_mb']:>12.1f}{p['pss_mb']:>10.1f}")
+    print(f"Total PSS (actual memory used): {report['total_pss_mb']:.1f} MB across {report['workers']} workers")
+
+
+def post_fork(server, worker):
+    """gunicorn hook: runs in each worker right after fork."""
+    configure_worker_threads()
+    logger.info(f"Worker {worker.pid} forked ({WORKER_THREADS} threads)")
+
+
+def run():
+    """Starts gunicorn with uvicorn workers and the app preloaded in the master."""
+    from gunicorn.app.base import BaseApplication
+
+    class PreforkApplication(BaseApplication):
+        def load_config(self):
+            settings = {
+                "bind": f"{HOST}:{PORT}",
+                "workers": WEB_WORKERS,
+                "worker_class": "uvicorn.workers.UvicornWorker",
+                "preload_app": True,
+                "max_requests": WORKER_MAX_REQUESTS,
+                "max_requests_jitter": WORKER_MAX_REQUESTS_JITTER,
+                "timeout": WORKER_TIMEOUT,
+                "graceful_timeout": WORKER_GRACEFUL_TIMEOUT,
+                "pidfile": PREFORK_PIDFILE,
+                "post_fork": post_fork,
+            }
+            for key, value in settings.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            from main import app
+            preload_in_master()
+            return app
+
+    if WEB_WORKERS > MAX_SUPPORTED_WORKERS:
+        raise SystemExit(
+            f"WEB_WORKERS={WEB_WORKERS} is not supported: artifacts and jobs are held per worker, so follow-up "
+            f"requests reaching another worker would 404. Run separate instances with sticky sessions instead."
+        )
+
+    logger.info(f"Starting {WEB_WORKERS} workers on {HOST}:{PORT}")
+    PreforkApplication().run()
+
+
+if __name__ == "__main__":
+    if "--memory-report" in sys.argv:
+        with open(PREFORK_PIDFILE) as f:
+            print_memory_report(memory_report(int(f.read().strip())))
+    else:
+        run()
@@ -0,0 +1,284 @@
+# Copyright (c) 2025 ot6_j. All Rights Reserved.
+
+"""
+Post-training INT8 quantization of the neuro, derma and surgery models.
+
+Images from a local calibration folder drive ONNX Runtime static
+quantization (QDQ, per-channel weights). The Keras models are quantized from
+their fp32 ONNX export (convert_onnx_models.py); the YOLOv8s detector is
+exported to ONNX through ultralytics first. A report compares each INT8
+variant with its float model (agreement) and single-image p50/p95 latency.
+
+Usage:
+    python quantize_models.py --calibration ./calib_images [--eval ./eval_images]
+                              [--models neuro,derma,surgery] [--report models/quantization_report.json]
+Then serve with NEURO_VARIANT=int8 / DERMA_VARIANT=int8 / SURGERY_VARIANT=int8.
+"""
+
+import argparse
+import json
+import os
+import shutil
+import sys
+import time
+from typing import Callable, Dict, List
+
+import cv2
+import numpy as np
+
+from batch_scan import IMAGE_EXTENSIONS
+from video_processor import VIDEO_BATCH_SIZE
+from model_loader import (
+    INT8_MODEL_PATHS,
+    ONNX_MODEL_PATHS,
+    SURGERY_DETECTOR_WEIGHTS,
+    OnnxModel,
+    resnet50_preprocess,
+    mobilenet_v2_preprocess
+)
+
+YOLO_IMGSZ = 640
+LATENCY_REPEATS = 30
+IOU_MATCH = 0.5
+
+
+def load_images(folder: str, limit: int) -> List[np.ndarray]:
+    """Reads up to `limit` BGR images from a folder (sorted by name)."""
+    names = sorted(n for n in os.listdir(folder) if n.lower().endswith(IMAGE_EXTENSIONS))
+    images = []
+    for name in names[:limit]:
+        img = cv2.imread(os.path.join(folder, name))
+        if img is not None:
+            images.append(img)
+    if not images:
+        raise SystemExit(f"No images found in {folder}")
+    return images
+
+
+def keras_input(name: str) -> Callable[[np.ndarray], np.ndarray]:
+    preprocess = resnet50_preprocess if name == "neuro" else mobilenet_v2_preprocess
+    return lambda img: preprocess(np.expand_dims(cv2.resize(img, (224, 224)), axis=0))
+
+
+def yolo_input(img: np.ndarray) -> np.ndarray:
+    """Letterboxes to 640x640 RGB NCHW float32 like the ultralytics predictor."""
+    h, w = img.shape[:2]
+    scale = YOLO_IMGSZ / max(h, w)
+    resized = cv2.resize(img, (int(round(w * scale)), int(round(h * scale))))
+    canvas = np.full((YOLO_IMGSZ, YOLO_IMGSZ, 3), 114, dtype=np.uint8)
+    top = (YOLO_IMGSZ - resized.shape[0]) // 2
+    left = (YOLO_IMGSZ - resized.shape[1]) // 2
+    canvas[top:top + resized.shape[0], left:left + resized.shape[1]] = resized
+    x = canvas[:, :, ::-1].transpose(2, 0, 1)[np.newaxis].astype(np.float32) / 255.0
+    return np.ascontiguousarray(x)
+
+
+def quantize(fp32_path: str, int8_path: str, samples: List[np.ndarray]):
+    """Runs ONNX Runtime static quantization with the given calibration inputs."""
+    from onnxruntime.quantization import (
+        CalibrationDataReader, QuantFormat, QuantType, quantize_static
+    )
+    from onnxruntime.quantization.shape_inference import quant_pre_process
+
+    class Reader(CalibrationDataReader):
+        def __init__(self):
+            self.input_name = OnnxModel(fp32_path).input_name
+            self.samples = iter(samples)
+
+        def get_next(self):
+            x = next(self.samples, None)
+            return None if x is None else {self.input_name: x}
+
+    prepared_path = fp32_path.replace(".onnx", "_prep.onnx")
+    quant_pre_process(fp32_path, prepared_path)
+    try:
+        quantize_static(
+            prepared_path, int8_path, Reader(),
+            quant_format=QuantFormat.QDQ,
+            per_channel=True,
+            activation_type=QuantType.QUInt8,
+            weight_type=QuantType.QInt8
+        )
+    finally:
+        os.remove(prepared_path)
+
+    copy_metadata(fp32_path, int8_path)
+    print(f"INT8 model written to {int8_path}")
+
+
+def copy_metadata(src_path: str, dst_path: str):
+    """Keeps model metadata (ultralytics stores class names/stride there)."""
+    import onnx
+
+    src = onnx.load(src_path)
+    dst = onnx.load(dst_path)
+    existing = {p.key for p in dst.metadata_props}
+    for prop in src.metadata_props:
+        if prop.key not in existing:
+            dst.metadata_props.add(key=prop.key, value=prop.value)
+    onnx.save(dst, dst_path)
+
+
+def latency_ms(fn: Callable[[], object], repeats: int = LATENCY_REPEATS) -> Dict[str, float]:
+    """Single-call latency percentiles after one warm-up call."""
+    fn()
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    return {
+        "p50_ms": round(float(np.percentile(timings, 50)), 2),
+        "p95_ms": round(float(np.percentile(timings, 95)), 2)
+    }
+
+
+def quantize_keras_model(name: str, calibration: List[np.ndarray], evaluation: List[np.ndarray]) -> Dict:
+    """Quantizes one Keras model and compares it with the fp32 ONNX export."""
+    if not os.path.exists(ONNX_MODEL_PATHS[name]):
+        from convert_onnx_models import export_model
+        export_model(name)
+
+    make_input = keras_input(name)
+    quantize(ONNX_MODEL_PATHS[name], INT8_MODEL_PATHS[name], [make_input(img) for img in calibration])
+
+    fp32 = OnnxModel(ONNX_MODEL_PATHS[name])
+    int8 = OnnxModel(INT8_MODEL_PATHS[name])
+
+    inputs = np.concatenate([make_input(img) for img in evaluation])
+    expected = fp32.predict(inputs)
+    actual = int8.predict(inputs)
+
+    return {
+        "model": name,
+        "float": ONNX_MODEL_PATHS[name],
+        "int8": INT8_MODEL_PATHS[name],
+        "eval_images": len(evaluation),
+        "top1_agreement": round(float(np.mean(expected.argmax(axis=1) == actual.argmax(axis=1))), 4),
+        "max_abs_prob_diff": round(float(np.max(np.abs(expected - actual))), 4),
+        "float_latency": latency_ms(lambda: fp32.predict(inputs[:1])),
+        "int8_latency": latency_ms(lambda: int8.predict(inputs[:1])),
+        "size_mb": {
+            "float": round(os.path.getsize(ONNX_MODEL_PATHS[name]) / 1e6, 1),
+            "int8": round(os.path.getsize(INT8_MODEL_PATHS[name]) / 1e6, 1)
+        }
+    }
+
+
+def box_iou(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """Pairwise IoU of xyxy boxes."""
+    tl = np.maximum(a[:, None, :2], b[None, :, :2])
+    br = np.minimum(a[:, None, 2:], b[None, :, 2:])
+    inter = np.prod(np.clip(br - tl, 0, None), axis=2)
+    area_a = np.prod(a[:, 2:] - a[:, :2], axis=1)
+    area_b = np.prod(b[:, 2:] - b[:, :2], axis=1)
+    return inter / (area_a[:, None] + area_b[None, :] - inter + 1e-9)
+
+
+def match_detections(reference, candidate) -> int:
+    """Greedy same-class matches at IoU >= IOU_MATCH."""
+    ref_boxes = reference.boxes.xyxy.cpu().numpy()
+    cand_boxes = candidate.boxes.xyxy.cpu().numpy()
+    if len(ref_boxes) == 0 or len(cand_boxes) == 0:
+        return 0
+
+    ref_cls = reference.boxes.cls.cpu().numpy()
+    cand_cls = candidate.boxes.cls.cpu().numpy()
+    iou = box_iou(ref_boxes, cand_boxes)
+    iou[ref_cls[:, None] != cand_cls[None, :]] = 0
+
+    matched = 0
+    while iou.size and iou.max() >= IOU_MATCH:
+        i, j = np.unravel_index(np.argmax(iou), iou.shape)
+        iou[i, :] = 0
+        iou[:, j] = 0
+        matched += 1
+    return matched
+
+
+def quantize_surgery_model(calibration: List[np.ndarray], evaluation: List[np.ndarray]) -> Dict:
+    """Exports YOLOv8s to ONNX, quantizes it and compares detections with the float detector."""
+    from ultralytics import YOLO
+
+    float_model = YOLO(SURGERY_DETECTOR_WEIGHTS)
+    # Dynamic axes: video analysis sends VIDEO_BATCH_SIZE frames per call (a static export only takes 1)
+    exported = float_model.export(format="onnx", imgsz=YOLO_IMGSZ, dynamic=True, simplify=True)
+    fp32_path = INT8_MODEL_PATHS["surgery"].replace("_int8", "")
+    if os.path.abspath(exported) != os.path.abspath(fp32_path):
+        shutil.move(exported, fp32_path)
+
+    quantize(fp32_path, INT8_MODEL_PATHS["surgery"], [yolo_input(img) for img in calibration])
+    int8_model = YOLO(INT8_MODEL_PATHS["surgery"], task="detect")
+
+    # Evaluated in video-sized batches, so the report also proves the INT8 model takes them
+    reference_count = candidate_count = matched = 0
+    for start in range(0, len(evaluation), VIDEO_BATCH_SIZE):
+        batch = evaluation[start:start + VIDEO_BATCH_SIZE]
+        references = float_model.predict(batch, verbose=False)
+        candidates = int8_model.predict(batch, verbose=False)
+        for reference, candidate in zip(references, candidates):
+            reference_count += len(reference.boxes)
+            candidate_count += len(candidate.boxes)
+            matched += match_detections(reference, candidate)
+
+    precision = matched / candidate_count if candidate_count else 1.0
+    recall = matched / reference_count if reference_count else 1.0
+    sample = evaluation[0]
+
+    return {
+        "model": "surgery",
+        "float": SURGERY_DETECTOR_WEIGHTS,
+        "int8": INT8_MODEL_PATHS["surgery"],
+        "eval_images": len(evaluation),
+        "batch_size": VIDEO_BATCH_SIZE,
+        "detections": {"float": reference_count, "int8": candidate_count, "matched": matched},
+        "detection_agreement_f1": round(2 * precision * recall / (precision + recall), 4) if matched else 0.0,
+        "float_latency": latency_ms(lambda: float_model.predict(sample, verbose=False)),
+        "int8_latency": latency_ms(lambda: int8_model.predict(sample, verbose=False)),
+        "size_mb": {
+            "float": round(os.path.getsize(fp32_path) / 1e6, 1),
+            "int8": round(os.path.getsize(INT8_MODEL_PATHS["surgery"]) / 1e6, 1)
+        }
+    }
+
+
+def print_report(report: List[Dict]):
+    print(f"\n{'model':<10}{'agreement':>11}{'float p50/p95 ms':>20}{'int8 p50/p95 ms':>20}{'size MB':>14}")
+    for entry in report:
+        agreement = entry.get("top1_agreement", entry.get("detection_agreement_f1"))
+        f, q = entry["float_latency"], entry["int8_latency"]
+        print(f"{entry['model']:<10}{agreement:>11.2%}"
+              f"{f['p50_ms']:>11.1f} / {f['p95_ms']:<6.1f}"
+              f"{q['p50_ms']:>11.1f} / {q['p95_ms']:<6.1f}"
+              f"{entry['size_mb']['float']:>7.1f}->{entry['size_mb']['int8']:<6.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="INT8 post-training quantization")
+    parser.add_argument("--calibration", required=True, help="folder of representative images")
+    parser.add_argument("--eval", help="folder of evaluation images (default: calibration folder)")
+    parser.add_argument("--models", default="neuro,derma,surgery")
+    parser.add_argument("--limit", type=int, default=200, help="max images per folder")
+    parser.add_argument("--report", default=os.path.join(os.path.dirname(INT8_MODEL_PATHS["neuro"]), "quantization_report.json"))
+    args = parser.parse_args()
+
+    calibration_images = load_images(args.calibration, args.limit)
+    evaluation_images = load_images(args.eval, args.limit) if args.eval else calibration_images
+    print(f"Calibration images: {len(calibration_images)}, evaluation images: {len(evaluation_images)}")
+
+    results = []
+    for model_name in [m.strip() for m in args.models.split(",") if m.strip()]:
+        print(f"\nQuantizing {model_name}...")
+        if model_name == "surgery":
+            results.append(quantize_surgery_model(calibration_images, evaluation_images))
+        elif model_name in ONNX_MODEL_PATHS:
+            results.append(quantize_keras_model(model_name, calibration_images, evaluation_images))
+        else:
+            print(f"Unknown model '{model_name}'")
+            sys.exit(1)
+
+    with open(args.report, "w") as f:
+        json.dump(results, f, indent=2)
+
+    print_report(results)
+    print(f"\nReport written to {args.report}")
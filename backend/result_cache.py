@@ -0,0 +1,294 @@
+# Copyright (c) 2025 ot6_j. All Rights Reserved.
+
+"""
+Result Cache - Content-addressed LRU/TTL cache for scan responses.
+Keys are the SHA-256 of the uploaded bytes plus the endpoint and its parameters,
+so a re-submitted image is served without re-running ResNet, CLIP, YOLO or OCR.
+Failed scans ({"status": "FAILED", ...}) are returned but not cached.
+
+Configuration (environment):
+    RESULT_CACHE_ENABLED=1
+    RESULT_CACHE_TTL_S=900
+    RESULT_CACHE_MAX_BYTES=268435456        # in-memory bound (256 MB)
+    RESULT_CACHE_DIR=                       # optional disk tier
+    RESULT_CACHE_DISK_MAX_BYTES=1073741824
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from executors import get_executor, run_in_department
+from metrics import Gauge, register
+
+logger = logging.getLogger(__name__)
+
+RESULT_CACHE_ENABLED = os.environ.get("RESULT_CACHE_ENABLED", "1") != "0"
+RESULT_CACHE_TTL_S = float(os.environ.get("RESULT_CACHE_TTL_S", "900"))
+RESULT_CACHE_MAX_BYTES = int(os.environ.get("RESULT_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+RESULT_CACHE_DIR = os.environ.get("RESULT_CACHE_DIR", "")
+RESULT_CACHE_DISK_MAX_BYTES = int(os.environ.get("RESULT_CACHE_DISK_MAX_BYTES", str(1024 * 1024 * 1024)))
+
+# Larger uploads are hashed on the io pool (hashlib releases the GIL) instead of the event loop
+INLINE_HASH_MAX_BYTES = 64 * 1024
+
+
+class LeaderCancelledError(Exception):
+    """Delivered to coalesced waiters when the request computing their value is cancelled."""
+
+
+def is_cacheable(value: Any) -> bool:
+    """Failed scan responses are not cached, so a retry recomputes them."""
+    return not (isinstance(value, dict) and value.get("status") == "FAILED")
+
+
+def make_cache_key(endpoint: str, contents: bytes, **params) -> str:
+    """Builds a cache key from the upload digest, endpoint and parameters."""
+    digest = hashlib.sha256(contents).hexdigest()
+    param_str = "&".join(f"{k}={params[k]}" for k in sorted(params))
+    return hashlib.sha256(f"{endpoint}|{digest}|{param_str}".encode("utf-8")).hexdigest()
+
+
+class ResultCache:
+    """
+    In-memory LRU with TTL and a byte budget, an optional on-disk tier,
+    and single-flight de-duplication of identical in-flight computations.
+    """
+
+    def __init__(self, max_bytes: int = RESULT_CACHE_MAX_BYTES, ttl_s: float = RESULT_CACHE_TTL_S,
+                 disk_dir: str = RESULT_CACHE_DIR, disk_max_bytes: int = RESULT_CACHE_DISK_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.ttl_s = ttl_s
+        self.disk_dir = disk_dir or None
+        self.disk_max_bytes = disk_max_bytes
+
+        # key -> (expires_at, size_bytes, value)
+        self._entries: "OrderedDict[str, Tuple[float, int, Any]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._inflight: Dict[str, asyncio.Future] = {}
+
+        self.stats = {"hits": 0, "disk_hits": 0, "misses": 0, "coalesced": 0, "takeovers": 0, "evictions": 0,
+                      "expired": 0}
+
+        if self.disk_dir:
+            os.makedirs(self.disk_dir, exist_ok=True)
+
+    def get(self, key: str) -> Optional[Any]:
+        """Returns a cached value (memory, then disk) or None."""
+        value = self._memory_get(key)
+        if value is None:
+            value = self._promote(key, self._disk_get(key, time.time()))
+        return value
+
+    def _memory_get(self, key: str) -> Optional[Any]:
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, size, value = entry
+                if expires_at > now:
+                    self._entries.move_to_end(key)
+                    self.stats["hits"] += 1
+                    return value
+                del self._entries[key]
+                self._bytes -= size
+                self.stats["expired"] += 1
+        return None
+
+    def _promote(self, key: str, value: Optional[Any]) -> Optional[Any]:
+        """Moves a disk-tier hit back into memory."""
+        if value is not None:
+            self.stats["disk_hits"] += 1
+            self._memory_put(key, value, self._serialize(value))
+        return value
+
+    def put(self, key: str, value: Any):
+        """Stores a value in memory (and on disk when the disk tier is enabled)."""
+        if not is_cacheable(value):
+            return
+        payload = self._serialize(value)
+        self._memory_put(key, value, payload)
+        self._disk_put(key, payload)
+
+    def _serialize(self, value: Any) -> bytes:
+        return json.dumps(value, default=str).encode("utf-8")
+
+    def _memory_put(self, key: str, value: Any, payload: bytes):
+        size = len(payload)
+        if size > self.max_bytes:
+            return
+
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+
+            self._entries[key] = (time.time() + self.ttl_s, size, value)
+            self._bytes += size
+
+            while self._bytes > self.max_bytes and self._entries:
+                _, (_, evicted_size, _) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+                self.stats["evictions"] += 1
+
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, f"{key}.json")
+
+    def _disk_get(self, key: str, now: float) -> Optional[Any]:
+        if not self.disk_dir:
+            return None
+
+        path = self._disk_path(key)
+        try:
+            if os.path.getmtime(path) + self.ttl_s <= now:
+                os.unlink(path)
+                return None
+            with open(path, "rb") as f:
+                return json.loads(f.read())
+        except (OSError, ValueError):
+            return None
+
+    def _disk_put(self, key: str, payload: bytes):
+        if not self.disk_dir or len(payload) > self.disk_max_bytes:
+            return
+
+        try:
+            tmp_path = self._disk_path(key) + ".tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(payload)
+            os.replace(tmp_path, self._disk_path(key))
+            self._disk_gc()
+        except OSError as e:
+            logger.warning(f"Result cache disk write failed: {e}")
+
+    def _disk_gc(self):
+        """Removes the oldest files until the disk tier fits its budget."""
+        files = []
+        total = 0
+        for name in os.listdir(self.disk_dir):
+            if not name.endswith(".json"):
+                continue
+            path = os.path.join(self.disk_dir, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, path))
+            total += stat.st_size
+
+        for _, size, path in sorted(files):
+            if total <= self.disk_max_bytes:
+                break
+            try:
+                os.unlink(path)
+                total -= size
+            except OSError:
+                pass
+
+    async def get_or_compute(self, key: str, compute: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Returns the cached value for `key`, or runs `compute()` once even if
+        several identical requests arrive while it is in flight. If the
+        computing request is cancelled (client gone), one of the waiting
+        requests takes over and runs its own `compute()`.
+        """
+        value = self._memory_get(key)
+        if value is None and self.disk_dir:
+            value = self._promote(key, await run_in_department("io", self._disk_get, key, time.time()))
+        if value is not None:
+            return value
+
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            self.stats["coalesced"] += 1
+            try:
+                return await asyncio.shield(inflight)
+            except LeaderCancelledError:
+                # The first waiter to wake finds no computation in flight and starts one
+                self.stats["takeovers"] += 1
+                return await self.get_or_compute(key, compute)
+
+        self.stats["misses"] += 1
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            value = await compute()
+            if is_cacheable(value):
+                payload = self._serialize(value)
+                self._memory_put(key, value, payload)
+                if self.disk_dir:
+                    get_executor("io").submit(self._disk_put, key, payload)
+            future.set_result(value)
+            return value
+        except asyncio.CancelledError:
+            # Waiters are still connected: let them retry rather than cancelling them too
+            future.set_exception(LeaderCancelledError())
+            future.exception()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Mark retrieved so an un-awaited failure does not log a warning
+            future.exception()
+            raise
+        finally:
+            del self._inflight[key]
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Returns hit/miss counters and current occupancy."""
+        lookups = self.stats["hits"] + self.stats["disk_hits"] + self.stats["misses"]
+        return {
+            **self.stats,
+            "hit_ratio": round((self.stats["hits"] + self.stats["disk_hits"]) / lookups, 3) if lookups else 0.0,
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "ttl_s": self.ttl_s,
+            "disk_dir": self.disk_dir,
+            "inflight": len(self._inflight)
+        }
+
+    def clear(self):
+        """Drops all in-memory entries."""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+
+_result_cache: Optional[ResultCache] = None
+
+
+def get_result_cache() -> ResultCache:
+    """Gets the shared scan result cache."""
+    global _result_cache
+    if _result_cache is None:
+        _result_cache = ResultCache()
+    return _result_cache
+
+
+async def cached_scan(endpoint: str, contents: bytes, compute: Callable[[], Awaitable[Any]], **params) -> Any:
+    """Serves a scan response from the cache, computing it on a miss."""
+    if not RESULT_CACHE_ENABLED:
+        return await compute()
+    if len(contents) <= INLINE_HASH_MAX_BYTES:
+        key = make_cache_key(endpoint, contents, **params)
+    else:
+        key = await run_in_department("io", make_cache_key, endpoint, contents, **params)
+    return await get_result_cache().get_or_compute(key, compute)
+
+
+register(Gauge(
+    "medivision_result_cache_events_total", "Result cache hits, misses, coalesced requests and evictions.",
+    ("event",), metric_type="counter",
+    callback=lambda: {(event,): count for event, count in get_result_cache().stats.items()}
+))
+register(Gauge(
+    "medivision_result_cache_bytes", "Bytes held by the in-memory result cache.",
+    callback=lambda: {(): get_result_cache().get_stats()["bytes"]}
+))
@@ -27,7 +27,7 @@ def get_available_logos():
             if f.endswith(("_logo.jpg", "_logo.png"))]
 
 
-def check_authenticity(input_img_numpy, medicine_name=None):
+def check_authenticity(input_img_numpy, medicine_name=None, with_visual_proof=True, proof_encoder=None):
     """
     Uses ORB (Feature Matching) to verify if an official logo
     is present on the medicine package.
@@ -35,6 +35,9 @@ def check_authenticity(input_img_numpy, medicine_name=None):
     Args:
         input_img_numpy: BGR image as numpy array
         medicine_name: Optional name to find specific reference logo
+        with_visual_proof: If False, the match visualization is not drawn or encoded
+        proof_encoder: Optional callable(image) -> str used instead of an inline
+            base64 data URI (e.g. to store the image as an artifact)
     
     Returns:
         dict with verification results
@@ -142,18 +145,23 @@ def check_authenticity(input_img_numpy, medicine_name=None):
         confidence = max(0, int((len(good_matches) / 8) * 30))
 
     # 11. Draw matches visualization
-    img_matches = cv2.drawMatches(
-        ref_img, kp1, 
-        input_gray, kp2, 
-        good_matches[:20], None, 
-        matchColor=(0, 255, 0),
-        singlePointColor=(255, 0, 0),
-        flags=cv2.DrawMatchesFlags_NOT_DRAW_SINGLE_POINTS
-    )
-    
-    # Encode visualization to base64
-    _, buffer = cv2.imencode('.jpg', img_matches)
-    visual_proof_b64 = base64.b64encode(buffer).decode('utf-8')
+    visual_proof = None
+    if with_visual_proof:
+        img_matches = cv2.drawMatches(
+            ref_img, kp1, 
+            input_gray, kp2, 
+            good_matches[:20], None, 
+            matchColor=(0, 255, 0),
+            singlePointColor=(255, 0, 0),
+            flags=cv2.DrawMatchesFlags_NOT_DRAW_SINGLE_POINTS
+        )
+        
+        if proof_encoder is not None:
+            visual_proof = proof_encoder(img_matches)
+        else:
+            # Encode visualization to base64
+            _, buffer = cv2.imencode('.jpg', img_matches)
+            visual_proof = f"data:image/jpeg;base64,{base64.b64encode(buffer).decode('utf-8')}"
 
     logger.info(f"Authenticity check: {status} with {len(good_matches)} matches")
 
@@ -167,7 +175,7 @@ def check_authenticity(input_img_numpy, medicine_name=None):
         "keypoints_ref": len(kp1),
         "keypoints_input": len(kp2),
         "reference_used": os.path.basename(reference_logo_path),
-        "visual_proof": f"data:image/jpeg;base64,{visual_proof_b64}"
+        "visual_proof": visual_proof
     }
 
 
@@ -32,3 +32,43 @@ def check_visibility(img_bgr):
     
     is_smoke_or_blur = sharpness < 100
     return is_smoke_or_blur, sharpness
+
+def _stack_frames(frames):
+    """Stacks same-size frames vertically so per-pixel ops run once per batch; None if sizes differ."""
+    if len(frames) < 2 or any(f.shape != frames[0].shape for f in frames):
+        return None
+    return np.concatenate(frames, axis=0)
+
+def detect_hemorrhage_batch(frames, threshold_percent=15.0):
+    """detect_hemorrhage over a batch: one color conversion and threshold pass for all frames."""
+    stacked = _stack_frames(frames)
+    if stacked is None:
+        return [detect_hemorrhage(f, threshold_percent) for f in frames]
+    
+    hsv = cv2.cvtColor(stacked, cv2.COLOR_BGR2HSV)
+    
+    mask1 = cv2.inRange(hsv, np.array([0, 120, 70]), np.array([10, 255, 255]))
+    mask2 = cv2.inRange(hsv, np.array([170, 120, 70]), np.array([180, 255, 255]))
+    masks = (mask1 | mask2).reshape(len(frames), frames[0].shape[0], frames[0].shape[1])
+    
+    total_pixels = frames[0].shape[0] * frames[0].shape[1]
+    blood_percents = np.count_nonzero(masks.reshape(len(frames), -1), axis=1) / total_pixels * 100
+    
+    return [
+        (bool(pct > threshold_percent), float(pct), mask)
+        for pct, mask in zip(blood_percents, masks)
+    ]
+
+def check_visibility_batch(frames):
+    """check_visibility over a batch: one grayscale conversion, Laplacian per frame (no bleed across frames)."""
+    stacked = _stack_frames(frames)
+    if stacked is None:
+        return [check_visibility(f) for f in frames]
+    
+    grays = cv2.cvtColor(stacked, cv2.COLOR_BGR2GRAY).reshape(len(frames), frames[0].shape[0], frames[0].shape[1])
+    
+    results = []
+    for gray in grays:
+        sharpness = cv2.Laplacian(gray, cv2.CV_64F).var()
+        results.append((sharpness < 100, sharpness))
+    return results
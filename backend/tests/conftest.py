@@ -0,0 +1,7 @@
+# Copyright (c) 2025 ot6_j. All Rights Reserved.
+
+import os
+import sys
+
+# Backend modules are imported flat, as main.py does
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
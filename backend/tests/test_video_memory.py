@@ -0,0 +1,74 @@
+# Copyright (c) 2025 ot6_j. All Rights Reserved.
+
+"""
+Full-video processing must run in constant memory: the traced peak of a
+video 4x as long stays within 1.5x of the short one's (as checked by
+`python benchmark_video.py --memory` with the real detector).
+"""
+
+import os
+import tempfile
+import tracemalloc
+
+import pytest
+
+cv2 = pytest.importorskip("cv2")
+np = pytest.importorskip("numpy")
+pytest.importorskip("imageio")
+
+from frame_analytics import get_blood_lut  # noqa: E402
+from video_processor import process_full_video  # noqa: E402
+from video_upload import remove_file  # noqa: E402
+
+FPS = 30
+SIZE = (320, 240)
+SHORT_S = 4
+MAX_PEAK_RATIO = 1.5
+
+
+class StubResult:
+    boxes = ()
+
+
+class StubDetector:
+    """Stands in for the YOLO model: no detections, no weights."""
+
+    def predict(self, frames, **kwargs):
+        return [StubResult() for _ in frames]
+
+
+def write_video(seconds):
+    fd, path = tempfile.mkstemp(suffix=".mp4")
+    os.close(fd)
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"mp4v"), FPS, SIZE)
+    rng = np.random.default_rng(0)
+    base = rng.integers(0, 256, (SIZE[1], SIZE[0], 3), dtype=np.uint8)
+    for i in range(seconds * FPS):
+        writer.write(np.roll(base, i * 4, axis=1))
+    writer.release()
+    return path
+
+
+def peak_bytes(seconds):
+    path = write_video(seconds)
+    tracemalloc.start()
+    try:
+        result = process_full_video(path, StubDetector(), target_fps=10, segment_workers=0,
+                                    tracking=False, adaptive=False)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+        remove_file(path)
+    remove_file(result["video_path"])
+    assert result["total_seconds"] >= seconds - 1
+    return peak
+
+
+def test_peak_memory_does_not_grow_with_video_length():
+    # One-time allocations (lookup table, codec and pipeline setup) stay out of the comparison
+    get_blood_lut()
+    peak_bytes(1)
+
+    short = peak_bytes(SHORT_S)
+    long = peak_bytes(SHORT_S * 4)
+    assert long <= short * MAX_PEAK_RATIO, f"peak {long / 1e6:.1f} MB vs {short / 1e6:.1f} MB"
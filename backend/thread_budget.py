@@ -0,0 +1,276 @@
+# Copyright (c) 2025 ot6_j. All Rights Reserved.
+
+"""
+Thread Budget - One place that sizes the thread pools of every engine in the
+process (TensorFlow intra/inter-op, PyTorch, OpenCV, OpenMP/BLAS) and
+optionally pins the process to a CPU set. Without it each library sizes its
+pool to all cores and concurrent requests oversubscribe the CPU.
+
+The budget is applied at startup before any framework initialises (TF only
+honours its settings before its runtime starts) and re-applied by
+model_loader right after a framework is imported.
+
+Usage:
+    python thread_budget.py --sweep [--duration 10] [--concurrency 4]
+        benchmarks a grid of splits and reports the throughput-optimal one
+
+Configuration (environment):
+    THREADS_TOTAL=<cpu count>        # basis for the defaults below
+    THREADS_TF_INTRA=<total / 2>
+    THREADS_TF_INTER=1
+    THREADS_TORCH=<total / 4>
+    THREADS_TORCH_INTEROP=1
+    THREADS_OPENCV=1
+    THREADS_BLAS=1                   # OMP / OpenBLAS / MKL
+    CPU_AFFINITY=                    # e.g. 0-7 or 0,2,4,6
+"""
+
+import itertools
+import json
+import logging
+import os
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+BUDGET_KEYS = ("tf_intra", "tf_inter", "torch", "torch_interop", "opencv", "blas")
+
+_applied: Dict[str, Any] = {}
+
+
+def _cpu_count() -> int:
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def parse_cpu_set(spec: str) -> Set[int]:
+    """Parses '0-3,6' into {0, 1, 2, 3, 6}."""
+    cpus: Set[int] = set()
+    for part in spec.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        start, _, end = part.partition("-")
+        cpus.update(range(int(start), int(end or start) + 1))
+    return cpus
+
+
+def resolve_budget(total: Optional[int] = None) -> Dict[str, Any]:
+    """Default split of `total` threads (cpu count by default), overridden by THREADS_* env."""
+    total = total or int(os.environ.get("THREADS_TOTAL", "0")) or _cpu_count()
+    budget = {
+        "tf_intra": max(1, total // 2),
+        "tf_inter": 1,
+        "torch": max(1, total // 4),
+        "torch_interop": 1,
+        "opencv": 1,
+        "blas": 1,
+    }
+    for key in BUDGET_KEYS:
+        raw = os.environ.get(f"THREADS_{key.upper()}")
+        if raw:
+            budget[key] = max(1, int(raw))
+    budget["affinity"] = os.environ.get("CPU_AFFINITY", "") or None
+    return budget
+
+
+def _apply_tensorflow(budget: Dict[str, Any]):
+    import tensorflow as tf
+    try:
+        tf.config.threading.set_intra_op_parallelism_threads(budget["tf_intra"])
+        tf.config.threading.set_inter_op_parallelism_threads(budget["tf_inter"])
+    except RuntimeError:
+        # Runtime already initialised; the env vars set earlier took effect (or not) at that point
+        logger.debug("TensorFlow threads already fixed for this process")
+
+
+def _apply_torch(budget: Dict[str, Any]):
+    import torch
+    torch.set_num_threads(budget["torch"])
+    try:
+        torch.set_num_interop_threads(budget["torch_interop"])
+    except RuntimeError:
+        # Can only be set once, before any inter-op work
+        pass
+
+
+def _apply_opencv(budget: Dict[str, Any]):
+    import cv2
+    cv2.setNumThreads(budget["opencv"])
+
+
+FRAMEWORK_APPLIERS = {
+    "tensorflow": _apply_tensorflow,
+    "torch": _apply_torch,
+    "cv2": _apply_opencv,
+}
+
+
+def apply_thread_budget(budget: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    Applies a budget to this process: environment for runtimes not yet started,
+    direct calls for frameworks already imported, and CPU affinity.
+    """
+    global _applied
+    budget = dict(budget or resolve_budget())
+
+    os.environ["TF_NUM_INTRAOP_THREADS"] = str(budget["tf_intra"])
+    os.environ["TF_NUM_INTEROP_THREADS"] = str(budget["tf_inter"])
+    for name in ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS"):
+        os.environ[name] = str(budget["blas"])
+
+    if budget.get("affinity"):
+        try:
+            os.sched_setaffinity(0, parse_cpu_set(budget["affinity"]))
+        except (AttributeError, OSError, ValueError) as e:
+            logger.warning(f"CPU affinity {budget['affinity']!r} not applied: {e}")
+
+    _applied = budget
+    for module, applier in FRAMEWORK_APPLIERS.items():
+        if module in sys.modules:
+            apply_framework_threads(module)
+
+    logger.info(f"Thread budget: {budget}")
+    return budget
+
+
+def apply_framework_threads(framework: str):
+    """Re-applies the active budget to a framework right after it is imported."""
+    budget = _applied or apply_thread_budget()
+    try:
+        FRAMEWORK_APPLIERS[framework](budget)
+    except Exception as e:
+        logger.warning(f"Thread budget not applied to {framework}: {e}")
+
+
+def get_thread_budget() -> Dict[str, Any]:
+    """Active budget plus the values each imported framework reports."""
+    effective: Dict[str, Any] = {}
+    if "tensorflow" in sys.modules:
+        import tensorflow as tf
+        effective["tf_intra"] = tf.config.threading.get_intra_op_parallelism_threads()
+        effective["tf_inter"] = tf.config.threading.get_inter_op_parallelism_threads()
+    if "torch" in sys.modules:
+        import torch
+        effective["torch"] = torch.get_num_threads()
+        effective["torch_interop"] = torch.get_num_interop_threads()
+    if "cv2" in sys.modules:
+        import cv2
+        effective["opencv"] = cv2.getNumThreads()
+    try:
+        effective["affinity"] = sorted(os.sched_getaffinity(0))
+    except AttributeError:
+        pass
+
+    return {"budget": dict(_applied), "effective": effective, "cpus": _cpu_count()}
+
+
+# ---------------------------------------------------------------------------
+# Benchmark sweep
+# ---------------------------------------------------------------------------
+
+def _benchmark_one(budget: Dict[str, Any], concurrency: int, duration: float) -> Dict[str, Any]:
+    """Runs a mixed neuro (TF) / surgery (torch) / OpenCV load under one budget."""
+    import numpy as np
+
+    apply_thread_budget(budget)
+    import cv2
+    from model_loader import get_neuro_model, get_surgery_detector
+    apply_framework_threads("cv2")
+
+    neuro = get_neuro_model()
+    detector = get_surgery_detector()
+    image = np.random.default_rng(0).integers(0, 256, (720, 1280, 3), dtype=np.uint8)
+    tensor = np.zeros((1, 224, 224, 3), dtype=np.float32)
+
+    def request(i: int):
+        blurred = cv2.GaussianBlur(cv2.resize(image, (640, 360)), (5, 5), 0)
+        if i % 2 == 0 and neuro is not None:
+            neuro.predict(tensor, verbose=0)
+        elif detector is not None:
+            detector.predict(blurred, verbose=False)
+
+    for i in range(2):
+        request(i)
+
+    latencies: List[float] = []
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def client(offset: int):
+        i = offset
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            request(i)
+            with lock:
+                latencies.append(time.perf_counter() - start)
+            i += 1
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(client, range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "budget": budget,
+        "requests": len(latencies),
+        "throughput_rps": round(len(latencies) / elapsed, 2),
+        "p50_ms": round(latencies[len(latencies) // 2] * 1000, 1) if latencies else None,
+        "p99_ms": round(latencies[int(len(latencies) * 0.99)] * 1000, 1) if latencies else None
+    }
+
+
+def sweep(concurrency: int, duration: float) -> List[Dict[str, Any]]:
+    """Benchmarks a grid of splits, each in a fresh process (TF threads are fixed per process)."""
+    total = _cpu_count()
+    sizes = sorted({1, max(1, total // 4), max(1, total // 2), total})
+    results = []
+
+    for tf_intra, torch_threads, opencv in itertools.product(sizes, sizes[:-1] or sizes, (1, max(1, total // 4))):
+        budget = {**resolve_budget(total), "tf_intra": tf_intra, "torch": torch_threads, "opencv": opencv}
+        proc = subprocess.run(
+            [sys.executable, __file__, "--bench-one", json.dumps(budget),
+             "--concurrency", str(concurrency), "--duration", str(duration)],
+            capture_output=True, text=True
+        )
+        if proc.returncode != 0:
+            print(f"{budget}: failed\n{proc.stderr[-500:]}")
+            continue
+        result = json.loads(proc.stdout.strip().splitlines()[-1])
+        results.append(result)
+        print(f"tf_intra={tf_intra:<3} torch={torch_threads:<3} opencv={opencv:<3} "
+              f"{result['throughput_rps']:>7.2f} req/s  p50 {result['p50_ms']} ms  p99 {result['p99_ms']} ms")
+
+    return sorted(results, key=lambda r: r["throughput_rps"], reverse=True)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Thread budget benchmark")
+    parser.add_argument("--sweep", action="store_true")
+    parser.add_argument("--bench-one", help=argparse.SUPPRESS)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--duration", type=float, default=10.0)
+    args = parser.parse_args()
+
+    if args.bench_one:
+        logging.disable(logging.WARNING)
+        print(json.dumps(_benchmark_one(json.loads(args.bench_one), args.concurrency, args.duration)))
+    elif args.sweep:
+        ranked = sweep(args.concurrency, args.duration)
+        if ranked:
+            best = ranked[0]["budget"]
+            print(f"\nThroughput-optimal split ({ranked[0]['throughput_rps']} req/s, p99 {ranked[0]['p99_ms']} ms):")
+            for key in BUDGET_KEYS:
+                print(f"    THREADS_{key.upper()}={best[key]}")
+    else:
+        print(json.dumps(get_thread_budget() if _applied else {"budget": resolve_budget()}, indent=2))
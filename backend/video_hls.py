@@ -0,0 +1,184 @@
+# Copyright (c) 2025 ot6_j. All Rights Reserved.
+
+"""
+Video HLS - Progressive output of the annotated surgery video as an HLS
+stream of fragmented-MP4 segments, so playback can start while the rest of
+the video is still being analyzed.
+
+Each stream lives in its own directory under HLS_OUTPUT_DIR:
+    playlist.m3u8         EVENT playlist, grows as segments are finished;
+                          #EXT-X-ENDLIST is appended when processing ends
+    init.mp4              fMP4 initialization segment
+    segment_00000.m4s     HLS_SEGMENT_S seconds of video each
+    segment_00000.json    timeline sidecar: the per-second entries of that segment
+
+Keyframes are forced every HLS_SEGMENT_S seconds, so segment k covers
+exactly seconds [k * HLS_SEGMENT_S, (k + 1) * HLS_SEGMENT_S) and its
+sidecar covers the same seconds. A sidecar is written as soon as the
+analysis has moved past the segment's last second, i.e. before the encoder
+has finished the segment itself.
+
+Configuration (environment):
+    HLS_OUTPUT_DIR=<tmp>/medivision_hls
+    HLS_SEGMENT_S=2                  # whole seconds
+    HLS_TTL_S=3600
+"""
+
+import json
+import logging
+import os
+import re
+import shutil
+import tempfile
+import time
+import uuid
+from typing import Any, Dict, List, Optional, Tuple
+
+from artifact_store import ARTIFACT_BASE_URL
+
+logger = logging.getLogger(__name__)
+
+HLS_OUTPUT_DIR = os.environ.get("HLS_OUTPUT_DIR", os.path.join(tempfile.gettempdir(), "medivision_hls"))
+HLS_SEGMENT_S = max(1, int(os.environ.get("HLS_SEGMENT_S", "2")))
+HLS_TTL_S = float(os.environ.get("HLS_TTL_S", "3600"))
+
+OUTPUT_FORMATS = ("mp4", "hls")
+
+PLAYLIST_NAME = "playlist.m3u8"
+STREAM_ID_PATTERN = re.compile(r"^[0-9a-f]{32}$")
+STREAM_FILE_PATTERN = re.compile(r"^(playlist\.m3u8|init\.mp4|segment_\d{5}\.(m4s|json))$")
+
+MEDIA_TYPES = {
+    ".m3u8": "application/vnd.apple.mpegurl",
+    ".mp4": "video/mp4",
+    ".m4s": "video/iso.segment",
+    ".json": "application/json",
+}
+
+
+def gc_streams(ttl_s: float = HLS_TTL_S):
+    """Deletes stream directories not modified within the TTL."""
+    now = time.time()
+    for name in os.listdir(HLS_OUTPUT_DIR):
+        path = os.path.join(HLS_OUTPUT_DIR, name)
+        if not STREAM_ID_PATTERN.match(name):
+            continue
+        try:
+            if os.path.getmtime(path) + ttl_s <= now:
+                shutil.rmtree(path, ignore_errors=True)
+        except OSError:
+            pass
+
+
+def create_stream() -> Tuple[str, str]:
+    """Creates an empty stream directory; returns (stream id, directory)."""
+    os.makedirs(HLS_OUTPUT_DIR, exist_ok=True)
+    gc_streams()
+    stream_id = uuid.uuid4().hex
+    directory = os.path.join(HLS_OUTPUT_DIR, stream_id)
+    os.makedirs(directory)
+    return stream_id, directory
+
+
+def stream_url(stream_id: str, name: str = PLAYLIST_NAME) -> str:
+    return f"{ARTIFACT_BASE_URL}/api/hls/{stream_id}/{name}"
+
+
+def stream_file_path(stream_id: str, name: str) -> Optional[str]:
+    """Path of an existing stream file, or None (also for ids/names that are not stream files)."""
+    if not STREAM_ID_PATTERN.match(stream_id) or not STREAM_FILE_PATTERN.match(name):
+        return None
+    path = os.path.join(HLS_OUTPUT_DIR, stream_id, name)
+    return path if os.path.isfile(path) else None
+
+
+def stream_media_type(name: str) -> str:
+    return MEDIA_TYPES.get(os.path.splitext(name)[1], "application/octet-stream")
+
+
+class HlsOutput:
+    """
+    Writes one stream: open_writer() returns an imageio writer producing the
+    segments, update() writes the sidecars of the segments analysis has
+    moved past, finish() the remaining ones once the timeline is final.
+    """
+
+    def __init__(self, directory: str, fps: float, segment_s: int = HLS_SEGMENT_S, adaptive: bool = False):
+        self.directory = directory
+        self.stream_id = os.path.basename(os.path.normpath(directory))
+        self.fps = fps
+        self.segment_s = segment_s
+        self.adaptive = adaptive
+        # Sidecars written so far, and the last timeline entry before the next one
+        self.sidecars = 0
+        self._carry: Optional[Dict[str, Any]] = None
+
+    def open_writer(self):
+        """H.264 writer with the settings of the MP4 output, segmented into HLS/fMP4."""
+        import imageio
+
+        gop = str(max(1, int(round(self.fps * self.segment_s))))
+        return imageio.get_writer(
+            os.path.join(self.directory, PLAYLIST_NAME),
+            format="FFMPEG",
+            fps=self.fps,
+            codec='libx264',
+            pixelformat='yuv420p',
+            output_params=[
+                '-crf', '23', '-preset', 'fast',
+                '-g', gop, '-keyint_min', gop, '-sc_threshold', '0',
+                '-f', 'hls', '-hls_time', str(self.segment_s), '-hls_playlist_type', 'event',
+                '-hls_segment_type', 'fmp4', '-hls_fmp4_init_filename', 'init.mp4',
+                '-hls_segment_filename', os.path.join(self.directory, 'segment_%05d.m4s'),
+                '-hls_flags', 'independent_segments'
+            ]
+        )
+
+    def _write_sidecar(self, index: int, entries: List[Dict[str, Any]]):
+        start = index * self.segment_s
+        path = os.path.join(self.directory, f"segment_{index:05d}.json")
+        # Written under a temp name so clients never read a partial file
+        with open(path + ".tmp", "w") as f:
+            json.dump({"segment": index, "start": start, "end": start + self.segment_s, "timeline": entries}, f)
+        os.replace(path + ".tmp", path)
+
+    def update(self, timeline: Dict[int, Dict[str, Any]], current_second: int):
+        """Writes the sidecars of segments ending at or before current_second (still being analyzed)."""
+        from video_processor import fill_timeline_gaps
+
+        while (self.sidecars + 1) * self.segment_s <= current_second:
+            start = self.sidecars * self.segment_s
+            end = start + self.segment_s
+            entries = [timeline[s] for s in range(start, end) if s in timeline]
+            window = entries
+            if self.adaptive:
+                # Skipped seconds interpolate towards the first entry after the segment
+                following = [timeline[current_second]] if current_second in timeline else []
+                window = fill_timeline_gaps(([self._carry] if self._carry else []) + entries + following)
+            self._write_sidecar(self.sidecars, [e for e in window if start <= e["time"] < end])
+            if entries:
+                self._carry = entries[-1]
+            self.sidecars += 1
+
+    def finish(self, timeline_list: List[Dict[str, Any]]):
+        """Writes the remaining sidecars from the final timeline."""
+        if not timeline_list:
+            return
+        last = timeline_list[-1]["time"] // self.segment_s
+        while self.sidecars <= last:
+            start = self.sidecars * self.segment_s
+            self._write_sidecar(self.sidecars, [e for e in timeline_list if start <= e["time"] < start + self.segment_s])
+            self.sidecars += 1
+
+    def discard(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def get_info(self) -> Dict[str, Any]:
+        return {
+            "stream_id": self.stream_id,
+            "playlist_url": stream_url(self.stream_id),
+            # segment_NNNNN.m4s has its timeline in segment_NNNNN.json next to it
+            "base_url": stream_url(self.stream_id, ""),
+            "segment_s": self.segment_s,
+            "segments": self.sidecars
+        }
@@ -0,0 +1,233 @@
+# Copyright (c) 2025 ot6_j. All Rights Reserved.
+
+"""
+Video Pipeline - Runs decode, inference and encode as concurrent stages
+connected by bounded queues: one decoder thread, a pool of inference
+workers and one encoder thread. Batches may finish inference out of order;
+the encoder restores the original order before consuming them. Full
+queues block the upstream stage (backpressure), so memory stays bounded.
+Each stage records busy time so the bottleneck is visible.
+
+Configuration (environment):
+    VIDEO_INFERENCE_WORKERS=2
+    VIDEO_PIPELINE_QUEUE=4        # batches buffered between stages
+"""
+
+import logging
+import os
+import queue
+import threading
+import time
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+VIDEO_INFERENCE_WORKERS = int(os.environ.get("VIDEO_INFERENCE_WORKERS", "2"))
+VIDEO_PIPELINE_QUEUE = int(os.environ.get("VIDEO_PIPELINE_QUEUE", "4"))
+
+# End-of-stream marker passed between stages
+_DONE = object()
+
+_model_replicas: Dict[int, List[Any]] = {}
+_replica_lock = threading.Lock()
+
+
+class StageMeter:
+    """Busy / waiting time of one pipeline stage (summed over its threads)."""
+
+    def __init__(self, name: str, threads: int = 1):
+        self.name = name
+        self.threads = threads
+        self.busy_s = 0.0
+        self.blocked_s = 0.0
+        self.items = 0
+        self._lock = threading.Lock()
+
+    def add(self, busy_s: float = 0.0, blocked_s: float = 0.0, items: int = 0):
+        with self._lock:
+            self.busy_s += busy_s
+            self.blocked_s += blocked_s
+            self.items += items
+
+    def report(self, wall_s: float) -> Dict[str, Any]:
+        capacity = wall_s * self.threads
+        return {
+            "threads": self.threads,
+            "items": self.items,
+            "busy_s": round(self.busy_s, 3),
+            "blocked_s": round(self.blocked_s, 3),
+            "utilization": round(self.busy_s / capacity, 3) if capacity > 0 else 0.0
+        }
+
+
+def replicate_model(model: Any, count: int) -> List[Any]:
+    """
+    One detector per inference worker. Ultralytics predictors keep per-call
+    state, so extra workers get their own instance loaded from the same
+    weights; models without a checkpoint path (e.g. engine proxies) are shared.
+    """
+    if count <= 1:
+        return [model]
+
+    with _replica_lock:
+        replicas = _model_replicas.get(id(model))
+        if replicas is None or replicas[0] is not model:
+            replicas = [model]
+        weights = getattr(model, "ckpt_path", None) or getattr(model, "model_name", None)
+        while len(replicas) < count:
+            if not isinstance(weights, str):
+                replicas.append(model)
+                continue
+            replicas.append(type(model)(weights, task=getattr(model, "task", None)))
+        _model_replicas[id(model)] = replicas
+        return replicas[:count]
+
+
+class FramePipeline:
+    """
+    decode (1 thread) -> inference (N threads) -> encode (1 thread, in order).
+
+    - batches:  iterator yielding frame batches; iterated on the decoder thread
+    - process:  process(batch, worker_index) -> results, on an inference thread
+    - consume:  consume(batch, results), on the encoder thread in input order
+    """
+
+    def __init__(self, batches: Iterator[Any], process: Callable[[Any, int], Any],
+                 consume: Callable[[Any, Any], None], workers: int = VIDEO_INFERENCE_WORKERS,
+                 queue_size: int = VIDEO_PIPELINE_QUEUE):
+        self.batches = batches
+        self.process = process
+        self.consume = consume
+        self.workers = max(1, workers)
+
+        self._decoded: queue.Queue = queue.Queue(maxsize=max(1, queue_size))
+        self._inferred: queue.Queue = queue.Queue(maxsize=max(1, queue_size))
+        self._stop = threading.Event()
+        self._errors: List[BaseException] = []
+
+        self.meters = {
+            "decode": StageMeter("decode"),
+            "inference": StageMeter("inference", self.workers),
+            "encode": StageMeter("encode"),
+        }
+
+    def _fail(self, error: BaseException):
+        self._errors.append(error)
+        self._stop.set()
+
+    def _put(self, q: queue.Queue, item: Any, meter: StageMeter) -> bool:
+        """Blocking put that gives up when the pipeline is stopping."""
+        start = time.perf_counter()
+        try:
+            while not self._stop.is_set():
+                try:
+                    q.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+        finally:
+            meter.add(blocked_s=time.perf_counter() - start)
+
+    def _get(self, q: queue.Queue, meter: StageMeter) -> Optional[Any]:
+        """Blocking get; None when the pipeline is stopping."""
+        start = time.perf_counter()
+        try:
+            while not self._stop.is_set():
+                try:
+                    return q.get(timeout=0.1)
+                except queue.Empty:
+                    continue
+            return None
+        finally:
+            meter.add(blocked_s=time.perf_counter() - start)
+
+    def _decode_loop(self):
+        meter = self.meters["decode"]
+        try:
+            seq = 0
+            while not self._stop.is_set():
+                start = time.perf_counter()
+                batch = next(self.batches, _DONE)
+                meter.add(busy_s=time.perf_counter() - start, items=0 if batch is _DONE else 1)
+                if batch is _DONE:
+                    break
+                if not self._put(self._decoded, (seq, batch), meter):
+                    return
+                seq += 1
+            for _ in range(self.workers):
+                self._put(self._decoded, _DONE, meter)
+        except BaseException as e:
+            self._fail(e)
+
+    def _inference_loop(self, worker_index: int):
+        meter = self.meters["inference"]
+        try:
+            while True:
+                item = self._get(self._decoded, meter)
+                if item is None:
+                    return
+                if item is _DONE:
+                    self._put(self._inferred, _DONE, meter)
+                    return
+                seq, batch = item
+                start = time.perf_counter()
+                results = self.process(batch, worker_index)
+                meter.add(busy_s=time.perf_counter() - start, items=1)
+                if not self._put(self._inferred, (seq, batch, results), meter):
+                    return
+        except BaseException as e:
+            self._fail(e)
+
+    def _encode_loop(self):
+        meter = self.meters["encode"]
+        try:
+            # Out-of-order results wait here until their predecessors arrive
+            pending: Dict[int, Any] = {}
+            next_seq = 0
+            finished_workers = 0
+            while finished_workers < self.workers:
+                item = self._get(self._inferred, meter)
+                if item is None:
+                    return
+                if item is _DONE:
+                    finished_workers += 1
+                    continue
+                seq, batch, results = item
+                pending[seq] = (batch, results)
+                while next_seq in pending:
+                    batch, results = pending.pop(next_seq)
+                    start = time.perf_counter()
+                    self.consume(batch, results)
+                    meter.add(busy_s=time.perf_counter() - start, items=1)
+                    next_seq += 1
+        except BaseException as e:
+            self._fail(e)
+
+    def run(self) -> Dict[str, Any]:
+        """Runs all stages to completion; re-raises the first stage error."""
+        started = time.perf_counter()
+        threads = [threading.Thread(target=self._decode_loop, name="video-decode", daemon=True)]
+        threads += [
+            threading.Thread(target=self._inference_loop, args=(i,), name=f"video-infer-{i}", daemon=True)
+            for i in range(self.workers)
+        ]
+        threads.append(threading.Thread(target=self._encode_loop, name="video-encode", daemon=True))
+
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        if self._errors:
+            raise self._errors[0]
+
+        wall_s = time.perf_counter() - started
+        stages = {name: meter.report(wall_s) for name, meter in self.meters.items()}
+        stats = {
+            "wall_s": round(wall_s, 3),
+            "stages": stages,
+            "bottleneck": max(stages, key=lambda name: stages[name]["utilization"])
+        }
+        logger.info(f"Video pipeline: {stats}")
+        return stats
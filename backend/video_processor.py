@@ -2,10 +2,19 @@
 
 import cv2
 import numpy as np
-import base64
 import tempfile
 import os
-from surgery_algo import detect_hemorrhage, check_visibility
+from surgery_algo import detect_hemorrhage_batch, check_visibility_batch
+from adaptive_sampling import VIDEO_ADAPTIVE, AdaptiveSampler
+from frame_analytics import FRAME_ANALYTICS_FUSED, analyze_pixels_batch
+from instrument_tracker import VIDEO_TRACKING, InstrumentTracker
+from video_pipeline import VIDEO_INFERENCE_WORKERS, FramePipeline, replicate_model
+from video_hls import HlsOutput
+from video_sampling import VIDEO_SAMPLING_MODE, FrameSampler
+from video_segments import VIDEO_SEGMENT_WORKERS
+
+# Frames per YOLO call in full-video processing
+VIDEO_BATCH_SIZE = int(os.environ.get("VIDEO_BATCH_SIZE", "8"))
 
 # Surgical-relevant class IDs in COCO
 SURGICAL_CLASSES = [0, 42, 43, 44, 76]
@@ -19,22 +28,71 @@ SURGICAL_LABELS = {
 
 def process_video_frame(frame, model_surgery):
     """Processes a single video frame for surgery monitoring."""
-    results = model_surgery.predict(frame, classes=SURGICAL_CLASSES, conf=0.3, verbose=False)
+    return process_video_frames([frame], model_surgery)[0]
+
+
+def process_video_frames(frames, model_surgery):
+    """
+    Processes a batch of frames: one YOLO call for the whole batch, then
+    batch-wise hemorrhage/visibility checks; returns one result per frame.
+    """
+    if not frames:
+        return []
+    
+    results = model_surgery.predict(list(frames), classes=SURGICAL_CLASSES, conf=0.3, verbose=False)
+    return analyze_frames(frames, results)
+
+
+def process_tracked_frames(frames, tracker):
+    """Like process_video_frames, with boxes from an InstrumentTracker (YOLO on keyframes only)."""
+    if not frames:
+        return []
     
+    return analyze_frames(frames, [tracker.update(frame) for frame in frames])
+
+
+def make_tracker(model_surgery, first_id=1):
+    """InstrumentTracker whose keyframe detector is the surgery YOLO model."""
+    def detect(frame):
+        return model_surgery.predict([frame], classes=SURGICAL_CLASSES, conf=0.3, verbose=False)[0]
+    return InstrumentTracker(detect, first_id=first_id)
+
+
+def analyze_frames(frames, yolo_results):
+    """Batch hemorrhage/visibility checks, then per-frame analysis with the given detections."""
+    if FRAME_ANALYTICS_FUSED:
+        hemorrhage, visibility = analyze_pixels_batch(frames)
+    else:
+        hemorrhage = detect_hemorrhage_batch(frames)
+        visibility = check_visibility_batch(frames)
+    
+    return [
+        analyze_frame(frame, result, bleeding, smoke)
+        for frame, result, bleeding, smoke in zip(frames, yolo_results, hemorrhage, visibility)
+    ]
+
+
+def analyze_frame(frame, yolo_result, hemorrhage, visibility):
+    """Builds the per-frame status and annotated image from precomputed detections and checks."""
     tool_count = 0
     hand_count = 0
     detections = []
     
-    for box in results[0].boxes:
+    for box in yolo_result.boxes:
         cls_id = int(box.cls)
         conf = float(box.conf)
         xyxy = box.xyxy[0].tolist()
         
         label = SURGICAL_LABELS.get(cls_id, f"Object {cls_id}")
-        detections.append({
+        detection = {
             "label": label,
             "confidence": round(conf * 100, 1)
-        })
+        }
+        # Set when boxes come from the instrument tracker
+        track_id = getattr(box, "id", None)
+        if track_id is not None:
+            detection["track_id"] = int(track_id)
+        detections.append(detection)
         
         if cls_id in [42, 43, 44, 76]:
             tool_count += 1
@@ -43,13 +101,16 @@ def process_video_frame(frame, model_surgery):
     
     # Draw annotations on frame
     img_annotated = frame.copy()
-    for box in results[0].boxes:
+    for box in yolo_result.boxes:
         cls_id = int(box.cls)
         conf = float(box.conf)
         x1, y1, x2, y2 = [int(x) for x in box.xyxy[0].tolist()]
         
         label = SURGICAL_LABELS.get(cls_id, "Object")
         label_text = f"{label} {conf*100:.0f}%"
+        track_id = getattr(box, "id", None)
+        if track_id is not None:
+            label_text = f"#{int(track_id)} {label_text}"
         
         color = (255, 165, 0) if cls_id == 0 else (0, 255, 0)
         cv2.rectangle(img_annotated, (x1, y1), (x2, y2), color, 2)
@@ -59,8 +120,8 @@ def process_video_frame(frame, model_surgery):
         cv2.putText(img_annotated, label_text, (x1 + 2, y1 - 4), 
                    cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 0, 0), 1)
     
-    is_bleeding, blood_pct, mask_blood = detect_hemorrhage(frame)
-    is_smoke, sharpness = check_visibility(frame)
+    is_bleeding, blood_pct, mask_blood = hemorrhage
+    is_smoke, sharpness = visibility
     
     status = "STABLE"
     alert_message = "Operation in progress"
@@ -98,144 +159,251 @@ def process_video_frame(frame, model_surgery):
     }
 
 
-def process_full_video(video_path, model_surgery, target_fps=10):
+def process_full_video(video_path, model_surgery, target_fps=10, progress_callback=None,
+                       batch_size=VIDEO_BATCH_SIZE, workers=VIDEO_INFERENCE_WORKERS, sampling=None,
+                       segment_workers=VIDEO_SEGMENT_WORKERS, start_frame=0, end_frame=None, tracking=None,
+                       track_id_start=1, adaptive=None, hls_dir=None):
     """
     Process entire video and return:
-    - Annotated video as WebM (VP9 codec - web compatible)
+    - Annotated video as MP4 (H.264 - web compatible), left on disk at
+      video_path for the caller to store or delete
     - Per-second statistics for synchronized display
-    """
-    import imageio
     
-    cap = cv2.VideoCapture(video_path)
+    Decoding, inference and encoding run as pipelined stages (see
+    video_pipeline): frames are decoded while earlier batches are analyzed
+    and annotated frames go straight to the encoder instead of piling up,
+    so memory does not grow with video length.
+    
+    Only sampled frames are decoded (see video_sampling); `sampling` picks
+    the mode (auto/grab/seek/keyframe, default VIDEO_SAMPLING_MODE). Each
+    annotated frame is held until the next sample's timestamp, so sparse
+    samples (keyframe mode) still play back in sync with the timeline.
     
-    if not cap.isOpened():
-        raise ValueError("Could not open video file")
+    tracking=True (default VIDEO_TRACKING) runs YOLO on keyframes only and
+    tracks instruments in between (see instrument_tracker), which makes
+    25-30 FPS analysis affordable; detections then carry a track_id.
+    Tracking is sequential, so the inference stage uses a single worker.
     
-    # Get video properties
-    original_fps = cap.get(cv2.CAP_PROP_FPS)
-    total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-    width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-    height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-    duration = total_frames / original_fps if original_fps > 0 else 0
+    adaptive=True (default VIDEO_ADAPTIVE) probes frames at target_fps,
+    densifying to ADAPTIVE_MAX_FPS only around sudden changes, and analyzes
+    only those that changed (see adaptive_sampling); seconds without an
+    analysis are interpolated.
     
-    # Frame skip for target FPS
-    frame_skip = max(1, int(original_fps / target_fps))
+    With segment_workers > 1, long seekable videos are split into time
+    segments analyzed in parallel processes (see video_segments);
+    start_frame/end_frame restrict processing to one such segment.
+    
+    With hls_dir (see video_hls.create_stream), the annotated video is
+    written there as a growing HLS/fMP4 stream with per-segment timeline
+    sidecars instead of one MP4, and video_path is None. Playback can start
+    with the first segment; the video is then processed in one piece.
+    
+    progress_callback(frames_read, total_frames) is called after every
+    analyzed batch; it may raise to abort processing (e.g. job cancellation).
+    """
+    import imageio
     
-    # Collect annotated frames and stats
-    annotated_frames = []
-    timeline = {}
-    frame_count = 0
-    processed_frames = 0
+    if segment_workers > 1 and start_frame == 0 and end_frame is None and hls_dir is None:
+        from video_segments import process_video_segments
+        result = process_video_segments(video_path, target_fps, segment_workers, progress_callback=progress_callback,
+                                        batch_size=batch_size, sampling=sampling, tracking=tracking,
+                                        adaptive=adaptive)
+        # None: too short or not seekable, process in one piece
+        if result is not None:
+            return result
     
-    while cap.isOpened():
-        ret, frame = cap.read()
-        if not ret:
-            break
+    if adaptive is None:
+        adaptive = VIDEO_ADAPTIVE
+    
+    # Raises ValueError if the video cannot be opened
+    with FrameSampler(video_path, target_fps, mode=sampling or VIDEO_SAMPLING_MODE,
+                      start_frame=start_frame, end_frame=end_frame) as sampler:
+        samples = AdaptiveSampler(sampler, sampler.fps, target_fps) if adaptive else sampler
+        
+        # Get video properties (frame count is unknown (<= 0) when reading from a pipe)
+        original_fps = sampler.fps
+        total_frames = sampler.total_frames
+        duration = total_frames / original_fps if original_fps > 0 else 0
+        
+        timeline = {}
+        processed_frames = 0
+        held_frame = None
+        
+        # Output slot of each sample in the full-length annotated video
+        def output_slot(index):
+            return int(round(index / original_fps * target_fps))
+        
+        written_frames = output_slot(start_frame)
+        
+        if tracking is None:
+            tracking = VIDEO_TRACKING
+        tracker = make_tracker(model_surgery, track_id_start) if tracking else None
+        models = replicate_model(model_surgery, 1 if tracker is not None else workers)
+        
+        def analyze(batch, worker_index):
+            """Inference stage: YOLO (or tracking) + checks with this worker's detector."""
+            frames = [frame for _, frame in batch]
+            if tracker is not None:
+                return process_tracked_frames(frames, tracker)
+            return process_video_frames(frames, models[worker_index])
         
-        # Process every Nth frame
-        if frame_count % frame_skip == 0:
-            current_time = frame_count / original_fps
-            current_second = int(current_time)
+        def write(batch, results):
+            """Encoder stage: annotated frames to the writer, stats to the timeline (in order)."""
+            nonlocal processed_frames, written_frames, held_frame
+            for (index, _), result in zip(batch, results):
+                current_second = int(index / original_fps)
+                
+                # Convert BGR to RGB for imageio
+                frame_rgb = cv2.cvtColor(result["annotated_frame"], cv2.COLOR_BGR2RGB)
+                
+                # Output slots since the previous sample keep showing the previous frame
+                output_index = output_slot(index)
+                while written_frames < output_index:
+                    writer.append_data(held_frame if held_frame is not None else frame_rgb)
+                    written_frames += 1
+                if written_frames == output_index:
+                    writer.append_data(frame_rgb)
+                    written_frames += 1
+                held_frame = frame_rgb
+                
+                # Store stats for this second
+                timeline[current_second] = {
+                    "time": current_second,
+                    "status": result["status"],
+                    "message": result["message"],
+                    "level": result["level"],
+                    "tools": result["data"]["tools"],
+                    "hands": result["data"]["hands"],
+                    "blood_pct": result["data"]["blood_pct"],
+                    "sharpness": result["data"]["sharpness"],
+                    "detections": result["data"]["detections"]
+                }
+                
+                processed_frames += 1
             
-            # Process frame with YOLO
-            result = process_video_frame(frame, model_surgery)
+            if hls is not None:
+                hls.update(timeline, int(batch[-1][0] / original_fps))
             
-            # Convert BGR to RGB for imageio
-            frame_rgb = cv2.cvtColor(result["annotated_frame"], cv2.COLOR_BGR2RGB)
-            annotated_frames.append(frame_rgb)
+            if progress_callback is not None:
+                progress_callback(batch[-1][0] + 1, total_frames)
+        
+        hls = None
+        output_path = None
+        writer = None
+        try:
+            if hls_dir is not None:
+                hls = HlsOutput(hls_dir, target_fps, adaptive=adaptive)
+                writer = hls.open_writer()
+            else:
+                temp_output = tempfile.NamedTemporaryFile(suffix='.mp4', delete=False)
+                temp_output.close()
+                output_path = temp_output.name
+                
+                # Write video with H.264 codec (web compatible)
+                writer = imageio.get_writer(
+                    output_path,
+                    fps=target_fps,
+                    codec='libx264',
+                    pixelformat='yuv420p',
+                    output_params=['-crf', '23', '-preset', 'fast']
+                )
             
-            # Store stats for this second
-            timeline[current_second] = {
-                "time": current_second,
-                "status": result["status"],
-                "message": result["message"],
-                "level": result["level"],
-                "tools": result["data"]["tools"],
-                "hands": result["data"]["hands"],
-                "blood_pct": result["data"]["blood_pct"],
-                "sharpness": result["data"]["sharpness"],
-                "detections": result["data"]["detections"]
-            }
+            pipeline_stats = FramePipeline(iter_batches(samples, batch_size), analyze, write, workers=len(models)).run()
             
-            processed_frames += 1
+            # A segment covers its slots up to the next segment's first one
+            if end_frame is not None and held_frame is not None:
+                while written_frames < output_slot(end_frame):
+                    writer.append_data(held_frame)
+                    written_frames += 1
+        except BaseException:
+            if writer is not None:
+                writer.close()
+            if hls is not None:
+                hls.discard()
+            elif output_path is not None:
+                os.unlink(output_path)
+            raise
         
-        frame_count += 1
-    
-    cap.release()
-    
-    # Create output video using imageio with ffmpeg
-    temp_output = tempfile.NamedTemporaryFile(suffix='.mp4', delete=False)
-    temp_output.close()
-    
-    # Write video with H.264 codec (web compatible)
-    writer = imageio.get_writer(
-        temp_output.name,
-        fps=target_fps,
-        codec='libx264',
-        pixelformat='yuv420p',
-        output_params=['-crf', '23', '-preset', 'fast']
-    )
-    
-    for frame in annotated_frames:
-        writer.append_data(frame)
-    
     writer.close()
     
-    # Read and encode to base64
-    with open(temp_output.name, 'rb') as f:
-        video_bytes = f.read()
-    
-    video_base64 = base64.b64encode(video_bytes).decode('utf-8')
-    
-    # Clean up
-    os.unlink(temp_output.name)
+    if total_frames <= 0:
+        duration = sampler.position / original_fps
     
     # Convert timeline dict to sorted list
     timeline_list = [timeline[s] for s in sorted(timeline.keys())]
-    
-    # Calculate summary
-    critical_count = sum(1 for s in timeline_list if s["level"] == "red")
-    warning_count = sum(1 for s in timeline_list if s["level"] == "orange")
+    if adaptive and samples.last_index is not None:
+        timeline_list = fill_timeline_gaps(timeline_list, int(samples.last_index / original_fps))
+    if hls is not None:
+        hls.finish(timeline_list)
     
     return {
-        "video_base64": video_base64,
+        "video_path": output_path,
         "video_mime": "video/mp4",
         "duration": round(duration, 1),
         "fps": target_fps,
         "total_seconds": len(timeline_list),
         "processed_frames": processed_frames,
         "timeline": timeline_list,
-        "summary": {
-            "critical_seconds": critical_count,
-            "warning_seconds": warning_count,
-            "stable_seconds": len(timeline_list) - critical_count - warning_count
-        }
+        "summary": summarize_timeline(timeline_list),
+        "pipeline": pipeline_stats,
+        "sampling": sampler.get_stats(),
+        "tracking": tracker.get_stats() if tracker is not None else None,
+        "adaptive": samples.get_stats() if adaptive else None,
+        "hls": hls.get_info() if hls is not None else None
     }
 
 
-def extract_video_frames(video_path, max_frames=30, fps=5):
-    """Extracts frames from a video file."""
-    cap = cv2.VideoCapture(video_path)
-    frames = []
-    
-    total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-    video_fps = int(cap.get(cv2.CAP_PROP_FPS))
-    
-    frame_skip = max(1, video_fps // fps)
-    
-    frame_count = 0
-    extracted = 0
-    
-    while cap.isOpened() and extracted < max_frames:
-        ret, frame = cap.read()
-        if not ret:
-            break
-        
-        if frame_count % frame_skip == 0:
-            frames.append(frame)
-            extracted += 1
+def fill_timeline_gaps(timeline_list, last_second=None):
+    """
+    Adds the seconds adaptive sampling skipped (up to last_second): status
+    and detections carry over from the previous analyzed second, blood and
+    sharpness are interpolated linearly towards the next one.
+    """
+    filled = []
+    for entry, following in zip(timeline_list, timeline_list[1:] + [None]):
+        filled.append(entry)
+        if following is not None:
+            end = following["time"]
+        else:
+            end = max(entry["time"], last_second if last_second is not None else entry["time"]) + 1
         
-        frame_count += 1
+        for second in range(entry["time"] + 1, end):
+            gap_entry = dict(entry, time=second, interpolated=True)
+            if following is not None:
+                w = (second - entry["time"]) / (following["time"] - entry["time"])
+                gap_entry["blood_pct"] = round(entry["blood_pct"] + w * (following["blood_pct"] - entry["blood_pct"]), 1)
+                gap_entry["sharpness"] = round(entry["sharpness"] + w * (following["sharpness"] - entry["sharpness"]), 0)
+            filled.append(gap_entry)
     
-    cap.release()
-    return frames
+    return filled
+
+
+def summarize_timeline(timeline_list):
+    """Counts critical/warning/stable seconds of a timeline."""
+    critical_count = sum(1 for s in timeline_list if s["level"] == "red")
+    warning_count = sum(1 for s in timeline_list if s["level"] == "orange")
+    
+    return {
+        "critical_seconds": critical_count,
+        "warning_seconds": warning_count,
+        "stable_seconds": len(timeline_list) - critical_count - warning_count
+    }
+
+
+def extract_video_frames(video_path, max_frames=30, fps=5, sampling=None):
+    """Yields frames from a video file one at a time (sampled at fps, at most max_frames)."""
+    with FrameSampler(video_path, fps, mode=sampling or VIDEO_SAMPLING_MODE, max_frames=max_frames) as sampler:
+        for _, frame in sampler:
+            yield frame
+
+
+def iter_batches(items, batch_size):
+    """Groups an iterable into lists of up to batch_size items."""
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
@@ -0,0 +1,226 @@
+# Copyright (c) 2025 ot6_j. All Rights Reserved.
+
+"""
+Video Sampling - Reads only the frames that will be analyzed. Sample times
+are k / target_fps seconds, mapped to frame indices with the video's exact
+(fractional) frame rate. Frames between samples are grab()bed but never
+retrieve()d, so they are not converted to BGR or copied. When the gap to
+the next sample is large, the sampler seeks instead, which skips decoding
+entirely up to the keyframe before the sample. A consumer can ask for a
+denser rate over a stretch of frames while iterating (densify), e.g. to
+look closer at a sudden change without decoding the whole video densely.
+
+Modes:
+    auto      grab for short gaps, seek for gaps >= VIDEO_SEEK_MIN_SKIP frames
+    grab      never seek (also used for pipes, which cannot seek)
+    seek      seek for every gap larger than one frame
+    keyframe  decode only keyframes (PyAV) - quick triage of long recordings;
+              the sample rate is the video's keyframe interval
+
+Configuration (environment):
+    VIDEO_SAMPLING_MODE=auto
+    VIDEO_SEEK_MIN_SKIP=48
+"""
+
+import logging
+import os
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+import cv2
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+VIDEO_SAMPLING_MODE = os.environ.get("VIDEO_SAMPLING_MODE", "auto")
+VIDEO_SEEK_MIN_SKIP = int(os.environ.get("VIDEO_SEEK_MIN_SKIP", "48"))
+
+SAMPLING_MODES = ("auto", "grab", "seek", "keyframe")
+
+
+class FrameSampler:
+    """
+    Iterates (frame index, BGR frame) samples of a video at ~target_fps.
+    `position` is the number of frames consumed so far (for the duration
+    of streams without a frame count); `stats` counts decoded/grabbed/seeks
+    and the extra samples yielded by densify().
+
+    start_frame/end_frame restrict sampling to [start_frame, end_frame) on
+    the same sample grid as the whole video, so adjacent ranges yield every
+    sample exactly once (see video_segments).
+    """
+
+    def __init__(self, video_path: str, target_fps: float, mode: str = VIDEO_SAMPLING_MODE,
+                 max_frames: Optional[int] = None, seek_min_skip: int = VIDEO_SEEK_MIN_SKIP,
+                 start_frame: int = 0, end_frame: Optional[int] = None):
+        if mode not in SAMPLING_MODES:
+            raise ValueError(f"Unknown sampling mode '{mode}' (expected one of {', '.join(SAMPLING_MODES)})")
+
+        self.video_path = video_path
+        self.target_fps = float(target_fps)
+        self.mode = mode
+        self.max_frames = max_frames
+        self.start_frame = start_frame
+        self.end_frame = end_frame
+        self.position = 0
+        self.stats = {"mode": mode, "decoded": 0, "grabbed": 0, "seeks": 0, "dense": 0}
+
+        self._dense_until: Optional[int] = None
+        self._dense_step = 1.0
+        self._cap = None
+        self._container = None
+        if mode == "keyframe":
+            self._open_keyframes()
+        else:
+            self._open_capture()
+
+        if mode == "seek":
+            self.seek_min_skip = 2
+        elif mode == "grab" or not self.seekable:
+            self.seek_min_skip = None
+        else:
+            self.seek_min_skip = max(2, seek_min_skip)
+
+    def _open_capture(self):
+        self._cap = cv2.VideoCapture(self.video_path)
+        if not self._cap.isOpened():
+            raise ValueError("Could not open video file")
+        # Frame count is unknown (<= 0) when reading from a pipe
+        self.fps = self._cap.get(cv2.CAP_PROP_FPS)
+        if not self.fps or self.fps <= 0:
+            self.fps = self.target_fps
+        self.total_frames = int(self._cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        self.seekable = self.total_frames > 0 and os.path.isfile(self.video_path)
+
+    def _open_keyframes(self):
+        import av
+        # Base class of PyAV's open/decode errors in every supported version (av.AVError was removed in 14)
+        from av.error import FFmpegError
+
+        try:
+            self._container = av.open(self.video_path)
+        except FFmpegError as e:
+            raise ValueError(f"Could not open video file: {e}")
+        self._stream = self._container.streams.video[0]
+        self._stream.codec_context.skip_frame = "NONKEY"
+        self.fps = float(self._stream.average_rate or self.target_fps)
+        self.total_frames = int(self._stream.frames or 0)
+        self.seekable = False
+
+    def densify(self, until_index: int, fps: float):
+        """
+        Also yields samples every 1 / fps seconds (at most every frame) after
+        the last one and before frame until_index. Ignored in keyframe mode.
+        """
+        self._dense_step = max(1.0, self.fps / fps)
+        self._dense_until = until_index
+
+    def _in_range(self, index: int) -> bool:
+        return index >= self.start_frame and (self.end_frame is None or index < self.end_frame)
+
+    def _targets(self) -> Iterator[int]:
+        """Frame indices of samples k / target_fps seconds into the video, within the range."""
+        step = self.fps / self.target_fps
+        if step <= 1:
+            # Target rate at or above the video's: every frame is a sample
+            k, step = self.start_frame, 1.0
+        else:
+            k = max(0, int(self.start_frame / step) - 1)
+        while True:
+            target = int(round(k * step))
+            k += 1
+            if target < self.start_frame:
+                continue
+            if not self._in_range(target):
+                return
+            yield target
+
+    def _read_at(self, target: int) -> Optional[np.ndarray]:
+        """Moves to frame `target` (seeking or grabbing) and decodes it; None at the end of the video."""
+        cap = self._cap
+        # The frame count is an estimate; never seek past it, let reads find the end
+        if (self.seek_min_skip is not None and target - self.position >= self.seek_min_skip
+                and target < self.total_frames):
+            if cap.set(cv2.CAP_PROP_POS_FRAMES, target):
+                self.position = target
+                self.stats["seeks"] += 1
+
+        # Skipped frames: demuxed and decoded by grab(), but never converted or copied
+        while self.position < target:
+            if not cap.grab():
+                return None
+            self.position += 1
+            self.stats["grabbed"] += 1
+
+        ret, frame = cap.read()
+        if not ret:
+            return None
+        self.position += 1
+        self.stats["decoded"] += 1
+        return frame
+
+    def _sample_capture(self) -> Iterator[Tuple[int, np.ndarray]]:
+        if self.start_frame > 0 and self.seekable and self._cap.set(cv2.CAP_PROP_POS_FRAMES, self.start_frame):
+            self.position = self.start_frame
+            self.stats["seeks"] += 1
+
+        last = None
+        for target in self._targets():
+            # Dense samples requested since the last one (re-checked after each yield)
+            while self._dense_until is not None and last is not None:
+                dense = int(round(last + self._dense_step))
+                if dense >= min(target, self._dense_until):
+                    break
+                frame = self._read_at(dense)
+                if frame is None:
+                    return
+                self.stats["dense"] += 1
+                last = dense
+                yield dense, frame
+
+            frame = self._read_at(target)
+            if frame is None:
+                return
+            last = target
+            yield target, frame
+
+    def _sample_keyframes(self) -> Iterator[Tuple[int, np.ndarray]]:
+        if self.start_frame > 0 and self._stream.time_base:
+            offset = int(self.start_frame / self.fps / self._stream.time_base)
+            self._container.seek(offset, stream=self._stream, backward=True)
+            self.stats["seeks"] += 1
+
+        for frame in self._container.decode(self._stream):
+            index = int(round(frame.time * self.fps)) if frame.time is not None else self.position
+            if index < self.start_frame:
+                continue
+            if not self._in_range(index):
+                return
+            self.position = index + 1
+            self.stats["decoded"] += 1
+            yield index, frame.to_ndarray(format="bgr24")
+
+    def __iter__(self) -> Iterator[Tuple[int, np.ndarray]]:
+        samples = self._sample_keyframes() if self.mode == "keyframe" else self._sample_capture()
+        if self.max_frames is not None and self.max_frames <= 0:
+            return
+        for count, sample in enumerate(samples, 1):
+            yield sample
+            if self.max_frames is not None and count >= self.max_frames:
+                return
+
+    def get_stats(self) -> Dict[str, Any]:
+        return dict(self.stats)
+
+    def close(self):
+        if self._cap is not None:
+            self._cap.release()
+            self._cap = None
+        if self._container is not None:
+            self._container.close()
+            self._container = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
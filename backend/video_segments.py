@@ -0,0 +1,318 @@
+# Copyright (c) 2025 ot6_j. All Rights Reserved.
+
+"""
+Video Segments - Splits a long surgery video into time segments that are
+analyzed in parallel by a pool of spawned processes, each with its own YOLO
+instance and thread budget, then merges the results in order.
+
+Segments share one sample grid (see video_sampling), so every sample is
+analyzed exactly once whatever the split. At a boundary, the per-second
+timeline keeps the later segment's entry for a second both segments touch
+(the same "last sample of the second wins" rule as a single pass), and each
+segment pads its annotated output up to the next segment's first frame, so
+the concatenated video has the same length and sync as a single pass.
+Segment videos share encoder settings and are joined without re-encoding.
+With instrument tracking, segment k numbers its tracks from
+k * TRACK_IDS_PER_SEGMENT + 1, so ids are unique across the merged
+timeline and match the labels drawn on the video.
+When the caller fails or is cancelled (e.g. job cancellation), pending
+segments are cancelled and running ones stop after their current batch:
+they poll a per-call cancel flag file, which works across spawned processes
+without a manager process.
+
+Configuration (environment):
+    VIDEO_SEGMENT_WORKERS=0      # processes; 0/1 = analyze in one piece
+    VIDEO_SEGMENT_MIN_S=30       # shorter segments are not worth a process
+    VIDEO_SEGMENT_THREADS=1      # intra-op threads per segment process
+"""
+
+import logging
+import multiprocessing
+import os
+import subprocess
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import cv2
+
+from video_upload import remove_file
+
+logger = logging.getLogger(__name__)
+
+VIDEO_SEGMENT_WORKERS = int(os.environ.get("VIDEO_SEGMENT_WORKERS", "0"))
+VIDEO_SEGMENT_MIN_S = float(os.environ.get("VIDEO_SEGMENT_MIN_S", "30"))
+VIDEO_SEGMENT_THREADS = int(os.environ.get("VIDEO_SEGMENT_THREADS", "1"))
+
+# Track id range reserved for each segment
+TRACK_IDS_PER_SEGMENT = 100000
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_workers = 0
+_lock = threading.Lock()
+
+
+class SegmentCancelled(Exception):
+    """Raised in a segment process that stopped because its caller gave up."""
+
+
+def plan_segments(total_frames: int, fps: float, workers: int,
+                  min_seconds: float = VIDEO_SEGMENT_MIN_S) -> List[Tuple[int, Optional[int]]]:
+    """
+    Equal [start_frame, end_frame) ranges, one per worker, none shorter than
+    min_seconds. The last range is open-ended because frame counts are
+    estimates. Returns [] when the video is not worth splitting.
+    """
+    count = min(workers, int(total_frames / fps // max(min_seconds, 1e-3)))
+    if count <= 1:
+        return []
+    bounds = [int(round(total_frames * i / count)) for i in range(count + 1)]
+    segments: List[Tuple[int, Optional[int]]] = [(bounds[i], bounds[i + 1]) for i in range(count)]
+    segments[-1] = (segments[-1][0], None)
+    return segments
+
+
+def _init_segment_worker(threads: int):
+    """Pool initializer: local models only, and a thread budget sized to one segment."""
+    from engine_workers import use_local_engines
+    use_local_engines()
+
+    from thread_budget import apply_thread_budget, resolve_budget
+    apply_thread_budget(resolve_budget(threads))
+
+    logging.basicConfig(level=logging.INFO)
+
+
+def _process_segment(video_path: str, target_fps: float, start_frame: int, end_frame: Optional[int],
+                     batch_size: int, sampling: Optional[str], tracking: Optional[bool],
+                     track_id_start: int, adaptive: Optional[bool], cancel_flag: str) -> Dict[str, Any]:
+    """
+    Runs in a segment process: analyzes one range with this process's
+    detector, stopping after the current batch once cancel_flag exists.
+    """
+    from model_loader import get_surgery_detector
+    from video_processor import process_full_video
+
+    def stop_if_cancelled(frames_read, total_frames):
+        if os.path.exists(cancel_flag):
+            raise SegmentCancelled(f"Segment from frame {start_frame} cancelled")
+
+    model = get_surgery_detector()
+    if model is None:
+        raise RuntimeError("YOLO detector unavailable")
+    return process_full_video(
+        video_path, model, target_fps=target_fps, progress_callback=stop_if_cancelled, batch_size=batch_size,
+        workers=1, sampling=sampling, segment_workers=0, start_frame=start_frame, end_frame=end_frame,
+        tracking=tracking, track_id_start=track_id_start, adaptive=adaptive
+    )
+
+
+def get_segment_pool(workers: int) -> ProcessPoolExecutor:
+    """Gets the segment process pool, (re)created for the requested size."""
+    global _pool, _pool_workers
+    with _lock:
+        if _pool is None or _pool_workers != workers:
+            if _pool is not None:
+                _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_segment_worker,
+                initargs=(VIDEO_SEGMENT_THREADS,)
+            )
+            _pool_workers = workers
+            logger.info(f"Video segment pool started: {workers} processes x {VIDEO_SEGMENT_THREADS} threads")
+        return _pool
+
+
+def shutdown_segment_pool(wait: bool = True):
+    """Stops the segment processes."""
+    global _pool
+    with _lock:
+        if _pool is not None:
+            _pool.shutdown(wait=wait, cancel_futures=True)
+            _pool = None
+
+
+def concat_videos(paths: List[str]) -> str:
+    """Joins same-encoding MP4 segments without re-encoding; consumes the inputs."""
+    from imageio_ffmpeg import get_ffmpeg_exe
+
+    fd, list_path = tempfile.mkstemp(suffix=".txt")
+    with os.fdopen(fd, "w") as f:
+        for path in paths:
+            escaped = path.replace("'", "'\\''")
+            f.write(f"file '{escaped}'\n")
+
+    output = tempfile.NamedTemporaryFile(suffix=".mp4", delete=False)
+    output.close()
+    try:
+        subprocess.run(
+            [get_ffmpeg_exe(), "-y", "-loglevel", "error", "-f", "concat", "-safe", "0", "-i", list_path,
+             "-c", "copy", "-movflags", "+faststart", output.name],
+            check=True, capture_output=True
+        )
+    except BaseException:
+        remove_file(output.name)
+        raise
+    finally:
+        remove_file(list_path)
+        for path in paths:
+            remove_file(path)
+    return output.name
+
+
+def _discard_output(future):
+    """Done-callback for abandoned segments: deletes the segment video they wrote."""
+    if not future.cancelled() and future.exception() is None:
+        remove_file(future.result()["video_path"])
+
+
+def _abandon_segments(futures: List[Any], cancel_flag: str):
+    """
+    Cancels segments not started yet and flags running ones to stop; the
+    flag file is removed once every segment has ended.
+    """
+    with open(cancel_flag, "w"):
+        pass
+    remaining = [len(futures)]
+    remaining_lock = threading.Lock()
+
+    def segment_ended(future):
+        _discard_output(future)
+        with remaining_lock:
+            remaining[0] -= 1
+            last = remaining[0] == 0
+        if last:
+            remove_file(cancel_flag)
+
+    for future in futures:
+        future.cancel()
+        future.add_done_callback(segment_ended)
+
+
+def merge_segments(results: List[Dict[str, Any]], segments: List[Tuple[int, Optional[int]]],
+                   duration: float, target_fps: float, wall_s: float) -> Dict[str, Any]:
+    """Combines per-segment process_full_video results (in order) into one."""
+    from video_processor import fill_timeline_gaps, summarize_timeline
+
+    # Later segments overwrite a boundary second, as later samples do in a single pass
+    timeline: Dict[int, Dict[str, Any]] = {}
+    for result in results:
+        for entry in result["timeline"]:
+            timeline[entry["time"]] = entry
+    timeline_list = [timeline[s] for s in sorted(timeline)]
+    if results[0].get("adaptive"):
+        # Gaps can also straddle a boundary
+        timeline_list = fill_timeline_gaps(timeline_list)
+
+    sampling = dict(results[0]["sampling"])
+    for key in ("decoded", "grabbed", "seeks", "dense"):
+        sampling[key] = sum(r["sampling"][key] for r in results)
+
+    return {
+        "video_path": concat_videos([r["video_path"] for r in results]),
+        "video_mime": "video/mp4",
+        "duration": round(duration, 1),
+        "fps": target_fps,
+        "total_seconds": len(timeline_list),
+        "processed_frames": sum(r["processed_frames"] for r in results),
+        "timeline": timeline_list,
+        "summary": summarize_timeline(timeline_list),
+        "pipeline": {
+            "wall_s": round(wall_s, 3),
+            "segments": [
+                {
+                    "start_frame": start,
+                    "end_frame": end,
+                    "processed_frames": r["processed_frames"],
+                    "wall_s": r["pipeline"]["wall_s"],
+                    "bottleneck": r["pipeline"]["bottleneck"]
+                }
+                for (start, end), r in zip(segments, results)
+            ]
+        },
+        "sampling": sampling,
+        "tracking": merge_tracking_stats([r["tracking"] for r in results]),
+        "adaptive": merge_adaptive_stats([r["adaptive"] for r in results])
+    }
+
+
+def merge_tracking_stats(stats: List[Optional[Dict[str, Any]]]) -> Optional[Dict[str, Any]]:
+    """Sums per-segment tracker counters (None when tracking was off)."""
+    if not stats or stats[0] is None:
+        return None
+    merged = dict(stats[0])
+    for key in ("frames", "detections", "redetections", "tracks"):
+        merged[key] = sum(s[key] for s in stats)
+    merged["detection_ratio"] = round(merged["detections"] / merged["frames"], 3) if merged["frames"] else 0.0
+    return merged
+
+
+def merge_adaptive_stats(stats: List[Optional[Dict[str, Any]]]) -> Optional[Dict[str, Any]]:
+    """Sums per-segment adaptive sampling counters (None when adaptive sampling was off)."""
+    if not stats or stats[0] is None:
+        return None
+    merged = {key: sum(s[key] for s in stats)
+              for key in ("probed", "analyzed", "bursts", "decoded", "fixed_rate_decodes", "fixed_rate_inferences",
+                          "inferences_saved")}
+    fixed = merged["fixed_rate_inferences"]
+    merged["saved_pct"] = round(100.0 * merged["inferences_saved"] / fixed, 1) if fixed else 0.0
+    return merged
+
+
+def process_video_segments(video_path: str, target_fps: float, workers: int,
+                           progress_callback: Optional[Callable[[int, int], None]] = None,
+                           batch_size: int = 8, sampling: Optional[str] = None,
+                           tracking: Optional[bool] = None,
+                           adaptive: Optional[bool] = None) -> Optional[Dict[str, Any]]:
+    """
+    Analyzes a video as parallel segments; returns a process_full_video-style
+    result, or None if the video is too short or cannot seek (pipes).
+    """
+    if not os.path.isfile(video_path):
+        return None
+
+    cap = cv2.VideoCapture(video_path)
+    fps = cap.get(cv2.CAP_PROP_FPS)
+    total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    cap.release()
+    if not fps or fps <= 0 or total_frames <= 0:
+        return None
+
+    segments = plan_segments(total_frames, fps, workers)
+    if not segments:
+        return None
+
+    logger.info(f"Analyzing {video_path} as {len(segments)} segments")
+    started = time.perf_counter()
+    pool = get_segment_pool(workers)
+    # Created only to abandon the call, see _abandon_segments
+    cancel_flag = os.path.join(tempfile.gettempdir(), f"medivision_segments_{uuid.uuid4().hex}.cancel")
+    futures = [
+        pool.submit(_process_segment, video_path, target_fps, start, end, batch_size, sampling, tracking,
+                    i * TRACK_IDS_PER_SEGMENT + 1, adaptive, cancel_flag)
+        for i, (start, end) in enumerate(segments)
+    ]
+    results: List[Optional[Dict[str, Any]]] = [None] * len(futures)
+
+    try:
+        frames_done = 0
+        for future in as_completed(futures):
+            i = futures.index(future)
+            results[i] = future.result()
+            start, end = segments[i]
+            frames_done += (end if end is not None else total_frames) - start
+            if progress_callback is not None:
+                progress_callback(min(frames_done, total_frames), total_frames)
+    except BaseException as e:
+        _abandon_segments(futures, cancel_flag)
+        if isinstance(e, BrokenProcessPool):
+            shutdown_segment_pool(wait=False)
+        raise
+
+    return merge_segments(results, segments, total_frames / fps, target_fps, time.perf_counter() - started)
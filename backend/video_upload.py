@@ -0,0 +1,229 @@
+# Copyright (c) 2025 ot6_j. All Rights Reserved.
+
+"""
+Video Upload Ingest - Streams uploaded videos to disk in fixed-size chunks
+instead of reading them into memory, validates the container from the first
+bytes and enforces a size cap. Partial files are removed on failure; the
+endpoints delete the saved file once processing ends, successful or not.
+
+Streamable containers (MPEG-TS, Matroska/WebM, fast-start MP4) can also be
+ingested through a named pipe: OpenCV/FFmpeg decodes frames from the pipe
+while the rest of the upload is still arriving. Named pipes need POSIX
+(os.mkfifo, fcntl); elsewhere PIPE_INGEST_SUPPORTED is False and uploads
+are spooled to disk.
+
+Configuration (environment):
+    VIDEO_UPLOAD_MAX_BYTES=4294967296
+    VIDEO_UPLOAD_CHUNK_BYTES=1048576
+    VIDEO_UPLOAD_DIR=<tmp>
+    VIDEO_PIPE_OPEN_TIMEOUT_S=30      # wait for the decoder to open the pipe
+"""
+
+import asyncio
+import errno
+import logging
+import os
+import shutil
+import struct
+import tempfile
+from typing import AsyncIterator, Optional
+
+from executors import run_in_department
+
+logger = logging.getLogger(__name__)
+
+VIDEO_UPLOAD_MAX_BYTES = int(os.environ.get("VIDEO_UPLOAD_MAX_BYTES", str(4 * 1024 * 1024 * 1024)))
+VIDEO_UPLOAD_CHUNK_BYTES = int(os.environ.get("VIDEO_UPLOAD_CHUNK_BYTES", str(1024 * 1024)))
+VIDEO_UPLOAD_DIR = os.environ.get("VIDEO_UPLOAD_DIR") or tempfile.gettempdir()
+VIDEO_PIPE_OPEN_TIMEOUT_S = float(os.environ.get("VIDEO_PIPE_OPEN_TIMEOUT_S", "30"))
+
+# Bytes buffered before the container is identified
+HEAD_BYTES = 64 * 1024
+
+STREAMABLE_CONTAINERS = (".ts", ".mkv", ".webm", ".mpg")
+
+PIPE_INGEST_SUPPORTED = hasattr(os, "mkfifo")
+
+
+class VideoTooLargeError(ValueError):
+    """Raised when an upload exceeds VIDEO_UPLOAD_MAX_BYTES."""
+
+
+class UnsupportedVideoError(ValueError):
+    """Raised when the first bytes are not a known video container."""
+
+
+class PipeOpenTimeoutError(TimeoutError):
+    """Raised when no decoder opened the ingest pipe within VIDEO_PIPE_OPEN_TIMEOUT_S."""
+
+
+def sniff_container(head: bytes) -> Optional[str]:
+    """Identifies the container from its magic bytes; returns a file extension."""
+    if len(head) >= 12 and head[4:8] in (b"ftyp", b"moov", b"mdat", b"free", b"wide", b"skip"):
+        return ".mov" if head[8:10] == b"qt" else ".mp4"
+    if head[:4] == b"\x1a\x45\xdf\xa3":
+        return ".webm" if b"webm" in head[:64] else ".mkv"
+    if head[:4] == b"RIFF" and head[8:12] == b"AVI ":
+        return ".avi"
+    if len(head) > 188 and head[0] == 0x47 and head[188] == 0x47:
+        return ".ts"
+    if head[:4] == b"\x00\x00\x01\xba":
+        return ".mpg"
+    return None
+
+
+def is_fast_start(head: bytes) -> bool:
+    """True if an MP4's index (moov) precedes its media data, so it decodes front to back."""
+    offset = 0
+    while offset + 8 <= len(head):
+        size, kind = struct.unpack(">I4s", head[offset:offset + 8])
+        if kind == b"moov":
+            return True
+        if kind == b"mdat":
+            return False
+        if size == 1 and offset + 16 <= len(head):
+            size = struct.unpack(">Q", head[offset + 8:offset + 16])[0]
+        if size < 8:
+            return False
+        offset += size
+    return False
+
+
+def is_streamable(head: bytes) -> bool:
+    """True if the container can be decoded from a non-seekable pipe."""
+    container = sniff_container(head)
+    return container in STREAMABLE_CONTAINERS or (container in (".mp4", ".mov") and is_fast_start(head))
+
+
+async def iter_upload(upload, chunk_size: int = VIDEO_UPLOAD_CHUNK_BYTES) -> AsyncIterator[bytes]:
+    """Yields an UploadFile in chunks."""
+    while True:
+        chunk = await upload.read(chunk_size)
+        if not chunk:
+            break
+        yield chunk
+
+
+async def read_head(chunks: AsyncIterator[bytes]) -> bytes:
+    """Buffers the first HEAD_BYTES (or the whole stream if shorter) and validates the container."""
+    head = b""
+    async for chunk in chunks:
+        head += chunk
+        if len(head) >= HEAD_BYTES:
+            break
+    if sniff_container(head) is None:
+        raise UnsupportedVideoError("Unsupported or corrupt video container")
+    return head
+
+
+async def save_video(chunks: AsyncIterator[bytes], head: Optional[bytes] = None,
+                     max_bytes: int = VIDEO_UPLOAD_MAX_BYTES) -> str:
+    """
+    Streams an upload to a temp file and returns its path.
+    The caller owns the file; it is removed here only if saving fails.
+    """
+    if head is None:
+        head = await read_head(chunks)
+
+    fd, path = tempfile.mkstemp(suffix=sniff_container(head), dir=VIDEO_UPLOAD_DIR)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            written = len(head)
+            await run_in_department("io", f.write, head)
+            async for chunk in chunks:
+                written += len(chunk)
+                if written > max_bytes:
+                    raise VideoTooLargeError(f"Video exceeds {max_bytes // (1024 * 1024)} MB")
+                await run_in_department("io", f.write, chunk)
+        logger.info(f"Video upload saved: {path} ({written / 1e6:.1f} MB)")
+        return path
+    except BaseException:
+        remove_file(path)
+        raise
+
+
+def remove_file(path: Optional[str]):
+    """Deletes a temp file if it still exists."""
+    if path and os.path.exists(path):
+        try:
+            os.unlink(path)
+        except OSError as e:
+            logger.warning(f"Could not remove {path}: {e}")
+
+
+class PipeIngest:
+    """
+    Writes an upload into a named pipe that a decoder opens like a file.
+    Usage: start feed() as a task, run the decoder on `path`, then await the task.
+    """
+
+    def __init__(self, head: bytes, chunks: AsyncIterator[bytes], max_bytes: int = VIDEO_UPLOAD_MAX_BYTES):
+        self.head = head
+        self.chunks = chunks
+        self.max_bytes = max_bytes
+        self.bytes_written = 0
+        self.directory = tempfile.mkdtemp(prefix="medivision_ingest_", dir=VIDEO_UPLOAD_DIR)
+        self.path = os.path.join(self.directory, "video" + (sniff_container(head) or ".ts"))
+        os.mkfifo(self.path)
+
+    def _abandon(self):
+        """
+        Makes the pipe unusable for a decoder that opens it late: holding both
+        ends releases a reader blocked in open(), unlinking stops new ones,
+        and closing gives the ones that got in an immediate end-of-stream.
+        """
+        fd = os.open(self.path, os.O_RDWR | os.O_NONBLOCK)
+        os.unlink(self.path)
+        os.close(fd)
+
+    async def _open_writer(self) -> int:
+        """Waits (without blocking a thread) until the decoder opens the read end."""
+        import fcntl
+
+        deadline = asyncio.get_running_loop().time() + VIDEO_PIPE_OPEN_TIMEOUT_S
+        while True:
+            try:
+                fd = os.open(self.path, os.O_WRONLY | os.O_NONBLOCK)
+                break
+            except OSError as e:
+                if e.errno != errno.ENXIO:
+                    raise
+                if asyncio.get_running_loop().time() > deadline:
+                    # Otherwise the decoder, once it gets a thread, would wait for a writer forever
+                    self._abandon()
+                    raise PipeOpenTimeoutError(
+                        f"Video decoder did not start within {VIDEO_PIPE_OPEN_TIMEOUT_S:.0f}s (server busy)"
+                    )
+                await asyncio.sleep(0.05)
+        # Back to blocking writes so a slow decoder applies backpressure
+        fcntl.fcntl(fd, fcntl.F_SETFL, fcntl.fcntl(fd, fcntl.F_GETFL) & ~os.O_NONBLOCK)
+        return fd
+
+    @staticmethod
+    def _write_all(fd: int, data: bytes):
+        view = memoryview(data)
+        while view:
+            view = view[os.write(fd, view):]
+
+    async def feed(self):
+        """Copies the upload into the pipe; closing it signals end-of-stream to the decoder."""
+        fd = await self._open_writer()
+        try:
+            await run_in_department("io", self._write_all, fd, self.head)
+            self.bytes_written = len(self.head)
+            async for chunk in self.chunks:
+                self.bytes_written += len(chunk)
+                if self.bytes_written > self.max_bytes:
+                    raise VideoTooLargeError(f"Video exceeds {self.max_bytes // (1024 * 1024)} MB")
+                await run_in_department("io", self._write_all, fd, chunk)
+        except BrokenPipeError:
+            # Decoder stopped reading (finished or failed); its own result reports why
+            logger.info(f"Pipe ingest closed by decoder after {self.bytes_written / 1e6:.1f} MB")
+        finally:
+            os.close(fd)
+
+    def cleanup(self):
+        """Removes the pipe and its directory, releasing a decoder still waiting to open it."""
+        if os.path.exists(self.path):
+            self._abandon()
+        shutil.rmtree(self.directory, ignore_errors=True)
@@ -0,0 +1,205 @@
+# Copyright (c) 2025 ot6_j. All Rights Reserved.
+
+"""
+Model Preloading & Warm-up - Loads the configured models at startup and runs
+one dummy forward pass through each so graphs and kernels are built before
+the first patient scan. Tracks per-model load/warm-up time for /ready, which
+stays not ready while a preloaded model is loading, warming up or failed.
+Missing models ("unavailable") are listed but do not block readiness, since
+the endpoints serve their fallbacks, unless READY_REQUIRE_ALL=1.
+
+Configuration (environment):
+    PRELOAD_MODELS=neuro,derma,clip,ocr,surgery   # empty string disables preloading
+    WARMUP_ENABLED=1
+    READY_REQUIRE_ALL=0                            # 1 = unavailable models also keep /ready at 503
+"""
+
+import logging
+import os
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from metrics import Gauge, register
+from model_loader import get_model_variants
+
+logger = logging.getLogger(__name__)
+
+PRELOAD_MODELS = [
+    name.strip() for name in
+    os.environ.get("PRELOAD_MODELS", "neuro,derma,clip,ocr,surgery").split(",")
+    if name.strip()
+]
+WARMUP_ENABLED = os.environ.get("WARMUP_ENABLED", "1") != "0"
+READY_REQUIRE_ALL = os.environ.get("READY_REQUIRE_ALL", "0") == "1"
+
+
+def _load_neuro():
+    from model_loader import get_neuro_model
+    return get_neuro_model()
+
+
+def _warm_neuro(model):
+    model.predict(np.zeros((1, 224, 224, 3), dtype=np.float32), verbose=0)
+
+
+def _load_derma():
+    from model_loader import get_derma_model
+    return get_derma_model()
+
+
+def _warm_derma(model):
+    model.predict(np.zeros((1, 224, 224, 3), dtype=np.float32), verbose=0)
+
+
+def _load_clip():
+    from derma_universal import get_clip_classifier
+    return get_clip_classifier()
+
+
+def _warm_clip(classifier):
+    from PIL import Image
+    classifier(Image.new("RGB", (224, 224)), candidate_labels=["healthy skin", "skin rash or eczema"])
+
+
+def _load_ocr():
+    from pharma_scraper import get_ocr_reader
+    return get_ocr_reader()
+
+
+def _warm_ocr(reader):
+    reader.readtext(np.zeros((64, 256), dtype=np.uint8), detail=0)
+
+
+def _load_surgery():
+    from frame_analytics import get_blood_lut
+    from model_loader import get_surgery_detector
+    # Built with the weights (about 0.5 s), so pre-forked workers inherit the table
+    get_blood_lut()
+    return get_surgery_detector()
+
+
+def _warm_surgery(model):
+    model.predict(np.zeros((640, 640, 3), dtype=np.uint8), verbose=False)
+
+
+# name -> (loader, warm-up forward pass)
+MODEL_REGISTRY: Dict[str, Tuple[Callable[[], Any], Callable[[Any], None]]] = {
+    "neuro": (_load_neuro, _warm_neuro),
+    "derma": (_load_derma, _warm_derma),
+    "clip": (_load_clip, _warm_clip),
+    "ocr": (_load_ocr, _warm_ocr),
+    "surgery": (_load_surgery, _warm_surgery),
+}
+
+_model_status: Dict[str, Dict[str, Any]] = {}
+_preload_started: Optional[float] = None
+_preload_finished: Optional[float] = None
+
+
+def preload_model(name: str, warm_up: Optional[bool] = None) -> Dict[str, Any]:
+    """Loads and (unless disabled) warms up a single model, recording timings."""
+    if warm_up is None:
+        warm_up = WARMUP_ENABLED
+
+    status = {"state": "loading", "load_s": None, "warmup_s": None, "error": None}
+    _model_status[name] = status
+
+    if name not in MODEL_REGISTRY:
+        status.update(state="failed", error=f"Unknown model '{name}'")
+        logger.warning(f"Preload: unknown model '{name}'")
+        return status
+
+    loader, warm = MODEL_REGISTRY[name]
+
+    try:
+        start = time.perf_counter()
+        model = loader()
+        status["load_s"] = round(time.perf_counter() - start, 3)
+
+        if model is None:
+            # Endpoints fall back to mock/co-pilot responses for missing models
+            status["state"] = "unavailable"
+            logger.warning(f"Preload: {name} unavailable")
+            return status
+
+        if warm_up:
+            status["state"] = "warming"
+            start = time.perf_counter()
+            warm(model)
+            status["warmup_s"] = round(time.perf_counter() - start, 3)
+
+        status["state"] = "ready"
+        logger.info(f"Preload: {name} ready (load {status['load_s']}s, warm-up {status['warmup_s']}s)")
+
+    except Exception as e:
+        status.update(state="failed", error=str(e))
+        logger.error(f"Preload: {name} failed: {e}")
+
+    return status
+
+
+def preload_models(warm_up: Optional[bool] = None, names: Optional[List[str]] = None):
+    """Loads and warms up every model listed in PRELOAD_MODELS (or the given subset)."""
+    global _preload_started, _preload_finished
+    names = PRELOAD_MODELS if names is None else names
+    _preload_started = time.time()
+    _preload_finished = None
+
+    for name in names:
+        _model_status[name] = {"state": "pending", "load_s": None, "warmup_s": None, "error": None}
+
+    for name in names:
+        preload_model(name, warm_up)
+
+    _preload_finished = time.time()
+    logger.info(f"Preload finished in {_preload_finished - _preload_started:.1f}s")
+
+
+def get_unready_models() -> List[str]:
+    """Preloaded models whose last load did not end ready (including unavailable ones)."""
+    return [name for name, status in _model_status.items() if status["state"] != "ready"]
+
+
+def get_blocking_models() -> List[str]:
+    """Unready models that keep /ready at 503: unavailable ones only with READY_REQUIRE_ALL."""
+    return [
+        name for name, status in _model_status.items()
+        if status["state"] != "ready" and (READY_REQUIRE_ALL or status["state"] != "unavailable")
+    ]
+
+
+def is_ready() -> bool:
+    """True once the startup preload phase has completed with no model loading or failed."""
+    return not PRELOAD_MODELS or (_preload_finished is not None and not get_blocking_models())
+
+
+def get_readiness() -> Dict[str, Any]:
+    """Returns readiness and per-model load/warm-up status."""
+    return {
+        "ready": is_ready(),
+        "not_ready": get_unready_models(),
+        "warmup_enabled": WARMUP_ENABLED,
+        "preload_seconds": round(_preload_finished - _preload_started, 3) if _preload_finished else None,
+        "models": dict(_model_status),
+        "variants": get_model_variants()
+    }
+
+
+def _model_gauge(field: str) -> Dict[Tuple[str, ...], float]:
+    return {(name,): status[field] for name, status in _model_status.items() if status.get(field) is not None}
+
+
+register(Gauge(
+    "medivision_model_load_seconds", "Time taken to load each model at startup.",
+    ("model",), callback=lambda: _model_gauge("load_s")
+))
+register(Gauge(
+    "medivision_model_warmup_seconds", "Time taken by each model's warm-up forward pass.",
+    ("model",), callback=lambda: _model_gauge("warmup_s")
+))
+register(Gauge(
+    "medivision_model_ready", "1 if the model is loaded and warmed up.",
+    ("model",), callback=lambda: {(name,): int(status["state"] == "ready") for name, status in _model_status.items()}
+))